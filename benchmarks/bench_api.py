@@ -0,0 +1,269 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Measures Tabularium API throughput and latency. tabularium/apiserver.py (or asgiserver.py) runs in a child
+process against stand-ins: the sqlite MySQLManager, a fake Galea and a fake plugin service, run in another
+child process. Catalog read, CRUD and /run workloads are driven over HTTP at each concurrency for a fixed
+duration, reporting req/s, p50/p95/p99 latency and DB statements per request.
+
+Usage:
+    python benchmarks/bench_api.py [--workloads catalog,crud,run] [--concurrency 1,8,32] [--duration 10]
+                                   [--plugins 1000] [--parameters 5] [--db-latency-ms 0.5] [--galea-latency-ms 5]
+                                   [--plugin-latency-ms 20] [--server wsgi|asgi] [--output results.json]
+                                   [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+from standins import StandInMySQLManager, seed_catalog, start_galea, start_plugins
+from httpbench import Client, summarize, get_free_port, wait_ready, get_commit
+
+
+workloads = ("catalog", "crud", "run")
+
+
+def run_catalog(client: Client, rng: random.Random, worker: int, iteration: int, plugins: int):
+    """
+    Full listing, a page of projected plugins and a single plugin read.
+    """
+    client.request("list", "GET", "/plugins")
+    client.request("page", "GET", f"/plugins?limit=100&cursor={rng.randrange(plugins)}&fields=id,name,version")
+    client.request("read", "GET", f"/plugins/{rng.randrange(plugins) + 1}")
+
+
+def run_crud(client: Client, rng: random.Random, worker: int, iteration: int, plugins: int):
+    """
+    Creates a plugin, finds its id by name, reads, updates and deletes it.
+    """
+    plugin_dict = {"plugin": {"name": f"bench-{worker}-{iteration}",
+                              "repo_url": "https://charts.example.com",
+                              "version": "1.0.0",
+                              "parameters": [{"parameter": {"parameter_key": "threshold", "parameter_type": "float",
+                                                            "default_value": "0.5", "is_mandatory": 0, "is_read_only": 0}}]}}
+    client.request("create", "POST", "/plugins", json=plugin_dict)
+    response = client.request("find", "GET", f"/plugins?name_prefix={plugin_dict['plugin']['name']}&version=1.0.0&fields=id")
+    if response is None or response.status_code != 200 or not response.json()["plugins"]:
+        return
+    plugin_id = response.json()["plugins"][0]["plugin"]["id"]
+    client.request("read", "GET", f"/plugins/{plugin_id}")
+    plugin_dict["plugin"].update(id=plugin_id, version="1.0.1")
+    client.request("update", "PUT", f"/plugins/{plugin_id}", json=plugin_dict)
+    client.request("delete", "DELETE", f"/plugins/{plugin_id}")
+
+
+def run_run(client: Client, rng: random.Random, worker: int, iteration: int, plugins: int):
+    """
+    Runs a prompt against a random plugin.
+    """
+    client.request("run", "POST", "/run", json={"test": {"plugin": f"plugin-{rng.randrange(plugins)}",
+                                                         "prompt": f"prompt {rng.randrange(1000)}",
+                                                         "parameters": {}}})
+
+
+workload_functions = {"catalog": run_catalog, "crud": run_crud, "run": run_run}
+
+
+def measure(base_url: str, workload: str, concurrency: int, duration: float, plugins: int) -> dict:
+    """
+    Runs workload from concurrency workers for duration seconds and summarizes it, overall and per operation.
+    """
+    clients = [Client(base_url=base_url) for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    def work(worker: int):
+        rng = random.Random(worker)
+        iteration = 0
+        while time.perf_counter() < deadline:
+            workload_functions[workload](client=clients[worker], rng=rng, worker=worker, iteration=iteration, plugins=plugins)
+            iteration += 1
+
+    requests.get(f"{base_url}/bench/queries")
+    start = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    queries = requests.get(f"{base_url}/bench/queries").json()["queries"]
+
+    operations = sorted({operation for client in clients for operation in client.latencies})
+    operations_dict = {operation: summarize(latencies=[latency for client in clients for latency in client.latencies[operation]],
+                                            errors=sum(client.errors[operation] for client in clients),
+                                            seconds=seconds)
+                       for operation in operations}
+    result_dict = summarize(latencies=[latency for client in clients for latencies in client.latencies.values() for latency in latencies],
+                            errors=sum(sum(client.errors.values()) for client in clients),
+                            seconds=seconds)
+    result_dict.update(workload=workload,
+                       concurrency=concurrency,
+                       seconds=seconds,
+                       queries=queries,
+                       queries_per_request=queries / result_dict["requests"] if result_dict["requests"] else None,
+                       operations=operations_dict)
+    return result_dict
+
+
+def serve_stand_ins(args):
+    """
+    Child process: serves the fake Galea and plugin service, printing their urls on the first line.
+    """
+    print(json.dumps({"galea_url": start_galea(latency=args.galea_latency_ms / 1000, install_latency=args.install_latency_ms / 1000),
+                      "plugin_url": start_plugins(latency=args.plugin_latency_ms / 1000)}), flush=True)
+    threading.Event().wait()
+
+
+def serve_api(args):
+    """
+    Child process: serves the Tabularium API on the stand-in database, with a /bench/queries route returning
+    (and resetting) the number of statements run.
+    """
+    standin = StandInMySQLManager(path=args.database, latency=args.db_latency_ms / 1000,
+                                  pool_size=int(os.getenv("MYSQL_POOL_SIZE", "10")))
+    import tabularium
+    tabularium.MySQLManager = lambda app: standin.mysqlmgr
+
+    def read_queries() -> str:
+        return json.dumps({"queries": standin.counter.reset()})
+
+    if args.server == "asgi":
+        import asyncio
+        from hypercorn.config import Config
+        from hypercorn.asyncio import serve
+        import asgiserver
+
+        asgiserver.app.add_url_rule("/bench/queries", "read_queries", read_queries)
+        config = Config()
+        config.bind = [f"127.0.0.1:{args.port}"]
+        config.accesslog = None
+        asyncio.run(serve(asgiserver.app, config))
+    else:
+        import logging
+        import apiserver
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        apiserver.app.add_url_rule("/bench/queries", "read_queries", read_queries)
+        apiserver.app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+def compare(results: list, baseline_path: str):
+    """
+    Prints the req/s and p99 change of every (workload, concurrency) measured in the baseline results file too.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline_dict = json.load(baseline_file)
+    baseline_by_key = {(result["workload"], result["concurrency"]): result for result in baseline_dict["results"]}
+
+    print(f"\nCompared with {baseline_path} ({baseline_dict.get('commit')})")
+    print(f"{'workload':>8} {'conc':>5} {'req/s':>10} {'change':>8} {'p99 ms':>9} {'change':>8}")
+    for result in results:
+        baseline = baseline_by_key.get((result["workload"], result["concurrency"]))
+        if baseline is None or not baseline["requests"] or not result["requests"]:
+            continue
+        throughput_change = result["requests_per_second"] / baseline["requests_per_second"] - 1
+        p99_change = result["latency_ms"]["p99"] / baseline["latency_ms"]["p99"] - 1
+        print(f"{result['workload']:>8} {result['concurrency']:>5} {result['requests_per_second']:>10.1f} {throughput_change:>+8.1%} "
+              f"{result['latency_ms']['p99']:>9.2f} {p99_change:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default=",".join(workloads), help="Comma separated workloads among " + ", ".join(workloads))
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds each workload runs at each concurrency")
+    parser.add_argument("--plugins", type=int, default=1000, help="Catalog size")
+    parser.add_argument("--parameters", type=int, default=5, help="Parameters per plugin")
+    parser.add_argument("--db-latency-ms", type=float, default=0.5, help="Simulated DB round trip per statement")
+    parser.add_argument("--galea-latency-ms", type=float, default=5, help="Fake Galea release read latency")
+    parser.add_argument("--install-latency-ms", type=float, default=50, help="Fake Galea install, upgrade and uninstall latency")
+    parser.add_argument("--plugin-latency-ms", type=float, default=20, help="Fake plugin /run latency")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi", help="apiserver.py (wsgi) or asgiserver.py (asgi)")
+    parser.add_argument("--output", help="Optional JSON results file")
+    parser.add_argument("--compare", help="Optional JSON results file of a previous run to compare with")
+    parser.add_argument("--role", choices=("bench", "stand-ins", "api"), default="bench", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "stand-ins":
+        return serve_stand_ins(args)
+    if args.role == "api":
+        return serve_api(args)
+
+    results = []
+    processes = []
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            database = os.path.join(directory, "catalog.db")
+            StandInMySQLManager(path=database)
+            seed_catalog(path=database, plugins=args.plugins, parameters_per_plugin=args.parameters)
+
+            child_arguments = sys.argv[1:]
+            stand_ins = subprocess.Popen([sys.executable, __file__, *child_arguments, "--role", "stand-ins"],
+                                         stdout=subprocess.PIPE, text=True)
+            processes.append(stand_ins)
+            urls = json.loads(stand_ins.stdout.readline())
+
+            port = get_free_port()
+            environment = dict(os.environ, GALEA_URL=urls["galea_url"], MARATHON_PLUGIN_URL=urls["plugin_url"])
+            # The change log poller would add its own statements to the counts
+            environment.setdefault("CATALOG_POLL_INTERVAL", "0")
+            processes.append(subprocess.Popen([sys.executable, __file__, *child_arguments, "--role", "api",
+                                               "--database", database, "--port", str(port)],
+                                              env=environment, stdout=subprocess.DEVNULL))
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(url=f"{base_url}/ready")
+
+            print(f"{'workload':>8} {'conc':>5} {'requests':>9} {'errors':>7} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} "
+                  f"{'p99 ms':>9} {'queries/req':>12}")
+            for workload in args.workloads.split(","):
+                for concurrency in [int(concurrency) for concurrency in args.concurrency.split(",")]:
+                    result_dict = measure(base_url=base_url, workload=workload, concurrency=concurrency,
+                                          duration=args.duration, plugins=args.plugins)
+                    results.append(result_dict)
+                    latency = result_dict["latency_ms"]
+                    print(f"{workload:>8} {concurrency:>5} {result_dict['requests']:>9} {result_dict['errors']:>7} "
+                          f"{result_dict['requests_per_second']:>10.1f} {latency['p50']:>9.2f} {latency['p95']:>9.2f} "
+                          f"{latency['p99']:>9.2f} {result_dict['queries_per_request']:>12.2f}")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"benchmark": "api",
+                       "commit": get_commit(),
+                       "config": {key: value for key, value in vars(args).items()
+                                  if key not in ("output", "compare", "role", "database", "port")},
+                       "results": results}, output_file, indent=4)
+    if args.compare:
+        compare(results=results, baseline_path=args.compare)
+
+
+if __name__ == "__main__":
+    main()
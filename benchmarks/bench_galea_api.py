@@ -0,0 +1,228 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""
+Measures Galea API throughput and release refresh latency as the number of releases grows.
+galea/apiserver.py runs in a child process on the simulated Helm client, pre-populated with each
+release count in turn. Workers create, list, read, upgrade and uninstall their own releases over
+HTTP at each concurrency for a fixed duration, while the release cache is refreshed in a loop.
+Reports ops/s, p50/p95/p99 latency per operation and refresh latency, idle and under load.
+
+Usage:
+    python benchmarks/bench_galea_api.py [--sizes 10,100,1000] [--concurrency 1,8,32] [--duration 10]
+                                         [--pull-ms 50] [--install-ms 200] [--uninstall-ms 100]
+                                         [--list-ms 20] [--history-ms 5] [--failure-rate 0]
+                                         [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+from httpbench import Client, percentile, summarize, get_free_port, wait_ready, get_commit
+
+
+mutations = ("create", "update", "delete")
+
+
+def run_releases(client: Client, prefix: str, iteration: int):
+    """
+    Installs a release, lists releases, reads it from helm, upgrades and uninstalls it.
+    """
+    release_name = f"{prefix}-{iteration}"
+    release_dict = {"release": {"name": release_name, "repo_url": "https://charts.example.com", "version": "1.0.0"}}
+    client.request("create", "POST", "/releases", json=release_dict)
+    client.request("list", "GET", "/releases")
+    client.request("read", "GET", f"/releases/{release_name}?fresh=1")
+    release_dict["release"]["version"] = "1.0.1"
+    client.request("update", "PUT", f"/releases/{release_name}", json=release_dict)
+    client.request("delete", "DELETE", f"/releases/{release_name}")
+
+
+def refresh(base_url: str) -> float:
+    """
+    Re-lists every release into the cache and returns the seconds it took.
+    """
+    return requests.post(f"{base_url}/bench/refresh").json()["seconds"]
+
+
+def summarize_refreshes(seconds_list: list) -> dict:
+    seconds_list = sorted(seconds_list)
+    return  {
+                "samples": len(seconds_list),
+                "p50": percentile(seconds_list, 0.50),
+                "max": seconds_list[-1] * 1000 if seconds_list else None
+            }
+
+
+def measure(base_url: str, size: int, concurrency: int, duration: float, refreshes: int) -> dict:
+    """
+    Runs the release workload from concurrency workers for duration seconds while refreshing the cache in a loop,
+    and summarizes it, overall and per operation.
+    """
+    idle_refreshes = [refresh(base_url=base_url) for _ in range(refreshes)]
+
+    clients = [Client(base_url=base_url) for _ in range(concurrency)]
+    loaded_refreshes = []
+    deadline = time.perf_counter() + duration
+
+    def work(worker: int):
+        iteration = 0
+        while time.perf_counter() < deadline:
+            run_releases(client=clients[worker], prefix=f"bench-{size}-{concurrency}-{worker}", iteration=iteration)
+            iteration += 1
+
+    def refresh_loop():
+        while time.perf_counter() < deadline:
+            loaded_refreshes.append(refresh(base_url=base_url))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(concurrency)]
+    threads.append(threading.Thread(target=refresh_loop))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    operations = sorted({operation for client in clients for operation in client.latencies})
+    operations_dict = {operation: summarize(latencies=[latency for client in clients for latency in client.latencies[operation]],
+                                            errors=sum(client.errors[operation] for client in clients),
+                                            seconds=seconds)
+                       for operation in operations}
+    result_dict = summarize(latencies=[latency for client in clients for latencies in client.latencies.values() for latency in latencies],
+                            errors=sum(sum(client.errors.values()) for client in clients),
+                            seconds=seconds)
+    result_dict.update(size=size,
+                       concurrency=concurrency,
+                       seconds=seconds,
+                       mutations_per_second=sum(operations_dict[operation]["requests"] for operation in mutations
+                                                if operation in operations_dict) / seconds,
+                       releases=len(requests.get(f"{base_url}/releases").json()["releases"]),
+                       refresh_ms={"idle": summarize_refreshes(idle_refreshes),
+                                   "loaded": summarize_refreshes(loaded_refreshes)},
+                       operations=operations_dict)
+    return result_dict
+
+
+def serve_api(args):
+    """
+    Child process: serves the Galea API on the simulated Helm client, with a /bench/releases route deploying
+    releases without simulating their installs and a /bench/refresh route timing a full cache refresh.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "galea"))
+    # tracing.py is shared from Tabularium, after Galea's own modules
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabularium"))
+    import logging
+    from flask import request
+    import apiserver
+
+    async def add_releases() -> str:
+        apiserver.galea.client.add_releases(release_names=[f"seed-{index}" for index in range(int(request.args["start"]),
+                                                                                              int(request.args["stop"]))])
+        await apiserver.galea.refresh_releases()
+        return json.dumps({"releases": len(apiserver.galea.get_releases()["releases"])})
+
+    async def time_refresh() -> str:
+        start = time.perf_counter()
+        await apiserver.galea.refresh_releases()
+        return json.dumps({"seconds": time.perf_counter() - start})
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    # Injected failures would each log a traceback, they are counted as errors instead
+    apiserver.app.logger.setLevel(logging.CRITICAL)
+    apiserver.app.add_url_rule("/bench/releases", "add_releases", add_releases, methods=["POST"])
+    apiserver.app.add_url_rule("/bench/refresh", "time_refresh", time_refresh, methods=["POST"])
+    apiserver.app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma separated numbers of deployed releases, in increasing order")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds the workload runs at each size and concurrency")
+    parser.add_argument("--refreshes", type=int, default=5, help="Idle refreshes timed before each workload")
+    parser.add_argument("--pull-ms", type=float, default=50, help="Simulated chart pull latency")
+    parser.add_argument("--install-ms", type=float, default=200, help="Simulated install and upgrade latency")
+    parser.add_argument("--uninstall-ms", type=float, default=100, help="Simulated uninstall latency")
+    parser.add_argument("--list-ms", type=float, default=20, help="Simulated 'helm list' latency")
+    parser.add_argument("--history-ms", type=float, default=5, help="Simulated 'helm history' latency per release")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Probability of a simulated pull, install, upgrade or uninstall failing")
+    parser.add_argument("--output", help="Optional JSON results file")
+    parser.add_argument("--role", choices=("bench", "api"), default="bench", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "api":
+        return serve_api(args)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        port = get_free_port()
+        environment = dict(os.environ,
+                           GALEA_HELM_CLIENT="simulated",
+                           GALEA_SIMULATED_PULL_MS=str(args.pull_ms),
+                           GALEA_SIMULATED_INSTALL_MS=str(args.install_ms),
+                           GALEA_SIMULATED_UNINSTALL_MS=str(args.uninstall_ms),
+                           GALEA_SIMULATED_LIST_MS=str(args.list_ms),
+                           GALEA_SIMULATED_HISTORY_MS=str(args.history_ms),
+                           GALEA_SIMULATED_FAILURE_RATE=str(args.failure_rate),
+                           GALEA_CHART_CACHE_DIR=os.path.join(directory, "charts"))
+        # Refreshes are driven by the benchmark, the background reconciler would add its own
+        environment.setdefault("GALEA_RECONCILE_INTERVAL", "3600")
+        process = subprocess.Popen([sys.executable, __file__, *sys.argv[1:], "--role", "api", "--port", str(port)],
+                                   env=environment, stdout=subprocess.DEVNULL)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_ready(url=f"{base_url}/releases")
+
+            print(f"{'size':>6} {'conc':>5} {'requests':>9} {'errors':>7} {'ops/s':>8} {'mut/s':>8} {'p50 ms':>9} {'p99 ms':>9} "
+                  f"{'refresh idle ms':>16} {'refresh loaded ms':>18}")
+            deployed = 0
+            for size in [int(size) for size in args.sizes.split(",")]:
+                requests.post(f"{base_url}/bench/releases", params={"start": deployed, "stop": size})
+                deployed = max(deployed, size)
+                for concurrency in [int(concurrency) for concurrency in args.concurrency.split(",")]:
+                    result_dict = measure(base_url=base_url, size=size, concurrency=concurrency,
+                                          duration=args.duration, refreshes=args.refreshes)
+                    results.append(result_dict)
+                    latency, refresh_ms = result_dict["latency_ms"], result_dict["refresh_ms"]
+                    print(f"{size:>6} {concurrency:>5} {result_dict['requests']:>9} {result_dict['errors']:>7} "
+                          f"{result_dict['requests_per_second']:>8.1f} {result_dict['mutations_per_second']:>8.1f} "
+                          f"{latency['p50']:>9.2f} {latency['p99']:>9.2f} "
+                          f"{refresh_ms['idle']['p50']:>16.2f} {refresh_ms['loaded']['p50'] or 0:>18.2f}")
+        finally:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"benchmark": "galea_api",
+                       "commit": get_commit(),
+                       "config": {key: value for key, value in vars(args).items() if key not in ("output", "role", "port")},
+                       "results": results}, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Measures Galea.read_releases refresh latency against a fake pyhelm3 client, with revision lookups
+run one at a time (previous behaviour) and concurrently.
+
+Usage:
+    python benchmarks/bench_galea_refresh.py [--sizes 10,100,1000] [--concurrency 10] [--history-ms 20] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "galea"))
+# tracing.py is shared from Tabularium, after Galea's own modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabularium"))
+
+from galea import Galea
+
+
+class FakeRevision():
+    def __init__(self, release, revision: int):
+        self.release = release
+        self.revision = revision
+        self.status = "deployed"
+
+
+class FakeRelease():
+    """
+    Release whose current_revision costs one simulated 'helm history' call.
+    """
+    def __init__(self, name: str, history_latency: float):
+        self.name = name
+        self.namespace = "default"
+        self.history_latency = history_latency
+
+    async def current_revision(self) -> FakeRevision:
+        await asyncio.sleep(self.history_latency)
+        return FakeRevision(release=self, revision=1)
+
+
+class FakeClient():
+    """
+    Stand-in for pyhelm3.Client serving a fixed set of releases.
+    """
+    def __init__(self, releases: int, list_latency: float, history_latency: float):
+        self.releases = [FakeRelease(name=f"plugin-{index}", history_latency=history_latency) for index in range(releases)]
+        self.list_latency = list_latency
+
+    async def list_releases(self, all: bool = False, all_namespaces: bool = False) -> list:
+        await asyncio.sleep(self.list_latency)
+        return self.releases
+
+
+def measure(galea: Galea, concurrency: int) -> float:
+    galea.revision_concurrency = concurrency
+    start = time.perf_counter()
+    releases_dict = asyncio.run(galea.read_releases())
+    elapsed = time.perf_counter() - start
+    assert len(releases_dict["releases"]) == len(galea.client.releases)
+
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma separated release counts")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent revision lookups")
+    parser.add_argument("--list-ms", type=float, default=50, help="Simulated 'helm list' latency")
+    parser.add_argument("--history-ms", type=float, default=20, help="Simulated 'helm history' latency per release")
+    parser.add_argument("--output", help="Optional JSON results file")
+    args = parser.parse_args()
+
+    results = []
+    galea = Galea(client=FakeClient(releases=0, list_latency=0, history_latency=0))
+    print(f"{'releases':>8} {'sequential s':>13} {'concurrent s':>13} {'speedup':>8}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        galea.client = FakeClient(releases=size, list_latency=args.list_ms / 1000, history_latency=args.history_ms / 1000)
+        sequential_time = measure(galea=galea, concurrency=1)
+        concurrent_time = measure(galea=galea, concurrency=args.concurrency)
+
+        results.append({"releases": size,
+                        "concurrency": args.concurrency,
+                        "sequential_seconds": sequential_time,
+                        "concurrent_seconds": concurrent_time})
+        print(f"{size:>8} {sequential_time:>13.3f} {concurrent_time:>13.3f} {sequential_time / concurrent_time:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"benchmark": "galea_refresh", "results": results}, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
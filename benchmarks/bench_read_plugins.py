@@ -0,0 +1,100 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""
+Compares the per-plugin (N+1) catalog read against the joined read used by Tabularium.read_plugins.
+
+Usage:
+    python benchmarks/bench_read_plugins.py [--sizes 10,100,1000,10000] [--parameters 5] [--latency-ms 0.5] [--output results.json]
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from standins import StandInMySQLManager, seed_catalog
+from tabularium import Tabularium
+
+
+def read_plugins_per_plugin(mysqlmgr) -> dict:
+    """
+    Previous read path: one query for the plugins plus one query per plugin for its parameters.
+    """
+    plugins_dict = {"plugins": []}
+    for plugin_tuple in mysqlmgr.read_plugins():
+        parameters = [{"parameter": {"id": parameter_tuple[0],
+                                     "parameter_key": parameter_tuple[2],
+                                     "parameter_type": parameter_tuple[3],
+                                     "default_value": parameter_tuple[4],
+                                     "is_mandatory": parameter_tuple[5],
+                                     "is_read_only": parameter_tuple[6]}}
+                      for parameter_tuple in mysqlmgr.read_parameters(plugin_id=plugin_tuple[0])]
+        plugins_dict["plugins"].append({"plugin": {"id": plugin_tuple[0],
+                                                   "name": plugin_tuple[1],
+                                                   "repo_url": plugin_tuple[2],
+                                                   "version": plugin_tuple[3],
+                                                   "parameters": parameters}})
+    return plugins_dict
+
+
+def measure(standin: StandInMySQLManager, read) -> tuple:
+    standin.counter.reset()
+    start = time.perf_counter()
+    plugins_dict = read()
+    elapsed = time.perf_counter() - start
+
+    return plugins_dict, standin.counter.reset(), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="Comma separated catalog sizes")
+    parser.add_argument("--parameters", type=int, default=5, help="Parameters per plugin")
+    parser.add_argument("--latency-ms", type=float, default=0.5, help="Simulated DB round trip per query")
+    parser.add_argument("--output", help="Optional JSON results file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.db")
+        standin = StandInMySQLManager(path=path, latency=args.latency_ms / 1000)
+        tabularium = Tabularium.__new__(Tabularium)
+        tabularium.mysqlmgr = standin.mysqlmgr
+
+        print(f"{'plugins':>8} {'n+1 queries':>12} {'n+1 s':>9} {'join queries':>13} {'join s':>9} {'speedup':>8}")
+        for size in [int(size) for size in args.sizes.split(",")]:
+            seed_catalog(path=path, plugins=size, parameters_per_plugin=args.parameters)
+
+            legacy_dict, legacy_queries, legacy_time = measure(standin, lambda: read_plugins_per_plugin(standin.mysqlmgr))
+            joined_dict, joined_queries, joined_time = measure(standin, tabularium.read_plugins)
+            assert legacy_dict == joined_dict, "Joined read returned a different catalog"
+
+            results.append({"plugins": size,
+                            "parameters_per_plugin": args.parameters,
+                            "per_plugin": {"queries": legacy_queries, "seconds": legacy_time},
+                            "joined": {"queries": joined_queries, "seconds": joined_time}})
+            print(f"{size:>8} {legacy_queries:>12} {legacy_time:>9.4f} {joined_queries:>13} {joined_time:>9.4f} "
+                  f"{legacy_time / joined_time:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"benchmark": "read_plugins", "results": results}, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
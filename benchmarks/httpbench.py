@@ -0,0 +1,105 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""
+HTTP load helpers shared by the API benchmarks.
+"""
+
+import os
+import time
+import socket
+import subprocess
+from collections import defaultdict
+
+import requests
+
+
+class Client():
+    """
+    HTTP client of one benchmark worker, recording the latency of every request by operation.
+    """
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, operation: str, method: str, path: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method=method, url=f"{self.base_url}{path}", **kwargs)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            response, failed = None, True
+        self.latencies[operation].append(time.perf_counter() - start)
+        if failed:
+            self.errors[operation] += 1
+        return response
+
+
+def percentile(sorted_latencies: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile in milliseconds.
+    """
+    if not sorted_latencies:
+        return None
+    index = min(len(sorted_latencies) - 1, max(0, int(round(fraction * len(sorted_latencies))) - 1))
+    return sorted_latencies[index] * 1000
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    return  {
+                "requests": len(latencies),
+                "errors": errors,
+                "requests_per_second": len(latencies) / seconds,
+                "latency_ms":
+                    {
+                        "p50": percentile(latencies, 0.50),
+                        "p95": percentile(latencies, 0.95),
+                        "p99": percentile(latencies, 0.99)
+                    }
+            }
+
+
+def get_free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float = 60):
+    """
+    Waits until url answers 200.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(url).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,306 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tabularium"))
+
+from mysqlpool import MySQLConnectionPool
+
+
+# Same tables as the mysql-initdb-config ConfigMap in mysql/deploy.yaml
+schema = """
+    CREATE TABLE IF NOT EXISTS plugins (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name VARCHAR(255) NOT NULL,
+      repo_url VARCHAR(255) NOT NULL,
+      version VARCHAR(255) NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS parameters (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      plugin_id INT NOT NULL,
+      parameter_key VARCHAR(255) NOT NULL,
+      parameter_type VARCHAR(255) NOT NULL,
+      default_value VARCHAR(255),
+      is_mandatory BOOL NOT NULL DEFAULT 0,
+      is_read_only BOOL NOT NULL DEFAULT 0,
+      FOREIGN KEY (plugin_id) REFERENCES plugins(id)
+        ON DELETE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS plugin_changes (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      plugin_id INT NOT NULL,
+      changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS plugin_change_prunes (
+      pruned_through BIGINT NOT NULL PRIMARY KEY
+    );
+    CREATE INDEX IF NOT EXISTS parameters_plugin_id ON parameters(plugin_id);
+    CREATE INDEX IF NOT EXISTS plugins_name ON plugins(name);
+"""
+
+# MySQL syntax used by MySQLManager and its sqlite equivalent
+translations = (
+    ("%s", "?"),
+    (" AUTO_INCREMENT", ""),
+    ("NOW() - INTERVAL ? SECOND", "datetime('now', '-' || ? || ' seconds')"),
+)
+
+
+def translate(query: str) -> str:
+    for mysql, sqlite in translations:
+        query = query.replace(mysql, sqlite)
+    return query
+
+
+class QueryCounter():
+    """
+    Counts statements executed against the stand-in database.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def increment(self):
+        with self.lock:
+            self.queries += 1
+
+    def reset(self) -> int:
+        with self.lock:
+            queries = self.queries
+            self.queries = 0
+            return queries
+
+
+class StandInCursor():
+    """
+    pymysql-style cursor over sqlite3, translating '%s' placeholders and the few MySQL specific clauses.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.sqlite.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, query: str, args=None):
+        self.connection.round_trip()
+        if args is None:
+            args = ()
+        elif not isinstance(args, (tuple, list, dict)):
+            args = (args,)
+        return self.cursor.execute(translate(query), args)
+
+    def executemany(self, query: str, args):
+        self.connection.round_trip()
+        return self.cursor.executemany(translate(query), args)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return tuple(self.cursor.fetchall())
+
+
+class StandInConnection():
+    """
+    pymysql-style connection over a shared sqlite3 database file.
+
+    Parameters:
+        path (str): sqlite database path
+        counter (QueryCounter): Statement counter
+        latency (float): Simulated network round trip in seconds added to every statement
+    """
+    def __init__(self, path: str, counter: QueryCounter, latency: float = 0.0):
+        self.sqlite = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.sqlite.execute("PRAGMA foreign_keys=ON")
+        self.counter = counter
+        self.latency = latency
+
+    def round_trip(self):
+        self.counter.increment()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def cursor(self):
+        return StandInCursor(connection=self)
+
+    def begin(self):
+        self.round_trip()
+        self.sqlite.execute("BEGIN")
+
+    def commit(self):
+        if self.sqlite.in_transaction:
+            self.round_trip()
+            self.sqlite.execute("COMMIT")
+
+    def rollback(self):
+        if self.sqlite.in_transaction:
+            self.sqlite.execute("ROLLBACK")
+
+    def ping(self, reconnect: bool = False):
+        pass
+
+    def close(self):
+        self.sqlite.close()
+
+
+class StandInMySQLManager():
+    """
+    Builds a real MySQLManager whose pool hands out sqlite stand-in connections.
+
+    Parameters:
+        path (str): sqlite database path
+        latency (float): Simulated network round trip in seconds per statement
+        pool_size (int): Connection pool size
+    """
+    def __init__(self, path: str, latency: float = 0.0, pool_size: int = 10):
+        from mysqlmgr import MySQLManager
+
+        self.counter = QueryCounter()
+        setup = sqlite3.connect(path)
+        setup.executescript(schema)
+        setup.close()
+
+        self.mysqlmgr = MySQLManager.__new__(MySQLManager)
+        self.mysqlmgr.pool = MySQLConnectionPool(connect=lambda: StandInConnection(path=path,
+                                                                                   counter=self.counter,
+                                                                                   latency=latency),
+                                                 max_size=pool_size)
+
+
+def seed_catalog(path: str, plugins: int, parameters_per_plugin: int):
+    """
+    Fills the stand-in database with a synthetic catalog.
+    """
+    sqlite = sqlite3.connect(path)
+    sqlite.executescript("DELETE FROM parameters; DELETE FROM plugins;")
+    sqlite.executemany("INSERT INTO plugins(id, name, repo_url, version) VALUES(?, ?, ?, ?)",
+                       [(index + 1, f"plugin-{index}", "https://charts.example.com", "1.0.0") for index in range(plugins)])
+    sqlite.executemany("INSERT INTO parameters(plugin_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only) "
+                       "VALUES(?, ?, ?, ?, ?, ?)",
+                       [(index + 1, f"param-{parameter}", "str", "value", 0, 0)
+                        for index in range(plugins) for parameter in range(parameters_per_plugin)])
+    sqlite.commit()
+    sqlite.close()
+
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open many connections at once, the default backlog of 5 would throttle them
+    request_queue_size = 1024
+
+
+def start_server(handler_class) -> StandInHTTPServer:
+    """
+    Serves handler_class on a free local port from a background thread.
+    """
+    server = StandInHTTPServer(("127.0.0.1", 0), handler_class)
+    threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True).start()
+    return server
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle's algorithm would hold the body back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def send_json(self, body, status: int = 200):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_galea(latency: float = 0.0, install_latency: float = 0.0) -> str:
+    """
+    Starts a fake Galea API answering release reads after latency and installs, upgrades and uninstalls
+    after install_latency, and returns its url (GALEA_URL).
+    """
+    releases_by_name = {}
+    lock = threading.Lock()
+
+    class GaleaHandler(StandInHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            with lock:
+                if self.path == "/releases":
+                    return self.send_json({"releases": list(releases_by_name.values())})
+                release_dict = releases_by_name.get(self.path.rsplit("/", 1)[-1])
+            self.send_json(release_dict or {"release": {}}, status=200 if release_dict else 404)
+
+        def do_POST(self):
+            self.do_PUT()
+
+        def do_PUT(self):
+            release = self.read_json()["release"]
+            time.sleep(install_latency)
+            release_dict = {"release": {"name": release["name"], "namespace": "default", "revision": 1, "status": "deployed"}}
+            with lock:
+                releases_by_name[release["name"]] = release_dict
+            self.send_json(release_dict, status=201)
+
+        def do_DELETE(self):
+            time.sleep(install_latency)
+            with lock:
+                releases_by_name.pop(self.path.rsplit("/", 1)[-1], None)
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    server = start_server(handler_class=GaleaHandler)
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def start_plugins(latency: float = 0.0) -> str:
+    """
+    Starts a fake plugin service answering every /<plugin>/run after latency with a JSON output echoing the
+    prompt, and returns the plugin url template (MARATHON_PLUGIN_URL).
+    """
+    class PluginHandler(StandInHandler):
+        def do_POST(self):
+            test = self.read_json()["test"]
+            time.sleep(latency)
+            self.send_json({"output": test["prompt"], "blocked": False})
+
+    server = start_server(handler_class=PluginHandler)
+    return f"http://127.0.0.1:{server.server_port}/{{plugin}}/run"
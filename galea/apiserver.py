@@ -15,11 +15,38 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import json
-from flask import Flask, request, Response
+import asyncio
+from concurrent.futures import Future
+from flask import Flask, request, Response, g
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from galea import Galea
+from scheduler import install, update, delete, superseded
+from metrics import get_route, start_request, finish_request
+from tracing import tracer, is_traced_route
 
 app = Flask(__name__)
 galea = Galea()
+galea.start_reconciler()
+
+
+@app.before_request
+def start_request_telemetry():
+    route = get_route(url_rule=request.url_rule)
+    g.request_metrics = start_request(route=route)
+    g.request_span = None
+    if is_traced_route(route=route):
+        # Continues the trace of Tabularium's GaleaDispacher call from its traceparent header
+        g.request_span = tracer.start_request(name=f"{request.method} {route}", traceparent=request.headers.get("traceparent"))
+
+# After request functions also run for the error response of a failed request
+@app.after_request
+def finish_request_telemetry(response: Response) -> Response:
+    finish_request(request_metrics=g.request_metrics, method=request.method, status=response.status_code)
+    if g.request_span is not None:
+        tracer.finish_request(span=g.request_span, status=response.status_code)
+        response.headers["X-Trace-Id"] = g.request_span.trace.trace_id
+    return response
+
 
 # CREATE
 @app.route("/releases", methods=["POST"])
@@ -27,14 +54,78 @@ async def create_release():
     """
     Installs release.
     """
-    release_dict = await galea.create_release(release_name=request.json["release"]["name"],
-                                              repo_url=request.json["release"]["repo_url"],
-                                              version=request.json["release"]["version"])
+    release_dict = await asyncio.wrap_future(galea.submit(kind=install,
+                                                          release_name=request.json["release"]["name"],
+                                                          repo_url=request.json["release"]["repo_url"],
+                                                          version=request.json["release"]["version"]))
+    # Dropped for a later operation on the release before it ran, which fulfils the request
+    if release_dict.get("status") == superseded:
+        return Response(response=json.dumps(release_dict),
+                        status=200)
     
     return Response(response=json.dumps(release_dict),
                     status=201)
 
 
+def read_batch_item(release) -> tuple:
+    """
+    Returns a batch item's (operation, name, repo_url, version), raising ValueError if it is malformed.
+    """
+    release_item = release.get("release") if isinstance(release, dict) else None
+    if not isinstance(release_item, dict):
+        raise ValueError("Batch item is not a release")
+    name = release_item.get("name")
+    if not isinstance(name, str) or not name:
+        raise ValueError("Release name missing")
+    operation = release_item.get("operation", install)
+    if operation in (install, update) and not release_item.get("repo_url"):
+        raise ValueError(f"Release {name} has no repo_url")
+
+    return operation, name, release_item.get("repo_url"), release_item.get("version")
+
+
+@app.route("/releases:batch", methods=["POST"])
+async def batch_releases():
+    """
+    Installs, upgrades or uninstalls a list of releases in one request.
+    Each item may set "operation" to install (default), update or delete, and reports its own status:
+    succeeded, superseded by a later item on the same release, or failed.
+    """
+    futures = []
+    names = []
+    for release in request.json["releases"]:
+        name = None
+        try:
+            operation, name, repo_url, version = read_batch_item(release=release)
+            future = galea.submit(kind=operation,
+                                  release_name=name,
+                                  repo_url=repo_url,
+                                  version=version)
+        except ValueError as e:
+            future = Future()
+            future.set_exception(e)
+        futures.append(future)
+        names.append(name)
+
+    results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures], return_exceptions=True)
+
+    results_dict =  {
+                        "releases": []
+                    }
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            results_dict["releases"].append({"release": {"name": name},
+                                             "status": "failed",
+                                             "strerr": str(result)})
+        elif result.get("status") == superseded:
+            results_dict["releases"].append(result)
+        else:
+            results_dict["releases"].append(dict(result, status="succeeded"))
+
+    return Response(response=json.dumps(results_dict),
+                    status=200)
+
+
 # READ
 @app.route("/releases", methods=["GET"])
 def get_releases() -> Response:
@@ -48,11 +139,21 @@ def get_releases() -> Response:
 
 
 @app.route("/releases/<string:release>", methods=["GET"])
-def get_release(release: str) -> Response:
+async def get_release(release: str) -> Response:
     """
-    Gets running release.
+    Gets running release from cache, or from helm with '?fresh=1'.
     """
-    pass
+    if request.args.get("fresh", "0").lower() in ("1", "true"):
+        release_dict = await galea.read_release(release_name=release)
+    else:
+        release_dict = galea.get_release(release_name=release)
+
+    if not release_dict["release"]:
+        return Response(response=json.dumps(release_dict),
+                        status=404)
+
+    return Response(response=json.dumps(release_dict),
+                    status=200)
 
 
 # UPDATE
@@ -64,9 +165,14 @@ async def update_release(release: str) -> Response:
     if release != request.json["release"]["name"]:
         return Response(status=418)
     
-    release_dict = await galea.update_release(release_name=request.json["release"]["name"],
-                                              repo_url=request.json["release"]["repo_url"],
-                                              version=request.json["release"]["version"])
+    release_dict = await asyncio.wrap_future(galea.submit(kind=update,
+                                                          release_name=request.json["release"]["name"],
+                                                          repo_url=request.json["release"]["repo_url"],
+                                                          version=request.json["release"]["version"]))
+    # Dropped for a later operation on the release before it ran, which fulfils the request
+    if release_dict.get("status") == superseded:
+        return Response(response=json.dumps(release_dict),
+                        status=200)
 
     return Response(response=json.dumps(release_dict),
                     status=201)
@@ -78,10 +184,81 @@ async def delete_release(release: str) -> Response:
     """
     Uninstalls running release.
     """
-    await galea.delete_release(release_name=release)
+    await asyncio.wrap_future(galea.submit(kind=delete, release_name=release))
 
     return Response(status=204)
 
 
+# METRICS
+@app.route("/metrics", methods=["GET"])
+def get_metrics() -> Response:
+    """
+    Exposes request timings and Helm operation durations in Prometheus text format.
+    """
+    return Response(response=generate_latest(),
+                    status=200,
+                    content_type=CONTENT_TYPE_LATEST)
+
+
+# TRACES
+@app.route("/traces", methods=["GET"])
+def get_traces() -> Response:
+    """
+    Gets the most recent recorded traces, newest first: at most ?limit (default 100), slower than ?min_ms if given.
+    """
+    traces_dict = tracer.get_traces(limit=int(request.args.get("limit", "100")),
+                                    min_duration=float(request.args.get("min_ms", "0")) / 1000)
+
+    return Response(response=json.dumps(traces_dict),
+                    status=200)
+
+
+@app.route("/traces/<string:trace_id>", methods=["GET"])
+def get_trace(trace_id: str) -> Response:
+    """
+    Gets a recent trace as span trees, or with ?format=otlp as an OTLP/JSON export request.
+    """
+    if request.args.get("format") == "otlp":
+        trace_dict = tracer.get_otlp_trace(trace_id=trace_id)
+    else:
+        trace_dict = tracer.get_trace(trace_id=trace_id)
+    if trace_dict is None:
+        return Response(response=json.dumps({"trace": {}}),
+                        status=404)
+
+    return Response(response=json.dumps(trace_dict),
+                    status=200)
+
+
+# STATS
+@app.route("/stats/tracing", methods=["GET"])
+def get_tracing_stats() -> Response:
+    """
+    Gets recorded trace count and OTLP export counters.
+    """
+    return Response(response=json.dumps(tracer.get_stats()),
+                    status=200)
+
+
+@app.route("/stats/charts", methods=["GET"])
+def get_chart_cache_stats() -> Response:
+    """
+    Gets local chart cache statistics.
+    """
+    stats_dict = galea.chart_cache.get_stats() if galea.chart_cache is not None else {"chart_cache": {}}
+
+    return Response(response=json.dumps(stats_dict),
+                    status=200)
+
+
+@app.route("/stats/scheduler", methods=["GET"])
+def get_scheduler_stats() -> Response:
+    """
+    Gets release operation scheduler statistics.
+    """
+    return Response(response=json.dumps(galea.scheduler.get_stats()),
+                    status=200)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,267 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from typing import Union
+
+
+class ChartDigestError(Exception):
+    """
+    Raised when a cached chart's files no longer match the digest recorded when it was cached.
+    """
+
+
+class ChartCache():
+    """
+    On-disk cache of unpacked charts keyed by (repo, name, version).
+
+    Every entry records the digest of its files, computed once when the chart is cached. Entries
+    loaded from a previous run are verified against it on their first hit, so a chart corrupted or
+    tampered with in between is evicted and pulled again rather than installed. Entries are pinned
+    while a chart is in use and least recently used unpinned entries are evicted once the total
+    size exceeds max_bytes.
+
+    Methods touch the disk and block, async callers run them off the event loop.
+
+    Parameters:
+        directory (str): Cache directory
+        max_bytes (int): Maximum total size of cached charts
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.corruptions = 0
+        # key -> number of callers using the entry, pinned entries are never removed
+        self.pins = {}
+        # Keys whose files were hashed by this process, the others are verified on their first hit
+        self.verified = set()
+
+        os.makedirs(directory, exist_ok=True)
+        self.entries = self.load_index()
+
+
+    def make_key(self, repo: str, name: str, version: str) -> str:
+        return hashlib.sha256(f"{repo}|{name}|{version}".encode("utf-8")).hexdigest()
+
+
+    def get(self, repo: str, name: str, version: str) -> Union[str, None]:
+        """
+        Returns the cached chart directory pinned, or None on miss or digest mismatch.
+        A returned directory must be released with unpin once the chart is no longer used.
+        """
+        key = self.make_key(repo=repo, name=name, version=version)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.pin(key=key)
+            verified = key in self.verified
+            path = os.path.join(self.directory, key)
+
+        try:
+            if not verified:
+                self.verify(path=path, digest=entry["digest"])
+        except ChartDigestError as e:
+            print("Exception:", e, str(e))
+            with self.lock:
+                self.pins[key] -= 1
+                # Left to the callers still using it if pinned elsewhere, they hold the files open
+                if self.pins[key] == 0:
+                    del self.pins[key]
+                    self.remove(key=key)
+                    self.save_index()
+                self.misses += 1
+                self.corruptions += 1
+            return None
+
+        with self.lock:
+            self.verified.add(key)
+            entry["last_used"] = time.time()
+            self.hits += 1
+
+        return path
+
+
+    def put(self, repo: str, name: str, version: str, source_directory: str) -> str:
+        """
+        Copies an unpacked chart into the cache and returns its cached directory pinned.
+        A returned directory must be released with unpin once the chart is no longer used.
+        """
+        key = self.make_key(repo=repo, name=name, version=version)
+        path = os.path.join(self.directory, key)
+        staging_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}")
+
+        shutil.copytree(source_directory, staging_path)
+        digest = self.compute_digest(path=staging_path)
+        size = self.compute_size(path=staging_path)
+
+        with self.lock:
+            if key in self.pins:
+                # Cached meanwhile by a concurrent pull and in use, serve that copy
+                shutil.rmtree(staging_path, ignore_errors=True)
+                self.pin(key=key)
+                self.entries[key]["last_used"] = time.time()
+                return path
+            self.remove(key=key)
+            os.replace(staging_path, path)
+            self.entries[key] =   {
+                                        "repo": repo,
+                                        "name": name,
+                                        "version": version,
+                                        "digest": digest,
+                                        "size": size,
+                                        "last_used": time.time()
+                                    }
+            self.verified.add(key)
+            self.pin(key=key)
+            self.evict()
+            self.save_index()
+
+        return path
+
+
+    def pin(self, key: str):
+        """
+        Marks an entry in use. Must be called holding the lock.
+        """
+        self.pins[key] = self.pins.get(key, 0) + 1
+
+
+    def unpin(self, repo: str, name: str, version: str):
+        """
+        Releases a directory returned by get or put, evicting entries left over max_bytes while it was in use.
+        """
+        key = self.make_key(repo=repo, name=name, version=version)
+        with self.lock:
+            self.pins[key] -= 1
+            if self.pins[key] > 0:
+                return
+            del self.pins[key]
+            if self.evict():
+                self.save_index()
+
+
+    def evict(self) -> bool:
+        """
+        Removes least recently used unpinned entries until the cache fits max_bytes, returning whether
+        any was removed. Must be called holding the lock.
+        """
+        total = sum(entry["size"] for entry in self.entries.values())
+        evicted = False
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key in self.pins:
+                continue
+            total -= self.entries[key]["size"]
+            self.remove(key=key)
+            self.evictions += 1
+            evicted = True
+
+        return evicted
+
+
+    def remove(self, key: str):
+        """
+        Drops an entry and its files. Must be called holding the lock.
+        """
+        self.entries.pop(key, None)
+        self.verified.discard(key)
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return  {
+                        "chart_cache":
+                            {
+                                "entries": len(self.entries),
+                                "bytes": sum(entry["size"] for entry in self.entries.values()),
+                                "max_bytes": self.max_bytes,
+                                "hits": self.hits,
+                                "misses": self.misses,
+                                "evictions": self.evictions,
+                                "corruptions": self.corruptions,
+                                "pinned": len(self.pins)
+                            }
+                    }
+
+
+    def load_index(self) -> dict:
+        """
+        Reads the persisted index, dropping entries whose directory is gone.
+        """
+        try:
+            with open(self.index_path) as index_file:
+                entries = json.load(index_file)
+        except (OSError, ValueError):
+            return {}
+
+        return {key: entry for key, entry in entries.items() if os.path.isdir(os.path.join(self.directory, key))}
+
+
+    def save_index(self):
+        """
+        Persists the index atomically. Must be called holding the lock.
+        """
+        staging_path = f"{self.index_path}.{uuid.uuid4().hex}"
+        with open(staging_path, "w") as index_file:
+            json.dump(self.entries, index_file)
+        os.replace(staging_path, self.index_path)
+
+
+    def verify(self, path: str, digest: str):
+        """
+        Raises ChartDigestError if the directory is gone or its files do not match digest.
+        """
+        if not os.path.isdir(path):
+            raise ChartDigestError(f"Cached chart {path} is missing")
+        if self.compute_digest(path=path) != digest:
+            raise ChartDigestError(f"Cached chart {path} failed digest verification")
+
+
+    def compute_digest(self, path: str) -> str:
+        """
+        Returns the sha256 of every file's relative path and content, in sorted order.
+        """
+        digest = hashlib.sha256()
+        for root, directories, files in os.walk(path):
+            directories.sort()
+            for file_name in sorted(files):
+                file_path = os.path.join(root, file_name)
+                digest.update(os.path.relpath(file_path, path).encode("utf-8") + b"\0")
+                with open(file_path, "rb") as chart_file:
+                    for block in iter(lambda: chart_file.read(65536), b""):
+                        digest.update(block)
+
+        return digest.hexdigest()
+
+
+    def compute_size(self, path: str) -> int:
+        return sum(os.path.getsize(os.path.join(root, file_name))
+                   for root, _, files in os.walk(path) for file_name in files)
@@ -14,116 +14,296 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-from pyhelm3 import Client
+import os
+import time
+import asyncio
+import pathlib
+import contextlib
+import threading
+from concurrent.futures import Future
+from typing import AsyncIterator
+from pyhelm3.errors import ReleaseNotFoundError
+from helmclient import HelmClient, make_client
+from chartcache import ChartCache
+from scheduler import ReleaseScheduler, install, update, delete
+from metrics import helm_operation_seconds, timed
+from tracing import tracer, client
 
 
 class Galea():
     """
     Class used to manage plugin releases via HELM.
+
+    Releases are cached by name. Installs, upgrades and uninstalls patch the cache from the
+    revision Helm returns, and a background reconciler re-lists every release once the cache
+    is older than the reconcile interval.
+
+    Parameters:
+        client (HelmClient): Helm client, the one selected by GALEA_HELM_CLIENT by default
     """
-    def __init__(self):
-        self.client = Client()
-        self.releases = {
-                            "releases": []
-                        }
+    def __init__(self, client: HelmClient = None):
+        self.client = client if client is not None else make_client()
+        # Maximum number of concurrent 'helm history' calls while reading releases
+        self.revision_concurrency = int(os.getenv("GALEA_REVISION_CONCURRENCY", "10"))
+        # Seconds after which the cache is fully reconciled with Helm
+        self.reconcile_interval = float(os.getenv("GALEA_RECONCILE_INTERVAL", "60"))
+
+        self.lock = threading.Lock()
+        self.releases_by_name = {}
+        self.releases_dict = None
+        self.refreshed_at = None
+        # Monotonic time of the last patch per release name, so a slower full re-list does not undo it
+        self.patched_at = {}
+
+        # Helm operations run on the scheduler, serialized per release and bounded overall
+        self.scheduler = ReleaseScheduler(max_concurrency=int(os.getenv("GALEA_MAX_CONCURRENT_OPERATIONS", "4")))
+
+        chart_cache_size = int(os.getenv("GALEA_CHART_CACHE_SIZE_MB", "512")) * 1024 * 1024
+        self.chart_cache = None
+        if chart_cache_size > 0:
+            self.chart_cache = ChartCache(directory=os.getenv("GALEA_CHART_CACHE_DIR", "/tmp/galea/charts"),
+                                          max_bytes=chart_cache_size)
+
+
+    def make_release_dict(self, name: str, namespace: str, revision: int, status: str) -> dict:
+        return  {
+                    "release":  {
+                                    "name": name,
+                                    "namespace": namespace,
+                                    "revision": revision,
+                                    "status": status
+                                }
+                }
 
 
     async def refresh_releases(self) -> None:
         """
         Refreshes cached releases helm releases.
         """
-        self.releases = await self.read_releases()
+        started_at = time.monotonic()
+        releases_dict = await self.read_releases()
+
+        releases_by_name = {release_dict["release"]["name"]: release_dict for release_dict in releases_dict["releases"]}
+        with self.lock:
+            # Keep patches applied while the listing was running
+            for release_name, patched_at in self.patched_at.items():
+                if patched_at < started_at:
+                    continue
+                if release_name in self.releases_by_name:
+                    releases_by_name[release_name] = self.releases_by_name[release_name]
+                else:
+                    releases_by_name.pop(release_name, None)
+            self.patched_at = {release_name: patched_at for release_name, patched_at in self.patched_at.items()
+                               if patched_at >= started_at}
+            self.releases_by_name = releases_by_name
+            self.releases_dict = None
+            self.refreshed_at = started_at
+
+    def patch_release(self, release_name: str, release_dict: dict = None) -> None:
+        """
+        Updates a single cached release, or removes it if no release dict is given.
+        """
+        with self.lock:
+            if release_dict is not None:
+                self.releases_by_name[release_name] = release_dict
+            else:
+                self.releases_by_name.pop(release_name, None)
+            self.patched_at[release_name] = time.monotonic()
+            self.releases_dict = None
 
     def get_releases(self) -> dict:
         """
         Returns cached helm releases.
         """
-        return self.releases
+        with self.lock:
+            if self.releases_dict is None:
+                self.releases_dict = {
+                                        "releases": list(self.releases_by_name.values())
+                                     }
+            return self.releases_dict
 
     def get_release(self, release_name: str) -> dict:
         """
         Returns cached helm release.
         """
-        for release_dict in self.releases["releases"]:
-            if release_dict["name"] == release_name:
-                return release_dict
+        release_dict = self.releases_by_name.get(release_name)
+        if release_dict is not None:
+            return release_dict
         return  {
                     "release": {}
                 }
 
+
+    def start_reconciler(self) -> None:
+        """
+        Starts the background thread periodically re-listing releases.
+        """
+        threading.Thread(target=self.reconcile, name="reconciler", daemon=True).start()
+
+    def reconcile(self) -> None:
+        """
+        Re-lists releases whenever the cache is older than the reconcile interval.
+        """
+        while True:
+            with self.lock:
+                refreshed_at = self.refreshed_at
+            if refreshed_at is not None:
+                wait = refreshed_at + self.reconcile_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+            try:
+                asyncio.run(self.refresh_releases())
+            except Exception as e:
+                print("Exception:", e, str(e))
+                time.sleep(self.reconcile_interval)
+
+    
+    def submit(self, kind: str, release_name: str, repo_url: str = None, version: str = None) -> Future:
+        """
+        Schedules an install, update or delete of a release and returns a future resolved with its release dict.
+        """
+        if kind == install:
+            function = lambda: self.create_release(release_name=release_name, repo_url=repo_url, version=version)
+        elif kind == update:
+            function = lambda: self.update_release(release_name=release_name, repo_url=repo_url, version=version)
+        elif kind == delete:
+            function = lambda: self.delete_release(release_name=release_name)
+        else:
+            raise ValueError(f"Unknown release operation '{kind}'")
+
+        return self.scheduler.submit(release_name=release_name, kind=kind, function=function)
+
+
+    @contextlib.asynccontextmanager
+    async def get_chart(self, chart_ref: str, repo_url: str, version: str) -> AsyncIterator:
+        """
+        Yields the chart, served from the local chart cache when this (repo, name, version) was pulled before.
+        The cache entry stays pinned until the block exits, cache disk work runs off the event loop.
+        Charts without a pinned version are always resolved remotely.
+        """
+        if self.chart_cache is None or not version:
+            with tracer.span(name="helm show chart", kind=client, attributes={"chart": chart_ref, "version": version}):
+                chart = await self.client.get_chart(chart_ref=chart_ref, repo=repo_url, version=version)
+            yield chart
+            return
+
+        path = await asyncio.to_thread(self.chart_cache.get, repo=repo_url, name=chart_ref, version=version)
+        if path is None:
+            with tracer.span(name="helm pull", kind=client, attributes={"chart": chart_ref, "version": version}):
+                async with self.client.pull_chart(chart_ref=chart_ref, repo=repo_url, version=version) as pulled_chart:
+                    path = await asyncio.to_thread(self.chart_cache.put, repo=repo_url, name=chart_ref, version=version,
+                                                   source_directory=str(pulled_chart.ref))
+
+        try:
+            yield await self.client.get_chart(chart_ref=pathlib.Path(path))
+        finally:
+            await asyncio.to_thread(self.chart_cache.unpin, repo=repo_url, name=chart_ref, version=version)
+
     
     # CREATE
+    @timed(helm_operation_seconds, "install")
     async def create_release(self, release_name: str, repo_url: str, version: str) -> dict:
         """
         Installs a plugin release based on given arguments.
         """
-        chart = await self.client.get_chart(chart_ref=release_name, repo=repo_url, version=version)
-        revision = await self.client.install_or_upgrade_release(release_name=release_name, chart=chart)
+        async with self.get_chart(chart_ref=release_name, repo_url=repo_url, version=version) as chart:
+            with tracer.span(name="helm upgrade --install", kind=client, attributes={"release": release_name}):
+                revision = await self.client.install_or_upgrade_release(release_name=release_name, chart=chart)
         
-        release_dict =  {
-                            "release":  {
-                                            "name": revision.release.name,
-                                            "namespace": revision.release.namespace,
-                                            "revision": revision.revision,
-                                            "status": revision.status
-                                        }
-                        }
+        release_dict = self.make_release_dict(name=revision.release.name,
+                                              namespace=revision.release.namespace,
+                                              revision=revision.revision,
+                                              status=revision.status)
         
-        await self.refresh_releases()
+        self.patch_release(release_name=release_name, release_dict=release_dict)
 
         return release_dict
 
 
     # READ
+    @timed(helm_operation_seconds, "list")
     async def read_releases(self) -> dict:
         """
         Retrieves running releases helm release details.
+        Revisions are looked up concurrently, at most revision_concurrency at a time, and releases
+        uninstalled in between are left out.
         """
-        releases = await self.client.list_releases(all = True, all_namespaces = True)
+        with tracer.span(name="helm list", kind=client):
+            releases = await self.client.list_releases(all = True, all_namespaces = True)
+        semaphore = asyncio.Semaphore(self.revision_concurrency)
+
+        async def read_revision(release) -> dict:
+            async with semaphore:
+                try:
+                    revision = await release.current_revision()
+                except ReleaseNotFoundError:
+                    return None
+            return self.make_release_dict(name=release.name,
+                                          namespace=release.namespace,
+                                          revision=revision.revision,
+                                          status=revision.status)
+
+        release_dicts = await asyncio.gather(*[read_revision(release) for release in releases])
         releases_dict =  {
-                            "releases": []
+                            "releases": [release_dict for release_dict in release_dicts if release_dict is not None]
                         }
-        for release in releases:
-            revision = await release.current_revision()
-            plugin_dict =   {
-                                "release":  {
-                                                "name": release.name,
-                                                "namespace": release.namespace,
-                                                "revision": revision.revision,
-                                                "status": revision.status
-                                            }
-                            }
-            releases_dict["releases"].append(plugin_dict)
 
         return releases_dict
+
+    @timed(helm_operation_seconds, "read")
+    async def read_release(self, release_name: str) -> dict:
+        """
+        Retrieves a release's current revision from helm, bypassing and updating the cache.
+        """
+        try:
+            with tracer.span(name="helm status", kind=client, attributes={"release": release_name}):
+                revision = await self.client.get_current_revision(release_name)
+        except ReleaseNotFoundError:
+            self.patch_release(release_name=release_name)
+            return  {
+                        "release": {}
+                    }
+
+        release_dict = self.make_release_dict(name=revision.release.name,
+                                              namespace=revision.release.namespace,
+                                              revision=revision.revision,
+                                              status=revision.status)
+        self.patch_release(release_name=release_name, release_dict=release_dict)
+
+        return release_dict
     
 
     # UPDATE
+    @timed(helm_operation_seconds, "update")
     async def update_release(self, release_name: str, repo_url: str, version: str) -> dict:
         """
         Installs or upgrades a given plugin release based on given arguments.
         """
-        chart = await self.client.get_chart(chart_ref=release_name, repo=repo_url, version=version)
-        revision = await self.client.install_or_upgrade_release(release_name=release_name, chart=chart, force=True)
+        async with self.get_chart(chart_ref=release_name, repo_url=repo_url, version=version) as chart:
+            with tracer.span(name="helm upgrade --install", kind=client, attributes={"release": release_name, "force": True}):
+                revision = await self.client.install_or_upgrade_release(release_name=release_name, chart=chart, force=True)
         
-        release_dict =  {
-                            "release":  {
-                                            "name": revision.release.name,
-                                            "namespace": revision.release.namespace,
-                                            "revision": revision.revision,
-                                            "status": revision.status
-                                        }
-                        }
+        release_dict = self.make_release_dict(name=revision.release.name,
+                                              namespace=revision.release.namespace,
+                                              revision=revision.revision,
+                                              status=revision.status)
         
-        await self.refresh_releases()
+        self.patch_release(release_name=release_name, release_dict=release_dict)
 
         return release_dict
 
     # DELETE
-    async def delete_release(self, release_name: str) -> None:
+    @timed(helm_operation_seconds, "delete")
+    async def delete_release(self, release_name: str) -> dict:
         """
         Uninstalls a given release.
         """
-        await self.client.uninstall_release(release_name=release_name)
+        with tracer.span(name="helm uninstall", kind=client, attributes={"release": release_name}):
+            await self.client.uninstall_release(release_name=release_name)
+
+        self.patch_release(release_name=release_name)
 
-        await self.refresh_releases()
+        return  {
+                    "release": {}
+                }
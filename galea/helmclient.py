@@ -0,0 +1,207 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import os
+import random
+import asyncio
+import pathlib
+import tempfile
+import threading
+import contextlib
+from typing import AsyncIterator, Protocol, Union
+from pyhelm3 import Client
+from pyhelm3.errors import Error, ReleaseNotFoundError
+from pyhelm3.models import ReleaseRevisionStatus
+
+
+class HelmClient(Protocol):
+    """
+    Helm operations Galea relies on. pyhelm3's Client implements them against the helm binary,
+    SimulatedClient in process.
+
+    Revisions returned expose .release (with .name and .namespace), .revision and .status, releases
+    returned by list_releases expose .name, .namespace and an awaitable current_revision().
+    Unknown releases raise pyhelm3's ReleaseNotFoundError, failed commands pyhelm3's Error.
+    """
+    async def get_chart(self, chart_ref: Union[pathlib.Path, str], *, repo: str = None, version: str = None): ...
+
+    def pull_chart(self, chart_ref: str, *, repo: str = None, version: str = None) -> contextlib.AbstractAsyncContextManager: ...
+
+    async def list_releases(self, *, all: bool = False, all_namespaces: bool = False) -> list: ...
+
+    async def get_current_revision(self, release_name: str): ...
+
+    async def install_or_upgrade_release(self, release_name: str, chart, *, force: bool = False): ...
+
+    async def uninstall_release(self, release_name: str): ...
+
+
+class SimulatedChart():
+    def __init__(self, ref: Union[pathlib.Path, str], name: str, version: str):
+        self.ref = ref
+        self.name = name
+        self.version = version
+
+
+class SimulatedRelease():
+    """
+    Release of a SimulatedClient, whose current_revision costs one simulated 'helm history' call.
+    """
+    def __init__(self, client: "SimulatedClient", name: str, namespace: str):
+        self.client = client
+        self.name = name
+        self.namespace = namespace
+
+    async def current_revision(self) -> "SimulatedRevision":
+        return await self.client.get_current_revision(self.name)
+
+
+class SimulatedRevision():
+    def __init__(self, release: SimulatedRelease, revision: int, status: ReleaseRevisionStatus):
+        self.release = release
+        self.revision = revision
+        self.status = status
+
+
+class SimulatedClient():
+    """
+    In-process Helm backend keeping releases in memory, used to exercise Galea without a cluster.
+
+    Every call sleeps for its configured latency: chart pulls (remote get_chart and pull_chart),
+    installs and upgrades, uninstalls, the 'helm list' of list_releases and the 'helm history'
+    behind each revision lookup. Chart pulls, installs, upgrades and uninstalls fail with
+    probability failure_rate; like Helm, a failed install or upgrade leaves a failed revision.
+
+    Parameters:
+        pull_latency (float): Seconds per chart pull
+        install_latency (float): Seconds per install or upgrade
+        uninstall_latency (float): Seconds per uninstall
+        list_latency (float): Seconds per release listing
+        history_latency (float): Seconds per revision lookup
+        failure_rate (float): Probability of a pull, install, upgrade or uninstall failing
+        namespace (str): Namespace releases are installed in
+    """
+    def __init__(self, pull_latency: float = 0.0, install_latency: float = 0.0, uninstall_latency: float = 0.0,
+                 list_latency: float = 0.0, history_latency: float = 0.0, failure_rate: float = 0.0,
+                 namespace: str = "default"):
+        self.pull_latency = pull_latency
+        self.install_latency = install_latency
+        self.uninstall_latency = uninstall_latency
+        self.list_latency = list_latency
+        self.history_latency = history_latency
+        self.failure_rate = failure_rate
+        self.namespace = namespace
+        # Operations run on the scheduler loop while listings run on the reconciler and request threads
+        self.lock = threading.Lock()
+        self.revisions_by_name = {}
+
+
+    async def simulate(self, latency: float, command: str, release_name: str = None):
+        """
+        Waits for latency seconds, then fails the command with probability failure_rate.
+        """
+        await asyncio.sleep(latency)
+        if self.failure_rate > 0 and random.random() < self.failure_rate:
+            target = f" {release_name}" if release_name is not None else ""
+            raise Error(returncode=1, stdout=b"", stderr=f"Error: simulated failure of helm {command}{target}".encode("utf-8"))
+
+
+    async def get_chart(self, chart_ref: Union[pathlib.Path, str], *, repo: str = None, version: str = None) -> SimulatedChart:
+        if isinstance(chart_ref, pathlib.Path):
+            return SimulatedChart(ref=chart_ref, name=chart_ref.name, version=version)
+        await self.simulate(latency=self.pull_latency, command="show chart")
+        return SimulatedChart(ref=chart_ref, name=chart_ref, version=version)
+
+
+    @contextlib.asynccontextmanager
+    async def pull_chart(self, chart_ref: str, *, repo: str = None, version: str = None) -> AsyncIterator[SimulatedChart]:
+        """
+        Yields a chart whose ref is a temporary directory holding a minimal Chart.yaml.
+        """
+        await self.simulate(latency=self.pull_latency, command="pull")
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "Chart.yaml"), "w") as chart_file:
+                chart_file.write(f"apiVersion: v2\nname: {chart_ref}\nversion: {version}\n")
+            yield SimulatedChart(ref=pathlib.Path(directory), name=chart_ref, version=version)
+
+
+    async def list_releases(self, *, all: bool = False, all_namespaces: bool = False) -> list:
+        await asyncio.sleep(self.list_latency)
+        with self.lock:
+            return [revision.release for revision in self.revisions_by_name.values()]
+
+
+    async def get_current_revision(self, release_name: str) -> SimulatedRevision:
+        await asyncio.sleep(self.history_latency)
+        with self.lock:
+            revision = self.revisions_by_name.get(release_name)
+        if revision is None:
+            raise ReleaseNotFoundError(returncode=1, stdout=b"", stderr=b"Error: release: not found")
+        return revision
+
+
+    async def install_or_upgrade_release(self, release_name: str, chart: SimulatedChart, *, force: bool = False) -> SimulatedRevision:
+        try:
+            await self.simulate(latency=self.install_latency, command="upgrade --install", release_name=release_name)
+        except Error:
+            self.add_revision(release_name=release_name, status=ReleaseRevisionStatus.FAILED)
+            raise
+
+        return self.add_revision(release_name=release_name, status=ReleaseRevisionStatus.DEPLOYED)
+
+
+    def add_revision(self, release_name: str, status: ReleaseRevisionStatus) -> SimulatedRevision:
+        with self.lock:
+            previous_revision = self.revisions_by_name.get(release_name)
+            if previous_revision is not None:
+                release, number = previous_revision.release, previous_revision.revision + 1
+            else:
+                release, number = SimulatedRelease(client=self, name=release_name, namespace=self.namespace), 1
+            revision = SimulatedRevision(release=release, revision=number, status=status)
+            self.revisions_by_name[release_name] = revision
+            return revision
+
+
+    async def uninstall_release(self, release_name: str):
+        await self.simulate(latency=self.uninstall_latency, command="uninstall", release_name=release_name)
+        with self.lock:
+            self.revisions_by_name.pop(release_name, None)
+
+
+    def add_releases(self, release_names: list):
+        """
+        Deploys releases without simulating their installs, to start from a populated cluster.
+        """
+        for release_name in release_names:
+            self.add_revision(release_name=release_name, status=ReleaseRevisionStatus.DEPLOYED)
+
+
+def make_client() -> HelmClient:
+    """
+    Returns the Helm client selected by GALEA_HELM_CLIENT: helm (pyhelm3, default) or simulated.
+    """
+    kind = os.getenv("GALEA_HELM_CLIENT", "helm")
+    if kind == "helm":
+        return Client()
+    if kind == "simulated":
+        return SimulatedClient(pull_latency=float(os.getenv("GALEA_SIMULATED_PULL_MS", "500")) / 1000,
+                               install_latency=float(os.getenv("GALEA_SIMULATED_INSTALL_MS", "2000")) / 1000,
+                               uninstall_latency=float(os.getenv("GALEA_SIMULATED_UNINSTALL_MS", "1000")) / 1000,
+                               list_latency=float(os.getenv("GALEA_SIMULATED_LIST_MS", "100")) / 1000,
+                               history_latency=float(os.getenv("GALEA_SIMULATED_HISTORY_MS", "50")) / 1000,
+                               failure_rate=float(os.getenv("GALEA_SIMULATED_FAILURE_RATE", "0")))
+    raise ValueError(f"Unknown Helm client '{kind}', expected helm or simulated")
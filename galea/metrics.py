@@ -0,0 +1,93 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import functools
+from typing import Awaitable, Callable
+from prometheus_client import Histogram, Gauge
+from tracing import tracer
+
+
+# Buckets in seconds, Helm operations (chart pulls, installs waiting on pods) taking up to minutes
+request_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+helm_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+request_seconds = Histogram("galea_http_request_duration_seconds", "Time to build the response of a request",
+                            ["method", "route", "status"], buckets=request_buckets)
+requests_in_flight = Gauge("galea_http_requests_in_flight", "Requests being handled", ["route"])
+helm_operation_seconds = Histogram("galea_helm_operation_duration_seconds", "Duration of Helm operations, chart retrieval included",
+                                   ["operation", "outcome"], buckets=helm_buckets)
+
+
+def get_route(url_rule) -> str:
+    """
+    Returns the route a request matched, as the route label (bounded, unlike paths).
+    """
+    return url_rule.rule if url_rule is not None else "<unmatched>"
+
+
+# Labelled metrics by label values, looked up per request where labels() would take a lock and several times longer
+request_seconds_by_labels = {}
+requests_in_flight_by_route = {}
+
+
+def start_request(route: str) -> tuple:
+    """
+    Counts a request in flight and returns its (route, start time), to be passed to finish_request.
+    """
+    in_flight = requests_in_flight_by_route.get(route)
+    if in_flight is None:
+        in_flight = requests_in_flight_by_route.setdefault(route, requests_in_flight.labels(route))
+    in_flight.inc()
+    return route, time.perf_counter()
+
+
+def finish_request(request_metrics: tuple, method: str, status: int):
+    route, started_at = request_metrics
+    seconds = time.perf_counter() - started_at
+    histogram = request_seconds_by_labels.get((method, route, status))
+    if histogram is None:
+        histogram = request_seconds_by_labels.setdefault((method, route, status), request_seconds.labels(method, route, status))
+    histogram.observe(seconds)
+    requests_in_flight_by_route[route].dec()
+
+
+def timed(histogram: Histogram, name: str) -> Callable:
+    """
+    Decorator observing the duration of each call of a coroutine function in histogram, labelled with name
+    and the outcome (ok or error), and tracing it as a span named "release <name>" within a request.
+    """
+    ok, error = histogram.labels(name, "ok"), histogram.labels(name, "error")
+    span_name = f"release {name}"
+
+    def decorator(function: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            span = tracer.start_span(name=span_name)
+            started_at = time.perf_counter()
+            try:
+                result = await function(*args, **kwargs)
+            except BaseException as e:
+                error.observe(time.perf_counter() - started_at)
+                if span is not None:
+                    tracer.finish_span(span=span, error=str(e) or type(e).__name__)
+                raise
+            ok.observe(time.perf_counter() - started_at)
+            if span is not None:
+                tracer.finish_span(span=span)
+            return result
+        return wrapper
+    return decorator
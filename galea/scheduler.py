@@ -0,0 +1,194 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future
+from typing import Awaitable, Callable
+
+
+install = "install"
+update = "update"
+delete = "delete"
+
+# Outcome of a queued operation dropped for a later one on the same release
+superseded = "superseded"
+
+
+class ScheduledOperation():
+    """
+    Queued release operation and the futures waiting for its result.
+
+    Parameters:
+        kind (str): install, update or delete
+        function (callable): Coroutine function running the operation
+        context (Context): Context of the submitting request, the operation runs in
+    """
+    def __init__(self, kind: str, function: Callable[[], Awaitable], context: contextvars.Context):
+        self.kind = kind
+        self.function = function
+        self.context = context
+        self.futures = []
+
+
+class ReleaseScheduler():
+    """
+    Runs release operations on a dedicated event loop thread.
+
+    Operations on the same release run one after the other in submission order, operations on
+    different releases run in parallel up to max_concurrency. A queued operation that is made
+    redundant by a later one on the same release (an upgrade followed by another upgrade or by a
+    delete, or two deletes) is dropped and its callers get a superseded dict naming the later
+    operation's kind right away. A delete superseding an install that had not run yet, with no install or
+    upgrade ahead of it, has no release to remove: it is resolved too, as an uninstall, without running.
+
+    Parameters:
+        max_concurrency (int): Maximum number of operations running at once
+    """
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+        self.pending = {}
+        # release name -> kind of its running or last run operation, None until the first one starts
+        self.running = {}
+        self.submitted = 0
+        self.coalesced = 0
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        threading.Thread(target=self.run_loop, args=(ready,), name="scheduler", daemon=True).start()
+        ready.wait()
+
+
+    def run_loop(self, ready: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        ready.set()
+        self.loop.run_forever()
+
+
+    def submit(self, release_name: str, kind: str, function: Callable[[], Awaitable]) -> Future:
+        """
+        Queues an operation from any thread and returns a future resolved with its result.
+
+        Arguments:
+            release_name (str): Release the operation applies to
+            kind (str): install, update or delete
+            function (callable): Coroutine function running the operation
+        """
+        future = Future()
+        self.loop.call_soon_threadsafe(self.enqueue, release_name, kind, function, future, contextvars.copy_context())
+
+        return future
+
+
+    def enqueue(self, release_name: str, kind: str, function: Callable[[], Awaitable], future: Future, context: contextvars.Context):
+        """
+        Adds an operation to the release's queue, coalescing redundant queued ones. Runs on the loop thread.
+        """
+        self.submitted += 1
+        operation = ScheduledOperation(kind=kind, function=function, context=context)
+        operation.futures.append(future)
+
+        queue = self.pending.setdefault(release_name, deque())
+        # Only operations that have not started yet can be dropped
+        earliest_superseded_kind = None
+        while queue and self.supersedes(kind=kind, queued_kind=queue[-1].kind):
+            superseded_operation = queue.pop()
+            superseded_dict = self.make_superseded_dict(release_name=release_name, kind=superseded_operation.kind, superseded_by=kind)
+            self.resolve(futures=superseded_operation.futures, result=superseded_dict)
+            earliest_superseded_kind = superseded_operation.kind
+            self.coalesced += 1
+
+        ahead_kind = queue[-1].kind if queue else self.running.get(release_name)
+        if kind == delete and earliest_superseded_kind == install and ahead_kind in (None, delete):
+            # The release was never installed, the delete has nothing to uninstall
+            self.resolve(futures=operation.futures, result={"release": {}})
+            self.coalesced += 1
+            if not queue and release_name not in self.running:
+                del self.pending[release_name]
+            return
+
+        queue.append(operation)
+
+        if release_name not in self.running:
+            self.running[release_name] = None
+            self.loop.create_task(self.drain(release_name=release_name))
+
+
+    def resolve(self, futures: list, result: dict):
+        for future in futures:
+            # Callers that went away cancel their future
+            if not future.done():
+                future.set_result(result)
+
+
+    def supersedes(self, kind: str, queued_kind: str) -> bool:
+        """
+        Returns whether a queued operation of queued_kind is made redundant by a later one of kind.
+        """
+        return queued_kind in (install, update) or (queued_kind == delete and kind == delete)
+
+
+    def make_superseded_dict(self, release_name: str, kind: str, superseded_by: str) -> dict:
+        return  {
+                    "release":  {
+                                    "name": release_name
+                                },
+                    "operation": kind,
+                    "status": superseded,
+                    "superseded_by": superseded_by
+                }
+
+
+    async def drain(self, release_name: str):
+        """
+        Runs a release's queued operations one at a time.
+        """
+        queue = self.pending[release_name]
+        try:
+            while queue:
+                operation = queue.popleft()
+                self.running[release_name] = operation.kind
+                async with self.semaphore:
+                    try:
+                        # Run as a task created within the submitter's context, so its spans join the request's trace
+                        result = await operation.context.run(self.loop.create_task, operation.function())
+                    except Exception as e:
+                        for future in operation.futures:
+                            # Callers that went away cancel their future
+                            if not future.done():
+                                future.set_exception(e)
+                        continue
+                self.resolve(futures=operation.futures, result=result)
+        finally:
+            self.running.pop(release_name, None)
+            if not queue:
+                del self.pending[release_name]
+
+
+    def get_stats(self) -> dict:
+        return  {
+                    "scheduler":
+                        {
+                            "max_concurrency": self.max_concurrency,
+                            "releases_running": len(self.running),
+                            "operations_pending": sum(len(queue) for queue in list(self.pending.values())),
+                            "operations_submitted": self.submitted,
+                            "operations_coalesced": self.coalesced
+                        }
+                }
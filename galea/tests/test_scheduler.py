@@ -0,0 +1,158 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import time
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future
+import pytest
+from scheduler import ReleaseScheduler, install, update, delete, superseded
+
+
+@pytest.fixture
+def scheduler():
+    return ReleaseScheduler(max_concurrency=4)
+
+
+def make_operation(calls: list, name: str, gate: threading.Event = None):
+    """
+    Returns a coroutine function recording its call in calls, waiting for gate first if given.
+    """
+    async def function():
+        while gate is not None and not gate.is_set():
+            await asyncio.sleep(0.005)
+        calls.append(name)
+        return {"release": {"name": name}}
+
+    return function
+
+
+def block_release(scheduler: ReleaseScheduler, release_name: str, calls: list, kind: str = install) -> tuple:
+    """
+    Starts an operation holding the release until the returned event is set, so the next ones queue.
+    Returns the event and the running operation's future.
+    """
+    gate = threading.Event()
+    future = scheduler.submit(release_name=release_name, kind=kind, function=make_operation(calls=calls, name="running", gate=gate))
+    deadline = time.monotonic() + 5
+    while release_name not in scheduler.running or scheduler.pending[release_name]:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    return gate, future
+
+
+@pytest.mark.parametrize("first_kind, second_kind", [(install, update), (update, update), (install, delete), (update, delete), (delete, delete)])
+def test_queued_operation_superseded(scheduler, first_kind, second_kind):
+    calls = []
+    gate, _ = block_release(scheduler=scheduler, release_name="plugin", calls=calls)
+    first = scheduler.submit(release_name="plugin", kind=first_kind, function=make_operation(calls=calls, name="first"))
+    second = scheduler.submit(release_name="plugin", kind=second_kind, function=make_operation(calls=calls, name="second"))
+
+    assert first.result(timeout=5) == {"release": {"name": "plugin"}, "operation": first_kind,
+                                       "status": superseded, "superseded_by": second_kind}
+    gate.set()
+    assert second.result(timeout=5) == {"release": {"name": "second"}}
+    assert calls == ["running", "second"]
+    assert scheduler.get_stats()["scheduler"]["operations_coalesced"] == 1
+
+
+@pytest.mark.parametrize("first_kind, second_kind", [(delete, install), (delete, update)])
+def test_queued_operation_kept(scheduler, first_kind, second_kind):
+    calls = []
+    gate, _ = block_release(scheduler=scheduler, release_name="plugin", calls=calls)
+    first = scheduler.submit(release_name="plugin", kind=first_kind, function=make_operation(calls=calls, name="first"))
+    second = scheduler.submit(release_name="plugin", kind=second_kind, function=make_operation(calls=calls, name="second"))
+    gate.set()
+
+    assert first.result(timeout=5) == {"release": {"name": "first"}}
+    assert second.result(timeout=5) == {"release": {"name": "second"}}
+    assert calls == ["running", "first", "second"]
+    assert scheduler.get_stats()["scheduler"]["operations_coalesced"] == 0
+
+
+def test_delete_cancels_install_that_never_ran(scheduler):
+    calls = []
+    # The running delete leaves no release behind, so the queued install is the one that would create it
+    gate, _ = block_release(scheduler=scheduler, release_name="plugin", calls=calls, kind=delete)
+    first = scheduler.submit(release_name="plugin", kind=install, function=make_operation(calls=calls, name="first"))
+    second = scheduler.submit(release_name="plugin", kind=delete, function=make_operation(calls=calls, name="second"))
+
+    assert first.result(timeout=5) == {"release": {"name": "plugin"}, "operation": install,
+                                       "status": superseded, "superseded_by": delete}
+    assert second.result(timeout=5) == {"release": {}}
+    gate.set()
+    deadline = time.monotonic() + 5
+    while "plugin" in scheduler.pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert calls == ["running"]
+    assert scheduler.get_stats()["scheduler"]["operations_coalesced"] == 2
+
+
+def test_delete_cancels_first_install(scheduler):
+    calls = []
+    futures = []
+
+    def enqueue_both():
+        # On the loop thread, so the install is still queued when the delete arrives
+        for name, kind in (("first", install), ("second", delete)):
+            futures.append(Future())
+            scheduler.enqueue("plugin", kind, make_operation(calls=calls, name=name), futures[-1], contextvars.copy_context())
+
+    scheduler.loop.call_soon_threadsafe(enqueue_both)
+
+    deadline = time.monotonic() + 5
+    while len(futures) < 2 or "plugin" in scheduler.pending:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+    assert futures[0].result(timeout=5)["status"] == superseded
+    assert futures[1].result(timeout=5) == {"release": {}}
+    assert calls == []
+
+
+def test_running_operation_not_superseded(scheduler):
+    calls = []
+    gate, running = block_release(scheduler=scheduler, release_name="plugin", calls=calls, kind=update)
+    later = scheduler.submit(release_name="plugin", kind=delete, function=make_operation(calls=calls, name="later"))
+    gate.set()
+
+    assert running.result(timeout=5) == {"release": {"name": "running"}}
+    assert later.result(timeout=5) == {"release": {"name": "later"}}
+    assert calls == ["running", "later"]
+
+
+def test_other_release_not_superseded(scheduler):
+    calls = []
+    gate, _ = block_release(scheduler=scheduler, release_name="plugin", calls=calls)
+    first = scheduler.submit(release_name="plugin", kind=update, function=make_operation(calls=calls, name="first"))
+    other = scheduler.submit(release_name="other", kind=delete, function=make_operation(calls=calls, name="other"))
+
+    # Runs while the first release is held
+    assert other.result(timeout=5) == {"release": {"name": "other"}}
+    gate.set()
+    assert first.result(timeout=5) == {"release": {"name": "first"}}
+
+
+def test_failure_reaches_caller(scheduler):
+    async def function():
+        raise ValueError("helm failed")
+
+    future = scheduler.submit(release_name="plugin", kind=install, function=function)
+
+    with pytest.raises(ValueError, match="helm failed"):
+        future.result(timeout=5)
@@ -14,145 +14,89 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
-import json
-from flask import Flask, request, Response, send_from_directory
+
+import time
+import_started_at = time.perf_counter()
+
+from typing import Callable, Iterator
+from flask import Flask, request, Response, g, send_from_directory
 from tabularium import Tabularium
+from tracing import profiler
+from responses import format_stream_chunk, format_named_event
+from routes import Server, register_routes, run_to_completion, start_request_telemetry, finish_request_telemetry
 
 app = Flask(__name__, static_folder="frontend/build", static_url_path='')
-tabularium = Tabularium(app=app)
+tabularium = Tabularium(app=app, import_time=time.perf_counter() - import_started_at)
 
 
-# CREATE
-@app.route("/plugins", methods=["POST"])
-def create_plugin() -> Response:
-    """
-    Creates plugin and parameters entries based on provided JSON.
+class FlaskServer(Server):
     """
-    try:
-        tabularium.create_plugin(plugin_dict=request.json)
-        
-        return Response(status=201)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
-
-
-# READ
-@app.route("/plugins", methods=["GET"])
-def read_plugins() -> Response:
+    Serves the route table of routes.py on the request's thread: blocking calls and plugin calls are made in place.
     """
-    Reads plugins from 'plugins' table and parameters from 'parameters' table and return as JSON.
-    """
-    try:
-        plugins_dict = tabularium.read_plugins()
+    async def get_json(self):
+        return self.request.json
 
-        return Response(response=json.dumps(plugins_dict), status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
-    
 
-@app.route("/plugins/<int:plugin_id>", methods=["GET"])
-def read_plugin(plugin_id: int) -> Response:
-    """
-    Reads plugin from 'plugins' table and parameters from 'parameters' table.
-    """
-    try:
-        plugin_dict = tabularium.read_plugin(plugin_id=plugin_id)
+    async def call(self, function: Callable, **kwargs):
+        return function(**kwargs)
 
-        return Response(response=json.dumps(plugin_dict), status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
-    
 
-@app.route("/releases", methods=["GET"])
-def read_releases() -> Response:
-    """
-    Reads releases.
-    """
-    try:
-        releases_dict = tabularium.get_releases()
+    def read_body(self) -> Iterator[bytes]:
+        return self.request.stream
 
-        return Response(response=json.dumps(releases_dict), status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
 
+    def iterate(self, iterator: Iterator) -> Iterator:
+        return iterator
 
-# UPDATE
-@app.route("/plugins/<int:plugin_id>", methods=["PUT"])
-def update_plugin(plugin_id: int) -> Response:
-    # ToDo: Align with new route and logic
-    """
-    Updates plugins and parameters into database based on provided JSON.
-    """
-    try:
-        tabularium.update_plugin(plugin_dict=request.json)
 
-        return Response(status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
+    async def run(self, test_dict: dict, version: str) -> dict:
+        return self.tabularium.marathon.run(test_dict=test_dict, version=version)
 
 
-# DELETE
-@app.route("/plugins/<int:plugin_id>", methods=["DELETE"])
-def delete_plugin(plugin_id: int) -> Response:
-    """
-    Deletes plugin and parameters from database.
-    """
-    try:
-        tabularium.delete_plugin_and_parameters(plugin_id=plugin_id)
+    async def run_batch(self, batch_dict: dict) -> dict:
+        return self.tabularium.marathon.run_batch(batch_dict=batch_dict)
 
-        return Response(status=204)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
 
+    async def run_pipeline(self, pipeline_dict: dict) -> dict:
+        return self.tabularium.marathon.run_pipeline(pipeline_dict=pipeline_dict)
 
-# RUN
-@app.route("/run", methods=["POST"])
-def run():
-    """
-    Runs test.
-    """
-    try:
-        result_dict = tabularium.marathon.run(test_dict=request.json)
 
-        return Response(response=json.dumps(result_dict), status=201)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
+    async def open_stream(self, test_dict: dict) -> Iterator:
+        result = self.tabularium.marathon.open_stream(test_dict=test_dict)
+        return self.tabularium.marathon.stream(test_dict=test_dict, result=result)
 
 
-# TEST
-@app.route("/test/plugins", methods=["GET"])
-def get_plugins() -> Response:
-    """
-    Gets plugins.
-    """
-    try:
-        plugins_dict = tabularium.get_plugins()
+    def format_stream(self, chunks: Iterator, sse: bool) -> Iterator[str]:
+        try:
+            for chunk in chunks:
+                text = format_stream_chunk(chunk=chunk, sse=sse)
+                if text is not None:
+                    yield text
+        except Exception as e:
+            if not sse:
+                raise
+            print("Exception:", e, str(e))
+            yield format_named_event(event="error", data_dict={"strerr": str(e)})
 
-        return Response(response=json.dumps(plugins_dict), status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
-    
 
-@app.route("/test/releases", methods=["GET"])
-def get_releases() -> Response:
-    """
-    Gets releases.
-    """
-    try:
-        releases_dict = tabularium.get_releases()
+server = FlaskServer(tabularium=tabularium, request=request, response_class=Response)
+
+def make_view(handler: Callable) -> Callable:
+    def view(**view_args) -> Response:
+        return run_to_completion(handler(server, **view_args))
+    return view
+
+register_routes(app=app, make_view=make_view)
+
+
+@app.before_request
+def start_telemetry():
+    start_request_telemetry(request=request, g=g, profiler=profiler)
 
-        return Response(response=json.dumps(releases_dict), status=200)
-    except Exception as e:
-        print("Exception:", e, str(e))
-        return Response(response=json.dumps({"err": e, "strerr": str(e)}), status=400)
+# After request functions also run for the error response of a failed request
+@app.after_request
+def finish_telemetry(response: Response) -> Response:
+    return finish_request_telemetry(request=request, g=g, response=response, profiler=profiler)
 
 
 # INDEX
@@ -0,0 +1,163 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import time
+import_started_at = time.perf_counter()
+
+import asyncio
+import functools
+import contextvars
+from typing import AsyncIterator, Callable, Iterator
+from quart import Quart, request, Response, g, send_from_directory
+from tabularium import Tabularium
+from asyncmarathon import AsyncMarathon
+from asyncgaleadispatcher import AsyncGaleaDispacher
+from responses import format_stream_chunk, format_named_event
+from routes import Server, register_routes, start_request_telemetry, finish_request_telemetry
+
+app = Quart(__name__, static_folder="frontend/build", static_url_path='')
+tabularium = Tabularium(app=app, import_time=time.perf_counter() - import_started_at)
+async_marathon = AsyncMarathon(marathon=tabularium.marathon)
+async_galea_dispatcher = AsyncGaleaDispacher(dispatcher=tabularium.galea_dispatcher)
+
+
+@app.before_serving
+async def start_async_galea():
+    tabularium.use_async_galea(dispatcher=async_galea_dispatcher, loop=asyncio.get_running_loop())
+
+@app.after_serving
+async def close_sessions():
+    await async_marathon.close()
+    await async_galea_dispatcher.close()
+
+
+async def in_thread(function: Callable, **kwargs):
+    """
+    Runs a blocking Tabularium call (MySQL) on the loop's executor, bounded in practice by the MySQL pool.
+    The call runs in a copy of the request's context, so its spans join the request's trace.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(contextvars.copy_context().run, function, **kwargs))
+
+async def iterate_in_thread(iterator: Iterator) -> AsyncIterator:
+    """
+    Iterates a blocking iterator (MySQL reads) on the loop's executor.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, next, iterator, None)
+        if item is None:
+            return
+        yield item
+
+
+def iterate_from_loop(chunks: AsyncIterator, loop: asyncio.AbstractEventLoop) -> Iterator:
+    """
+    Iterates an async iterator of the serving loop (a request body) from an executor thread.
+    """
+    iterator = chunks.__aiter__()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(iterator.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+class QuartServer(Server):
+    """
+    Serves the route table of routes.py on the event loop: blocking calls run on the loop's executor and
+    plugin calls are made with aiohttp, see AsyncMarathon.
+    """
+    async def get_json(self):
+        return await self.request.get_json()
+
+
+    async def call(self, function: Callable, **kwargs):
+        return await in_thread(function, **kwargs)
+
+
+    def read_body(self) -> Iterator[bytes]:
+        return iterate_from_loop(chunks=self.request.body, loop=asyncio.get_running_loop())
+
+
+    def iterate(self, iterator: Iterator) -> AsyncIterator:
+        return iterate_in_thread(iterator=iterator)
+
+
+    async def run(self, test_dict: dict, version: str) -> dict:
+        return await async_marathon.run(test_dict=test_dict, version=version)
+
+
+    async def run_batch(self, batch_dict: dict) -> dict:
+        return await async_marathon.run_batch(batch_dict=batch_dict)
+
+
+    async def run_pipeline(self, pipeline_dict: dict) -> dict:
+        return await async_marathon.run_pipeline(pipeline_dict=pipeline_dict)
+
+
+    async def open_stream(self, test_dict: dict) -> AsyncIterator:
+        response = await async_marathon.open_stream(test_dict=test_dict)
+        return async_marathon.stream(test_dict=test_dict, response=response)
+
+
+    async def format_stream(self, chunks: AsyncIterator, sse: bool) -> AsyncIterator[str]:
+        try:
+            async for chunk in chunks:
+                text = format_stream_chunk(chunk=chunk, sse=sse)
+                if text is not None:
+                    yield text
+        except Exception as e:
+            if not sse:
+                raise
+            print("Exception:", e, str(e))
+            yield format_named_event(event="error", data_dict={"strerr": str(e)})
+
+
+server = QuartServer(tabularium=tabularium, request=request, response_class=Response)
+
+def make_view(handler: Callable) -> Callable:
+    async def view(**view_args) -> Response:
+        return await handler(server, **view_args)
+    return view
+
+register_routes(app=app, make_view=make_view)
+
+
+# Slow request profiling is left to apiserver.py, a profile of the event loop thread would mix concurrent requests
+@app.before_request
+async def start_telemetry():
+    start_request_telemetry(request=request, g=g, profiler=None)
+
+# After request functions also run for the error response of a failed request
+@app.after_request
+async def finish_telemetry(response: Response) -> Response:
+    return finish_request_telemetry(request=request, g=g, response=response, profiler=None)
+
+
+# INDEX
+@app.route('/', defaults={'path': ''})
+@app.route("/<path>")
+async def index(path):
+    """
+    Main route launching the React Frontend App.
+    """
+    return await send_from_directory(app.static_folder, 'index.html')
+
+
+if __name__ == "__main__":
+    # Production: hypercorn asgiserver:app --bind 0.0.0.0:5000
+    app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,116 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import os
+import json
+import asyncio
+import aiohttp
+from galeadispatcher import GaleaDispacher
+from metrics import galea_call_seconds, timed
+
+
+class AsyncGaleaDispacher():
+    """
+    Non-blocking counterpart of GaleaDispacher used by the ASGI server's release operations.
+
+    Calls go through a single aiohttp session on the serving event loop, so operations waiting on Galea
+    (chart pulls and installs take minutes) hold no thread. Settings, retries and the circuit breaker are
+    the wrapped GaleaDispacher's, so both dispatchers fail fast together while Galea is down.
+
+    Parameters:
+        dispatcher (GaleaDispacher): Dispatcher whose settings, retry logic and circuit breaker are used
+    """
+    def __init__(self, dispatcher: GaleaDispacher):
+        self.dispatcher = dispatcher
+        self.pool_size = int(os.getenv("GALEA_POOL_SIZE", "10"))
+        self.session = None
+
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the keep-alive session, created on first use so it belongs to the serving event loop.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self.session
+
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    async def request(self, method: str, path: str, idempotent: bool, read_timeout: float, **kwargs) -> bytes:
+        """
+        Sends a request to Galea and returns the response body, see GaleaDispacher.request.
+
+        Raises:
+            CircuitOpenError: Galea is considered down
+            aiohttp.ClientError: Connection error or non 2xx response
+            asyncio.TimeoutError: Timeout
+        """
+        dispatcher = self.dispatcher
+        attempts = dispatcher.get_attempts(idempotent=idempotent)
+        for attempt in range(attempts):
+            span = dispatcher.start_attempt(method=method, path=path, attempt=attempt)
+            try:
+                async with self.get_session().request(method=method, url=f"{dispatcher.galea_url}{path}",
+                                                      timeout=aiohttp.ClientTimeout(sock_connect=dispatcher.connect_timeout,
+                                                                                    sock_read=read_timeout),
+                                                      headers={"traceparent": span.get_traceparent()} if span is not None else None,
+                                                      **kwargs) as response:
+                    content = await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                dispatcher.finish_attempt(span=span, last=attempt == attempts - 1, error=e)
+            else:
+                if dispatcher.finish_attempt(span=span, last=attempt == attempts - 1, status_code=response.status):
+                    response.raise_for_status()
+                    return content
+
+            await asyncio.sleep(dispatcher.get_backoff(attempt=attempt))
+
+
+    @timed(galea_call_seconds, "install")
+    async def dispatch_install(self, release_name: str, repo_url: str, version: str) -> dict:
+        content = await self.request(method="POST", path="/releases", idempotent=False, read_timeout=self.dispatcher.install_timeout,
+                                     json=self.dispatcher.make_release_dict(name=release_name, repo_url=repo_url, version=version))
+        return json.loads(content)
+
+    @timed(galea_call_seconds, "read_all")
+    async def dispatch_read_all(self) -> dict:
+        content = await self.request(method="GET", path="/releases", idempotent=True, read_timeout=self.dispatcher.read_timeout)
+        return json.loads(content)
+
+    @timed(galea_call_seconds, "read")
+    async def dispatch_read(self, release_name: str) -> dict:
+        content = await self.request(method="GET", path=f"/releases/{release_name}", idempotent=True,
+                                     read_timeout=self.dispatcher.read_timeout)
+        return json.loads(content)
+
+    @timed(galea_call_seconds, "update")
+    async def dispatch_update(self, release_name: str, repo_url: str, version: str) -> dict:
+        content = await self.request(method="PUT", path=f"/releases/{release_name}", idempotent=False,
+                                     read_timeout=self.dispatcher.install_timeout,
+                                     json=self.dispatcher.make_release_dict(name=release_name, repo_url=repo_url, version=version))
+        return json.loads(content)
+
+    @timed(galea_call_seconds, "delete")
+    async def dispatch_delete(self, release_name: str) -> dict:
+        await self.request(method="DELETE", path=f"/releases/{release_name}", idempotent=True,
+                           read_timeout=self.dispatcher.install_timeout)
+        return {"msg": f"{release_name} release deleted."}
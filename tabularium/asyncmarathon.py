@@ -0,0 +1,190 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import time
+import codecs
+import asyncio
+import aiohttp
+from typing import AsyncIterator, Union
+from marathon import Marathon, make_trace_headers
+
+
+class AsyncMarathon():
+    """
+    Non-blocking counterpart of Marathon used by the ASGI server.
+
+    Plugin calls go through a single aiohttp session on the serving event loop, so runs in flight
+    wait on sockets rather than on threads. Results, the run cache and settings are the wrapped
+    Marathon's, so both serving modes record and memoize runs the same way.
+
+    Parameters:
+        marathon (Marathon): Marathon whose results, run cache and settings are used
+    """
+    def __init__(self, marathon: Marathon):
+        self.marathon = marathon
+        # Bounds open connections to plugin services across all runs
+        self.max_in_flight = int(os.getenv("MARATHON_ASYNC_MAX_IN_FLIGHT", "512"))
+        self.session = None
+        # Bounds batch items in flight across all batch runs to the wrapped Marathon's max_in_flight, as its executor does
+        self.batch_semaphore = None
+
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the keep-alive session, created on first use so it belongs to the serving event loop.
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_in_flight))
+        return self.session
+
+
+    def get_batch_semaphore(self) -> asyncio.Semaphore:
+        """
+        Returns the batch items semaphore, created on first use so it belongs to the serving event loop.
+        """
+        if self.batch_semaphore is None:
+            self.batch_semaphore = asyncio.Semaphore(self.marathon.max_in_flight)
+        return self.batch_semaphore
+
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+    async def post_plugin(self, test_dict: dict, timeout: float = None) -> tuple:
+        """
+        Sends a test to its plugin service and returns the response's (status code, body).
+        """
+        with self.marathon.plugin_call(test_dict=test_dict, stream=False) as span:
+            async with self.get_session().post(url=self.marathon.make_url(test_dict=test_dict), json=test_dict,
+                                               timeout=aiohttp.ClientTimeout(total=timeout),
+                                               headers=make_trace_headers(span=span)) as response:
+                status, content = response.status, await response.read()
+            if span is not None:
+                span.attributes["http.status_code"] = status
+
+        return status, content
+
+
+    async def call_plugin(self, test_dict: dict, timeout: float = None) -> str:
+        _, content = await self.post_plugin(test_dict=test_dict, timeout=timeout)
+
+        return content.decode('utf-8')
+
+
+    async def run(self, test_dict: dict, version: str = None) -> dict:
+        """
+        Runs a test, see Marathon.run.
+        """
+        key, generation, cached_result_dict = self.marathon.lookup_cached(test_dict=test_dict, version=version)
+        if cached_result_dict is not None:
+            return cached_result_dict
+
+        output = await self.call_plugin(test_dict=test_dict)
+
+        return self.marathon.record_run(test_dict=test_dict, output=output, key=key, generation=generation)
+
+
+    async def open_stream(self, test_dict: dict) -> aiohttp.ClientResponse:
+        """
+        Sends a test to its plugin service without reading the response body yet.
+        """
+        with self.marathon.plugin_call(test_dict=test_dict, stream=True) as span:
+            response = await self.get_session().post(url=self.marathon.make_url(test_dict=test_dict), json=test_dict,
+                                                     timeout=aiohttp.ClientTimeout(total=None, sock_read=self.marathon.run_timeout),
+                                                     headers=make_trace_headers(span=span))
+            if span is not None:
+                span.attributes["http.status_code"] = response.status
+
+        return response
+
+
+    async def stream(self, test_dict: dict, response: aiohttp.ClientResponse) -> AsyncIterator[Union[str, dict]]:
+        """
+        Yields the plugin output as it arrives, then the recorded result dict once the plugin is done.
+        Abandoned streams are not recorded.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output_parts = []
+        try:
+            async for chunk in response.content.iter_any():
+                text = decoder.decode(chunk)
+                if text:
+                    output_parts.append(text)
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                output_parts.append(text)
+                yield text
+        finally:
+            response.release()
+
+        yield self.marathon.record_run(test_dict=test_dict, output="".join(output_parts))
+
+
+    async def call_batch_item(self, test_dict: dict, timeout: float) -> str:
+        async with self.get_batch_semaphore():
+            return await self.call_plugin(test_dict=test_dict, timeout=timeout)
+
+
+    async def run_item(self, test_dict: dict, timeout: float) -> dict:
+        """
+        Runs one batch item, see Marathon.run_item. The timeout covers waiting for a free slot.
+        """
+        start = time.perf_counter()
+        try:
+            output, error = await asyncio.wait_for(self.call_batch_item(test_dict=test_dict, timeout=timeout), timeout=timeout), None
+        except asyncio.TimeoutError:
+            output, error = None, self.marathon.make_timeout_error(timeout=timeout)
+        except Exception as e:
+            output, error = None, str(e) or type(e).__name__
+
+        return self.marathon.record_item(test_dict=test_dict, output=output, error=error, latency=time.perf_counter() - start)
+
+
+    async def run_batch(self, batch_dict: dict) -> dict:
+        """
+        Runs several tests concurrently, see Marathon.run_batch.
+        """
+        items = self.marathon.make_batch_items(batch_dict=batch_dict)
+
+        start = time.perf_counter()
+        results_list = await asyncio.gather(*[self.run_item(test_dict=test_dict, timeout=timeout) for test_dict, timeout in items])
+
+        return  {
+                    "results": list(results_list),
+                    "latency": time.perf_counter() - start
+                }
+
+
+    async def run_pipeline(self, pipeline_dict: dict) -> dict:
+        """
+        Runs a prompt through an ordered chain of plugins, see Marathon.run_pipeline.
+        """
+        steps = self.marathon.step_pipeline(pipeline_dict=pipeline_dict)
+        answer = None
+        while True:
+            try:
+                test_dict, timeout = steps.send(answer)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                answer = await self.post_plugin(test_dict=test_dict, timeout=timeout)
+            except Exception as e:
+                answer = e
@@ -0,0 +1,192 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import bisect
+import threading
+from typing import Union
+from snapshot import Snapshot, get_snapshot
+
+
+class PluginCatalog():
+    """
+    In-memory plugin catalog indexed by id, by (name, version) and by name.
+
+    Plugin dicts have the same shape as the ones returned by Tabularium.read_plugin. The
+    {"plugins": [...]} listing and its serialized snapshot are rebuilt lazily, only after the catalog changed.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.plugins_by_id = {}
+        self.plugin_ids_by_name_and_version = {}
+        self.plugin_ids_by_name = {}
+        self.max_id = 0
+        self.plugins_dict = None
+        # Ids of the plugins in the listing, in the same order, rebuilt with it
+        self.plugin_ids = None
+        self.plugins_snapshot = None
+
+
+    def load(self, plugins_list: list):
+        """
+        Replaces the whole catalog (explicit resync).
+
+        Arguments:
+            plugins_list (list): Plugin dicts as returned by Tabularium.read_plugins
+        """
+        plugins_by_id = {}
+        plugin_ids_by_name_and_version = {}
+        plugin_ids_by_name = {}
+        for plugin_dict in sorted(plugins_list, key=lambda plugin_dict: plugin_dict["plugin"]["id"]):
+            plugins_by_id[plugin_dict["plugin"]["id"]] = plugin_dict
+            plugin_ids_by_name_and_version[(plugin_dict["plugin"]["name"], plugin_dict["plugin"]["version"])] = plugin_dict["plugin"]["id"]
+            plugin_ids_by_name[plugin_dict["plugin"]["name"]] = plugin_dict["plugin"]["id"]
+
+        with self.lock:
+            self.plugins_by_id = plugins_by_id
+            self.plugin_ids_by_name_and_version = plugin_ids_by_name_and_version
+            self.plugin_ids_by_name = plugin_ids_by_name
+            self.max_id = max(plugins_by_id, default=0)
+            self.plugins_dict = None
+
+
+    def upsert(self, plugin_dict: dict):
+        """
+        Inserts or replaces a single plugin.
+
+        Arguments:
+            plugin_dict (dict): Plugin dict as returned by Tabularium.read_plugin
+        """
+        plugin_id = plugin_dict["plugin"]["id"]
+        with self.lock:
+            self.discard_name_and_version(plugin_id=plugin_id)
+            is_out_of_order = plugin_id not in self.plugins_by_id and plugin_id < self.max_id
+            self.plugins_by_id[plugin_id] = plugin_dict
+            # Ids are auto-incremented so new plugins normally land at the end and the listing stays sorted
+            if is_out_of_order:
+                self.plugins_by_id = dict(sorted(self.plugins_by_id.items()))
+            self.max_id = max(self.max_id, plugin_id)
+            self.plugin_ids_by_name_and_version[(plugin_dict["plugin"]["name"], plugin_dict["plugin"]["version"])] = plugin_id
+            self.plugin_ids_by_name[plugin_dict["plugin"]["name"]] = plugin_id
+            self.plugins_dict = None
+
+
+    def remove(self, plugin_id: int):
+        """
+        Removes a single plugin if present.
+        """
+        with self.lock:
+            self.discard_name_and_version(plugin_id=plugin_id)
+            if self.plugins_by_id.pop(plugin_id, None) is not None:
+                self.plugins_dict = None
+
+
+    def discard_name_and_version(self, plugin_id: int):
+        """
+        Drops the (name, version) and name index entries of a stored plugin. Must be called holding the lock.
+        The name entry moves to the latest other version of the same name, if any is still stored.
+        """
+        plugin_dict = self.plugins_by_id.get(plugin_id)
+        if plugin_dict is None:
+            return
+        key = (plugin_dict["plugin"]["name"], plugin_dict["plugin"]["version"])
+        if self.plugin_ids_by_name_and_version.get(key) == plugin_id:
+            del self.plugin_ids_by_name_and_version[key]
+        name = plugin_dict["plugin"]["name"]
+        if self.plugin_ids_by_name.get(name) == plugin_id:
+            del self.plugin_ids_by_name[name]
+            # As in load, the name points at the highest id among its versions
+            for other_id, other_dict in reversed(list(self.plugins_by_id.items())):
+                if other_id != plugin_id and other_dict["plugin"]["name"] == name:
+                    self.plugin_ids_by_name[name] = other_id
+                    break
+
+
+    def get(self, plugin_id: int) -> Union[dict, None]:
+        """
+        Returns the plugin dict for an id, or None.
+        """
+        return self.plugins_by_id.get(plugin_id)
+
+
+    def find(self, name: str, version: str) -> Union[dict, None]:
+        """
+        Returns the plugin dict for a name and version, or None.
+        """
+        with self.lock:
+            plugin_id = self.plugin_ids_by_name_and_version.get((name, version))
+            if plugin_id is None:
+                return None
+            return self.plugins_by_id.get(plugin_id)
+
+
+    def find_by_name(self, name: str) -> Union[dict, None]:
+        """
+        Returns the plugin dict for a name (the release name plugins are run by), or None.
+        """
+        with self.lock:
+            plugin_id = self.plugin_ids_by_name.get(name)
+            if plugin_id is None:
+                return None
+            return self.plugins_by_id.get(plugin_id)
+
+
+    def to_dict(self) -> dict:
+        """
+        Returns the catalog as {"plugins": [...]} ordered by id.
+        """
+        with self.lock:
+            if self.plugins_dict is None:
+                self.plugins_dict = {
+                                        "plugins": list(self.plugins_by_id.values())
+                                    }
+                self.plugin_ids = list(self.plugins_by_id)
+            return self.plugins_dict
+
+
+    def get_page(self, after_id: int, limit: int, name_prefix: str = None, version: str = None) -> list:
+        """
+        Returns up to limit plugin dicts with an id above after_id, ordered by id, optionally filtered
+        by name prefix and version, mirroring MySQLManager.read_plugins_page.
+        Both filters ignore case, as MySQL compares with the case-insensitive default collation.
+        """
+        if name_prefix:
+            name_prefix = name_prefix.casefold()
+        if version is not None:
+            version = version.casefold()
+        with self.lock:
+            plugins_list = self.to_dict()["plugins"]
+            plugin_ids = self.plugin_ids
+
+        page_list = []
+        for index in range(bisect.bisect_right(plugin_ids, after_id), len(plugins_list)):
+            plugin_dict = plugins_list[index]
+            if name_prefix and not plugin_dict["plugin"]["name"].casefold().startswith(name_prefix):
+                continue
+            if version is not None and plugin_dict["plugin"]["version"].casefold() != version:
+                continue
+            page_list.append(plugin_dict)
+            if len(page_list) == limit:
+                break
+        return page_list
+
+
+    def to_snapshot(self) -> Snapshot:
+        """
+        Returns the serialized {"plugins": [...]} listing, serialized again only after the catalog changed.
+        """
+        # Serialized outside the lock, a concurrent caller at worst serializes the same listing twice
+        self.plugins_snapshot = get_snapshot(snapshot=self.plugins_snapshot, source=self.to_dict())
+        return self.plugins_snapshot
@@ -0,0 +1,97 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import threading
+
+
+closed = "closed"
+open_ = "open"
+half_open = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a downstream service while its circuit is open.
+    """
+
+
+class CircuitBreaker():
+    """
+    Fails calls fast after repeated downstream failures.
+
+    The circuit opens after failure_threshold consecutive failures. Once reset_timeout seconds
+    have passed, a single trial call is let through (half open): success closes the circuit,
+    failure opens it again.
+
+    Parameters:
+        name (str): Downstream service name used in error messages
+        failure_threshold (int): Consecutive failures opening the circuit
+        reset_timeout (float): Seconds the circuit stays open before a trial call
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = None
+
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError when the call must not go through.
+        """
+        with self.lock:
+            if self.state == closed:
+                return
+            now = time.monotonic()
+            if self.state == open_ and now - self.opened_at >= self.reset_timeout:
+                self.state = half_open
+                self.trial_started_at = None
+            # A trial that never reported back does not keep the circuit half open forever
+            if self.state == half_open and (self.trial_started_at is None or
+                                            now - self.trial_started_at >= self.reset_timeout):
+                self.trial_started_at = now
+                return
+            raise CircuitOpenError(f"{self.name} circuit is open after {self.failures} consecutive failures")
+
+
+    def record_success(self):
+        with self.lock:
+            self.state = closed
+            self.failures = 0
+            self.trial_started_at = None
+
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == half_open or self.failures >= self.failure_threshold:
+                self.state = open_
+                self.opened_at = time.monotonic()
+            self.trial_started_at = None
+
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return  {
+                        "name": self.name,
+                        "state": self.state,
+                        "failures": self.failures
+                    }
@@ -14,13 +14,48 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import os
 import json
+import time
+import random
 import requests
+from typing import Union
+from requests.adapters import HTTPAdapter
+from circuitbreaker import CircuitBreaker
+from metrics import galea_call_seconds, timed
+from tracing import tracer, client, Span
+
+
+# Responses meaning Galea itself is unavailable rather than the Helm operation failing
+unavailable_status_codes = (502, 503, 504)
 
 
 class GaleaDispacher():
+    """
+    Dispatches release operations to Galea over a keep-alive session.
+
+    Idempotent calls (read_all, read, delete) are retried with jittered exponential backoff on
+    connection errors, timeouts and unavailable responses. Installs and upgrades are never retried.
+    A circuit breaker fails every call fast while Galea is down.
+    """
     def __init__(self):
-        self.galea_url = "http://galea.default.svc.cluster.local:80"
+        self.galea_url = os.getenv("GALEA_URL", "http://galea.default.svc.cluster.local:80")
+        self.connect_timeout = float(os.getenv("GALEA_CONNECT_TIMEOUT", "3.05"))
+        self.read_timeout = float(os.getenv("GALEA_READ_TIMEOUT", "30"))
+        # Chart pulls and installs take much longer than reads
+        self.install_timeout = float(os.getenv("GALEA_INSTALL_TIMEOUT", "600"))
+        self.retries = int(os.getenv("GALEA_RETRIES", "3"))
+        self.backoff = float(os.getenv("GALEA_BACKOFF", "0.2"))
+        self.backoff_max = float(os.getenv("GALEA_BACKOFF_MAX", "5"))
+
+        pool_size = int(os.getenv("GALEA_POOL_SIZE", "10"))
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        self.circuit_breaker = CircuitBreaker(name="galea",
+                                              failure_threshold=int(os.getenv("GALEA_BREAKER_THRESHOLD", "5")),
+                                              reset_timeout=float(os.getenv("GALEA_BREAKER_RESET_TIMEOUT", "30")))
     
 
     def make_release_dict(self, name: str, repo_url: str, version: str) -> dict:
@@ -34,29 +69,103 @@ class GaleaDispacher():
                 }
 
 
+    def get_attempts(self, idempotent: bool) -> int:
+        return self.retries + 1 if idempotent else 1
+
+
+    def start_attempt(self, method: str, path: str, attempt: int) -> Union[Span, None]:
+        """
+        Lets an attempt through the circuit breaker and opens its span (None outside of a trace),
+        whose traceparent header Galea continues.
+
+        Raises:
+            CircuitOpenError: Galea is considered down
+        """
+        self.circuit_breaker.before_call()
+        return tracer.start_span(name=f"{method} {path}", kind=client, attributes={"http.method": method, "attempt": attempt})
+
+
+    def finish_attempt(self, span: Union[Span, None], last: bool, status_code: int = None, error: Exception = None) -> bool:
+        """
+        Records an attempt's response status code, or the connection error or timeout it raised, in its span and
+        the circuit breaker. Returns whether the response is the call's answer rather than one to retry:
+        a response from an available Galea, or the last attempt's. The last attempt's error is raised.
+        """
+        if error is not None:
+            if span is not None:
+                tracer.finish_span(span=span, error=str(error) or type(error).__name__)
+            self.circuit_breaker.record_failure()
+            if last:
+                raise error
+            return False
+
+        if span is not None:
+            span.attributes["http.status_code"] = status_code
+            tracer.finish_span(span=span, error=f"HTTP {status_code}" if status_code >= 400 else None)
+        if status_code not in unavailable_status_codes:
+            self.circuit_breaker.record_success()
+            return True
+        self.circuit_breaker.record_failure()
+        return last
+
+
+    def get_backoff(self, attempt: int) -> float:
+        """
+        Returns the seconds to wait after a failed attempt. Full jitter keeps retries from several callers from landing together.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+
+
+    def request(self, method: str, path: str, idempotent: bool, read_timeout: float, **kwargs) -> requests.Response:
+        """
+        Sends a request to Galea through the circuit breaker, retrying idempotent ones.
+        Each attempt is traced as a span whose traceparent header Galea continues.
+
+        Raises:
+            CircuitOpenError: Galea is considered down
+            requests.RequestException: Connection error, timeout or non 2xx response
+        """
+        attempts = self.get_attempts(idempotent=idempotent)
+        for attempt in range(attempts):
+            span = self.start_attempt(method=method, path=path, attempt=attempt)
+            try:
+                response = self.session.request(method=method, url=f"{self.galea_url}{path}",
+                                                timeout=(self.connect_timeout, read_timeout),
+                                                headers={"traceparent": span.get_traceparent()} if span is not None else None,
+                                                **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.finish_attempt(span=span, last=attempt == attempts - 1, error=e)
+            else:
+                if self.finish_attempt(span=span, last=attempt == attempts - 1, status_code=response.status_code):
+                    response.raise_for_status()
+                    return response
+
+            time.sleep(self.get_backoff(attempt=attempt))
+
+
+    @timed(galea_call_seconds, "install")
     def dispatch_install(self, release_name: str, repo_url: str, version: str) -> dict:
-        response = requests.post(url=f"{self.galea_url}/releases",
-                                        json=self.make_release_dict(name=release_name, repo_url=repo_url, version=version),
-                                 timeout=None)
+        response = self.request(method="POST", path="/releases", idempotent=False, read_timeout=self.install_timeout,
+                                json=self.make_release_dict(name=release_name, repo_url=repo_url, version=version))
         return json.loads(response.content)
 
+    @timed(galea_call_seconds, "read_all")
     def dispatch_read_all(self) -> dict:
-        response = requests.get(url=f"{self.galea_url}/releases",
-                                timeout=None)
+        response = self.request(method="GET", path="/releases", idempotent=True, read_timeout=self.read_timeout)
         return json.loads(response.content)
 
+    @timed(galea_call_seconds, "read")
     def dispatch_read(self, release_name: str) -> dict:
-        response = requests.get(url=f"{self.galea_url}/releases/{release_name}",
-                                timeout=None)
+        response = self.request(method="GET", path=f"/releases/{release_name}", idempotent=True, read_timeout=self.read_timeout)
         return json.loads(response.content)
 
+    @timed(galea_call_seconds, "update")
     def dispatch_update(self, release_name: str, repo_url: str, version: str) -> dict:
-        response = requests.put(url=f"{self.galea_url}/releases/{release_name}",
-                                json=self.make_release_dict(name=release_name, repo_url=repo_url, version=version),
-                                timeout=None)
+        response = self.request(method="PUT", path=f"/releases/{release_name}", idempotent=False, read_timeout=self.install_timeout,
+                                json=self.make_release_dict(name=release_name, repo_url=repo_url, version=version))
         return json.loads(response.content)
 
+    @timed(galea_call_seconds, "delete")
     def dispatch_delete(self, release_name: str) -> dict:
-        response = requests.delete(url=f"{self.galea_url}/releases/{release_name}",
-                                   timeout=None)
-        return {"msg": f"{release_name} release deleted."}
\ No newline at end of file
+        self.request(method="DELETE", path=f"/releases/{release_name}", idempotent=True, read_timeout=self.install_timeout)
+        return {"msg": f"{release_name} release deleted."}
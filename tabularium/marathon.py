@@ -14,57 +14,464 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import os
+import json
+import codecs
+import time
+import contextvars
 import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterator, Generator, Union
+from resultstore import ResultStore
+from runcache import RunCache
+from metrics import plugin_call_seconds
+from tracing import tracer, client, Span
 
 
 release_cluster_url = ".default.svc.cluster.local:80"
 plugin_run_endpoint = "/run"
 
+
+def make_trace_headers(span: Union[Span, None]) -> Union[dict, None]:
+    """
+    Returns the headers continuing a plugin call's trace in the plugin, None outside of a trace.
+    """
+    return {"traceparent": span.get_traceparent()} if span is not None else None
+
+
+class PluginError(Exception):
+    """
+    Raised when a pipeline stage's plugin answers with an error status.
+    """
+
 class Marathon():
     """
     Manages test running.
     """
     def __init__(self):
-        self.results =  {
-                            "results": []
-                        }
+        self.results = ResultStore(max_results=int(os.getenv("MARATHON_RESULTS_MAX", "10000")),
+                                   max_bytes=int(os.getenv("MARATHON_RESULTS_MAX_MB", "64")) * 1024 * 1024,
+                                   max_age=float(os.getenv("MARATHON_RESULTS_MAX_AGE", "0")))
+        # Bounds plugin calls in flight across all batch runs
+        self.max_in_flight = int(os.getenv("MARATHON_MAX_IN_FLIGHT", "16"))
+        self.run_timeout = float(os.getenv("MARATHON_RUN_TIMEOUT", "60"))
+        self.stream_chunk_size = int(os.getenv("MARATHON_STREAM_CHUNK_SIZE", "8192"))
+        # Url plugins are run at, "{plugin}" standing for the plugin (release) name
+        self.plugin_url = os.getenv("MARATHON_PLUGIN_URL", "http://{plugin}" + release_cluster_url + plugin_run_endpoint)
+        # Opt-in memoization of /run results, disabled when the size is 0
+        run_cache_size = int(os.getenv("MARATHON_RUN_CACHE_SIZE", "0"))
+        self.run_cache = None
+        if run_cache_size > 0:
+            self.run_cache = RunCache(max_entries=run_cache_size, ttl=float(os.getenv("MARATHON_RUN_CACHE_TTL", "3600")))
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="marathon")
+        # Keep-alive connections to plugin services, reused across runs and pipeline stages
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=int(os.getenv("MARATHON_PLUGIN_HOSTS", "32")),
+                                                  pool_maxsize=self.max_in_flight))
     
 
     def get_results(self) -> dict:
-        return self.results
-    
+        """
+        Returns the latest result of every plugin.
+        """
+        return  {
+                    "results": self.results.get_latest_per_plugin()
+                }
+
 
     def get_result(self, plugin: str) -> dict:
-        for result in self.results["results"]:
-            if plugin == result["plugin"]:
-                return result
-        return {}
+        """
+        Returns a plugin's latest result, or an empty dict if it has none.
+        """
+        result_dict = self.results.get_latest(plugin=plugin)
+        return result_dict if result_dict is not None else {}
+
+
+    def get_result_history(self, plugin: str) -> dict:
+        """
+        Returns every retained result of a plugin, oldest first.
+        """
+        return  {
+                    "results": self.results.get_history(plugin=plugin)
+                }
+
+
+    def get_run(self, run_id: str) -> dict:
+        """
+        Returns the result of a single run, or an empty dict if it is unknown or was evicted.
+        """
+        result_dict = self.results.get(run_id=run_id)
+        return result_dict if result_dict is not None else {}
 
 
     def delete_result(self, plugin: str):
-        for result_index in range(len(self.results["results"])):
-            if plugin == self.results["results"][result_index]["result"]["plugin"]:
-                self.results["results"].pop(result_index)
-                break
+        self.results.remove_plugin(plugin=plugin)
+
+
+    def update_results(self, result_dict: dict) -> str:
+        return self.results.add(result_dict=result_dict)
+
+
+    def make_url(self, test_dict: dict) -> str:
+        return self.plugin_url.format(plugin=test_dict['test']['plugin'])
+
+
+    @contextmanager
+    def plugin_call(self, test_dict: dict, stream: bool) -> Iterator[Union[Span, None]]:
+        """
+        Times and traces a plugin call made inside the block, by this session or by AsyncMarathon's.
+        The block gets the call's span (None outside of a trace), see make_trace_headers.
+        """
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            with tracer.span(name=f"plugin {test_dict['test']['plugin']}", kind=client, attributes={"stream": stream}) as span:
+                yield span
+            outcome = "ok"
+        finally:
+            plugin_call_seconds.labels("streamed" if stream else "buffered", outcome).observe(time.perf_counter() - started_at)
 
 
-    def update_results(self, result_dict: dict):
-        self.delete_result(result_dict["result"]["plugin"])
-        self.results["results"].append(result_dict)
+    def post_plugin(self, test_dict: dict, timeout: float = None, stream: bool = False) -> requests.Response:
+        """
+        Sends a test to its plugin service over the shared session.
+        """
+        with self.plugin_call(test_dict=test_dict, stream=stream) as span:
+            response = self.session.post(url=self.make_url(test_dict=test_dict), json=test_dict, timeout=timeout, stream=stream,
+                                         headers=make_trace_headers(span=span))
+            if span is not None:
+                span.attributes["http.status_code"] = response.status_code
 
+        return response
 
-    def run(self, test_dict: dict) -> dict:
-        result = requests.post(url=f"http://{test_dict['test']['plugin']}{release_cluster_url}{plugin_run_endpoint}", json=test_dict, timeout=None)
+
+    def call_plugin(self, test_dict: dict, timeout: float = None) -> str:
+        """
+        Sends a test to its plugin service and returns the decoded output.
+        """
+        result = self.post_plugin(test_dict=test_dict, timeout=timeout)
+
+        return result.content.decode('utf-8')
+
+
+    def parse_stage_output(self, status_code: int, content: bytes) -> tuple:
+        """
+        Returns a pipeline stage's (output, blocked) from its plugin response.
+
+        A stage blocks the pipeline by answering 403, or a JSON object with "blocked": true.
+        A JSON object with an "output" string passes that string on, any other body is passed on as is.
+        """
+        output = content.decode('utf-8')
+        blocked = status_code == 403
+        try:
+            body = json.loads(output)
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            blocked = blocked or bool(body.get("blocked", False))
+            if isinstance(body.get("output"), str):
+                output = body["output"]
+        if not blocked and status_code >= 400:
+            raise PluginError(f"Plugin answered with status {status_code}")
+
+        return output, blocked
+
+
+    def get_timeout(self, request_dict: dict, default: float = None) -> float:
+        return float(request_dict.get("timeout", self.run_timeout if default is None else default))
+
+
+    def lookup_cached(self, test_dict: dict, version: str = None) -> tuple:
+        """
+        Returns (key, generation, cached result dict) for a run, key being None when the run is not memoized.
+        """
+        if self.run_cache is None or version is None:
+            return None, None, None
+
+        key = self.run_cache.make_key(plugin=test_dict["test"]["plugin"],
+                                      version=version,
+                                      prompt=test_dict["test"]["prompt"],
+                                      parameters=test_dict["test"]["parameters"])
+        generation = self.run_cache.get_generation(plugin=test_dict["test"]["plugin"])
+        cached_result_dict = self.run_cache.get(key=key)
+        if cached_result_dict is not None:
+            cached_result_dict =    {
+                                        "result": dict(cached_result_dict["result"], cached=True)
+                                    }
+
+        return key, generation, cached_result_dict
+
+
+    def record_run(self, test_dict: dict, output: str, key: str = None, generation: tuple = None) -> dict:
+        """
+        Records a run's result, memoizing it when a cache key is given.
+        """
         result_dict =   {
                             "result": 
                                 {
                                     "plugin": test_dict["test"]["plugin"],
                                     "prompt": test_dict["test"]["prompt"],
-                                    "parameters": test_dict["test"]["parameters"],
-                                    "output": result.content.decode('utf-8')
+                                    "parameters": test_dict["test"].get("parameters", {}),
+                                    "output": output
                                 }
                         }
         
         self.update_results(result_dict=result_dict)
+        if key is not None:
+            self.run_cache.put(key=key, plugin=test_dict["test"]["plugin"], result_dict=result_dict, generation=generation)
+
+        return result_dict
+
+
+    def run(self, test_dict: dict, version: str = None) -> dict:
+        """
+        Runs a test. When the run cache is enabled and the plugin version is known, a result already
+        obtained for the same plugin version, prompt and parameters is returned with "cached": true
+        instead of calling the plugin again.
+        """
+        key, generation, cached_result_dict = self.lookup_cached(test_dict=test_dict, version=version)
+        if cached_result_dict is not None:
+            return cached_result_dict
+
+        output = self.call_plugin(test_dict=test_dict)
+
+        return self.record_run(test_dict=test_dict, output=output, key=key, generation=generation)
+
+
+    def invalidate(self, plugin: str):
+        """
+        Drops memoized results of a plugin after it changed.
+        """
+        if self.run_cache is not None:
+            self.run_cache.invalidate(plugin=plugin)
+
+
+    def open_stream(self, test_dict: dict) -> requests.Response:
+        """
+        Sends a test to its plugin service without reading the response body yet.
+        """
+        return self.post_plugin(test_dict=test_dict, timeout=self.run_timeout, stream=True)
+
+
+    def stream(self, test_dict: dict, result: requests.Response) -> Iterator[Union[str, dict]]:
+        """
+        Yields the plugin output as it arrives, then the recorded result dict once the plugin is done.
+        Abandoned streams are not recorded.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output_parts = []
+        with result:
+            # read1 hands over whatever has arrived instead of waiting for a full buffer
+            if hasattr(result.raw, "read1"):
+                chunks = iter(lambda: result.raw.read1(self.stream_chunk_size, decode_content=True), b"")
+            else:
+                chunks = result.iter_content(chunk_size=None)
+            for chunk in chunks:
+                text = decoder.decode(chunk)
+                if text:
+                    output_parts.append(text)
+                    yield text
+            text = decoder.decode(b"", final=True)
+            if text:
+                output_parts.append(text)
+                yield text
+
+        yield self.record_run(test_dict=test_dict, output="".join(output_parts))
+
+
+    def record_item(self, test_dict: dict, output: str, error: str, latency: float) -> dict:
+        """
+        Builds a batch item's result, recording it if the plugin call succeeded.
+        """
+        result_dict =   {
+                            "result":
+                                {
+                                    "plugin": test_dict["test"]["plugin"],
+                                    "prompt": test_dict["test"]["prompt"],
+                                    "parameters": test_dict["test"].get("parameters", {}),
+                                    "output": output,
+                                    "status": "failed" if error is not None else "succeeded",
+                                    "error": error,
+                                    "latency": latency
+                                }
+                        }
+        if error is None:
+            self.update_results(result_dict=result_dict)
+
+        return result_dict
+
+
+    def run_item(self, test_dict: dict, timeout: float, submitted_at: float) -> dict:
+        """
+        Runs one batch item, reporting failures and latency in the result instead of raising.
+        The item has timeout seconds from submitted_at, time spent waiting for a worker included.
+        """
+        deadline = submitted_at + timeout
+        try:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(self.make_timeout_error(timeout=timeout))
+            output, error = self.call_plugin(test_dict=test_dict, timeout=remaining), None
+            # Reported as timed out by run_batch already, so not recorded
+            if time.perf_counter() > deadline:
+                raise TimeoutError(self.make_timeout_error(timeout=timeout))
+        except Exception as e:
+            output, error = None, str(e)
+
+        return self.record_item(test_dict=test_dict, output=output, error=error, latency=time.perf_counter() - submitted_at)
+
+
+    def make_timeout_error(self, timeout: float) -> str:
+        return f"Timed out after {timeout:g}s"
+
+
+    def make_batch_items(self, batch_dict: dict) -> list:
+        """
+        Expands a batch request into its (test dict, timeout) items.
+
+        Arguments:
+            batch_dict (dict): Either {"test": {"prompt", "plugins": [...], "parameters"}} fanning one prompt out
+                               to several plugins, or {"tests": [{"test": {"plugin", "prompt", "parameters"}}, ...]}.
+                               An optional "timeout" (seconds) applies to every item, items of "tests" may set
+                               their own "timeout" instead.
+        """
+        timeout = self.get_timeout(request_dict=batch_dict)
+        if "tests" in batch_dict:
+            return [({"test": item["test"]}, self.get_timeout(request_dict=item, default=timeout)) for item in batch_dict["tests"]]
+        return [({"test": {"plugin": plugin,
+                           "prompt": batch_dict["test"]["prompt"],
+                           "parameters": batch_dict["test"].get("parameters", {})}}, timeout)
+                for plugin in batch_dict["test"]["plugins"]]
+
+
+    def run_batch(self, batch_dict: dict) -> dict:
+        """
+        Runs several tests concurrently and returns per-item results and latencies in request order.
+        Items still unfinished timeout seconds after the batch started are reported as failed.
+        See make_batch_items for the accepted batch dicts.
+        """
+        items = self.make_batch_items(batch_dict=batch_dict)
+
+        start = time.perf_counter()
+        # Items run in a copy of the request's context so their plugin calls join its trace
+        futures = [self.executor.submit(contextvars.copy_context().run, self.run_item, test_dict, timeout, start)
+                   for test_dict, timeout in items]
+        results_list = []
+        for (test_dict, timeout), future in zip(items, futures):
+            try:
+                results_list.append(future.result(timeout=max(0, start + timeout - time.perf_counter())))
+            except FutureTimeoutError:
+                # Frees the worker if the item is still waiting for one
+                future.cancel()
+                results_list.append(self.record_item(test_dict=test_dict, output=None, error=self.make_timeout_error(timeout=timeout),
+                                                     latency=time.perf_counter() - start))
+
+        return  {
+                    "results": results_list,
+                    "latency": time.perf_counter() - start
+                }
+
+
+    def make_stages(self, pipeline_dict: dict) -> list:
+        """
+        Returns a pipeline request's stages as [{"plugin", "parameters"}, ...].
+
+        Arguments:
+            pipeline_dict (dict): {"pipeline": {"prompt", "stages": [{"plugin", "parameters"}, ...]}}, or
+                                  {"pipeline": {"prompt", "plugins": [...], "parameters"}} sharing parameters
+                                  across stages. An optional "timeout" (seconds) applies to every stage.
+        """
+        pipeline = pipeline_dict["pipeline"]
+        if "stages" in pipeline:
+            return pipeline["stages"]
+        return [{"plugin": plugin, "parameters": pipeline.get("parameters", {})} for plugin in pipeline["plugins"]]
+
+
+    def record_stage(self, test_dict: dict, output: str, blocked: bool, error: str, latency: float) -> dict:
+        """
+        Builds a pipeline stage's report, recording the stage's result if it let the prompt through.
+        """
+        stage_dict =    {
+                            "plugin": test_dict["test"]["plugin"],
+                            "prompt": test_dict["test"]["prompt"],
+                            "output": output,
+                            "status": "failed" if error is not None else "blocked" if blocked else "succeeded",
+                            "error": error,
+                            "latency": latency
+                        }
+        if stage_dict["status"] == "succeeded":
+            stage_dict["id"] = self.update_results(result_dict={"result": {"plugin": test_dict["test"]["plugin"],
+                                                                           "prompt": test_dict["test"]["prompt"],
+                                                                           "parameters": test_dict["test"]["parameters"],
+                                                                           "output": output}})
+
+        return stage_dict
+
+
+    def make_pipeline_dict(self, pipeline_dict: dict, stages_list: list, latency: float) -> dict:
+        status = stages_list[-1]["status"] if stages_list else "succeeded"
+        return  {
+                    "pipeline":
+                        {
+                            "prompt": pipeline_dict["pipeline"]["prompt"],
+                            "output": (stages_list[-1]["output"] if stages_list else pipeline_dict["pipeline"]["prompt"])
+                                      if status == "succeeded" else None,
+                            "status": status,
+                            "stages": stages_list,
+                            "latency": latency
+                        }
+                }
+
+
+    def step_pipeline(self, pipeline_dict: dict) -> Generator[tuple, Union[tuple, Exception], dict]:
+        """
+        Runs a pipeline's logic without calling plugins: yields each stage's (test dict, timeout) and is sent back
+        the plugin's (status code, body), or the exception its call raised. Returns the pipeline dict.
+        run_pipeline and AsyncMarathon.run_pipeline drive it with their own plugin calls.
+        """
+        timeout = self.get_timeout(request_dict=pipeline_dict)
+
+        prompt = pipeline_dict["pipeline"]["prompt"]
+        stages_list = []
+        start = time.perf_counter()
+        for stage in self.make_stages(pipeline_dict=pipeline_dict):
+            test_dict = {"test": {"plugin": stage["plugin"],
+                                  "prompt": prompt,
+                                  "parameters": stage.get("parameters", {})}}
+            stage_start = time.perf_counter()
+            answer = yield test_dict, timeout
+            try:
+                if isinstance(answer, Exception):
+                    raise answer
+                output, blocked = self.parse_stage_output(status_code=answer[0], content=answer[1])
+                error = None
+            except Exception as e:
+                output, blocked, error = None, False, str(e) or type(e).__name__
+            stages_list.append(self.record_stage(test_dict=test_dict, output=output, blocked=blocked, error=error,
+                                                 latency=time.perf_counter() - stage_start))
+            if stages_list[-1]["status"] != "succeeded":
+                break
+            prompt = output
+
+        return self.make_pipeline_dict(pipeline_dict=pipeline_dict, stages_list=stages_list, latency=time.perf_counter() - start)
+
 
-        return result_dict
\ No newline at end of file
+    def run_pipeline(self, pipeline_dict: dict) -> dict:
+        """
+        Runs a prompt through an ordered chain of plugins, each stage's output being the next stage's prompt.
+        The chain stops at the first stage that blocks or fails. See make_stages for the accepted pipeline dicts.
+        """
+        steps = self.step_pipeline(pipeline_dict=pipeline_dict)
+        answer = None
+        while True:
+            try:
+                test_dict, timeout = steps.send(answer)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result = self.post_plugin(test_dict=test_dict, timeout=timeout)
+                answer = result.status_code, result.content
+            except Exception as e:
+                answer = e
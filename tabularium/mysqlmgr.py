@@ -15,8 +15,43 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
-from typing import Union
+import functools
+from typing import Callable, Union
+from pymysql.err import InterfaceError, OperationalError
 from flaskext.mysql import MySQL
+from mysqlpool import MySQLConnectionPool
+from metrics import query_seconds, timed
+
+
+# Client errors for a connection the server closed or could not be reached on, and the server's own inactivity timeout
+connection_error_codes = (2003, 2006, 2013, 2055, 4031)
+
+
+def is_connection_error(e: Exception) -> bool:
+    """
+    Returns whether an exception means the connection is broken, rather than the query failing.
+    """
+    if isinstance(e, InterfaceError):
+        return True
+    return isinstance(e, OperationalError) and bool(e.args) and e.args[0] in connection_error_codes
+
+
+def retried(method: Callable) -> Callable:
+    """
+    Decorator running an idempotent query method once more when its connection turns out to be broken.
+    The pool pings the connections idle since the error, so the retry gets a live one.
+    Writes are not retried, a statement lost with its connection may have been applied.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            print("Exception:", e, str(e))
+        return method(*args, **kwargs)
+    return wrapper
 
 
 class MySQLManager():
@@ -27,7 +62,8 @@ class MySQLManager():
         app: Flask class instance holding config data
     """
     def __init__(self, app):
-        self.mysql = MySQL()
+        # Autocommit keeps pooled connections from pinning a stale read snapshot between requests
+        self.mysql = MySQL(autocommit=True)
         self.app = app
         self.app.config["MYSQL_DATABASE_USER"] = "root"
         self.app.config["MYSQL_DATABASE_PASSWORD"] = os.getenv("db_root_password")
@@ -35,21 +71,134 @@ class MySQLManager():
         self.app.config["MYSQL_DATABASE_HOST"] = os.getenv("MYSQL_SERVICE_HOST")
         self.app.config["MYSQL_DATABASE_PORT"] = int(os.getenv("MYSQL_SERVICE_PORT"))
         self.mysql.init_app(self.app)
+        self.pool = MySQLConnectionPool(connect=self.mysql.connect,
+                                        max_size=int(os.getenv("MYSQL_POOL_SIZE", "10")),
+                                        max_idle_time=float(os.getenv("MYSQL_POOL_MAX_IDLE_TIME", "300")),
+                                        max_lifetime=float(os.getenv("MYSQL_POOL_MAX_LIFETIME", "3600")),
+                                        health_check_interval=float(os.getenv("MYSQL_POOL_HEALTH_CHECK_INTERVAL", "30")),
+                                        timeout=float(os.getenv("MYSQL_POOL_TIMEOUT", "30")),
+                                        is_connection_error=is_connection_error)
 
 
     def reinit_mysql(self):
         """
         Reinitialisation function for MySQL connection in case the service fails or suffers modifications resulting in rollout.
+        Broken connections are already replaced by the pool on checkout, this is only needed when the endpoint itself changes.
         """
         self.app.config["MYSQL_DATABASE_USER"] = "root"
         self.app.config["MYSQL_DATABASE_PASSWORD"] = os.getenv("db_root_password")
         self.app.config["MYSQL_DATABASE_DB"] = os.getenv("db_name")
         self.app.config["MYSQL_DATABASE_HOST"] = os.getenv("MYSQL_SERVICE_HOST")
         self.app.config["MYSQL_DATABASE_PORT"] = int(os.getenv("MYSQL_SERVICE_PORT"))
-        self.mysql.init_app(self.app)
+        self.pool.reset()
+
+
+    def get_pool_stats(self) -> dict:
+        """
+        Returns connection pool statistics (size, in use, waiters, wait time).
+        """
+        return self.pool.get_stats()
+
+
+    # CHANGE LOG
+    @timed(query_seconds, "ensure_change_log")
+    @retried
+    def ensure_change_log(self):
+        """
+        Creates the 'plugin_changes' and 'plugin_change_prunes' tables on databases initialised before they existed.
+        """
+        changes_query = "CREATE TABLE IF NOT EXISTS plugin_changes (" \
+                        "id BIGINT NOT NULL AUTO_INCREMENT, " \
+                        "plugin_id INT NOT NULL, " \
+                        "changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, " \
+                        "PRIMARY KEY (id))"
+        prunes_query = "CREATE TABLE IF NOT EXISTS plugin_change_prunes (" \
+                       "pruned_through BIGINT NOT NULL, " \
+                       "PRIMARY KEY (pruned_through))"
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=changes_query)
+            cursor.execute(query=prunes_query)
+
+
+    def log_change(self, cursor, plugin_id: int):
+        """
+        Records that a plugin was created, updated or deleted, using the given cursor, without committing.
+        Other workers poll 'plugin_changes' to refresh their catalog.
+
+        Arguments:
+            cursor: Cursor of the ongoing transaction
+            plugin_id (int): Plugin id
+        """
+        query = "INSERT INTO plugin_changes(plugin_id) " \
+                "VALUES(%s)"
+        args = (plugin_id)
+
+        cursor.execute(query=query, args=args)
+
+
+    @timed(query_seconds, "read_changes")
+    @retried
+    def read_changes(self, after_id: int) -> tuple:
+        """
+        Returns the change log entries following after_id, along with the id up to which the log was pruned.
+
+        Returns:
+            changes_tuple (tuple): ((id, plugin_id), ...) ordered by id
+            pruned_through (int): Largest id pruned from the log, 0 when it never was
+        """
+        query = "SELECT id, plugin_id FROM plugin_changes " \
+                "WHERE id>%s " \
+                "ORDER BY id"
+        args = (after_id)
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            changes_tuple = cursor.fetchall()
+            cursor.execute(query="SELECT MAX(pruned_through) FROM plugin_change_prunes")
+            pruned_through = cursor.fetchone()[0]
+
+        return changes_tuple, pruned_through or 0
+
+
+    @timed(query_seconds, "read_last_change_id")
+    @retried
+    def read_last_change_id(self) -> int:
+        """
+        Returns the id of the latest change log entry, or of the latest pruned one when the log is empty.
+        """
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query="SELECT MAX(id) FROM plugin_changes")
+            last_id = cursor.fetchone()[0]
+            cursor.execute(query="SELECT MAX(pruned_through) FROM plugin_change_prunes")
+            pruned_through = cursor.fetchone()[0]
+
+        return max(last_id or 0, pruned_through or 0)
+
+
+    @timed(query_seconds, "prune_changes")
+    def prune_changes(self, retention: float):
+        """
+        Deletes change log entries older than retention seconds, recording the largest pruned id in
+        'plugin_change_prunes' so workers can tell pruned entries from ids that were never committed.
+        """
+        pruned_through_query = "SELECT MAX(id) FROM plugin_changes " \
+                               "WHERE changed_at < NOW() - INTERVAL %s SECOND"
+        pruned_through_args = (int(retention))
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            connector.begin()
+            cursor.execute(query=pruned_through_query, args=pruned_through_args)
+            pruned_through = cursor.fetchone()[0]
+            if pruned_through is not None:
+                cursor.execute(query="DELETE FROM plugin_changes WHERE id<=%s", args=(pruned_through))
+                cursor.execute(query="DELETE FROM plugin_change_prunes WHERE pruned_through<=%s", args=(pruned_through))
+                cursor.execute(query="INSERT INTO plugin_change_prunes(pruned_through) VALUES(%s)", args=(pruned_through))
+            connector.commit()
 
 
     # CREATE
+    @timed(query_seconds, "create_plugin")
     def create_plugin(self, name: str, repo_url: str, version: str):
         """
         Creates plugin entry into the 'plugins' table.
@@ -59,20 +208,16 @@ class MySQLManager():
             repo_url (str): Plugin repository url
             version (str): Plugin version
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "INSERT INTO plugins(name, repo_url, version) " \
                 "VALUES(%s, %s, %s)"
         args = (name, repo_url, version)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
-        
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
 
 
+    @timed(query_seconds, "create_parameter")
     def create_parameter(self,
                          plugin_id: int,
                          parameter_key: str, parameter_type: str,
@@ -89,9 +234,6 @@ class MySQLManager():
             is_mandatory (bool): Argument indicating if parameter is mandatory
             is_read_only (bool): Argument indicating if parameter is read only
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "INSERT INTO parameters(plugin_id, " \
                 "parameter_key, parameter_type, " \
                 "default_value, " \
@@ -99,11 +241,106 @@ class MySQLManager():
                 "VALUES(%s, %s, %s, %s, %s, %s)"
         args = (plugin_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
+
+
+    @timed(query_seconds, "create_plugin_with_parameters")
+    def create_plugin_with_parameters(self, name: str, repo_url: str, version: str, parameters: list) -> int:
+        """
+        Creates plugin entry and all its parameter entries within a single transaction.
+
+        Arguments:
+            name (str): Plugin name
+            repo_url (str): Plugin repository url
+            version (str): Plugin version
+            parameters (list): Parameter dicts as accepted by create_parameter
+
+        Returns:
+            plugin_id (int): Id of the created plugin
+        """
+        plugin_query = "INSERT INTO plugins(name, repo_url, version) " \
+                       "VALUES(%s, %s, %s)"
+        plugin_args = (name, repo_url, version)
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            connector.begin()
+            cursor.execute(query=plugin_query, args=plugin_args)
+            plugin_id = cursor.lastrowid
+            self.insert_parameters(cursor=cursor, plugin_id=plugin_id, parameters=parameters)
+            self.log_change(cursor=cursor, plugin_id=plugin_id)
+            connector.commit()
+
+        return plugin_id
+
+
+    @timed(query_seconds, "create_plugins_with_parameters")
+    def create_plugins_with_parameters(self, plugins: list) -> list:
+        """
+        Creates several plugin entries and all their parameter entries within a single transaction
+        (bulk import), inserting the parameters and change log entries of all plugins at once.
+
+        Arguments:
+            plugins (list): Plugin dicts with name, repo_url, version and parameters (as accepted by create_parameter)
+
+        Returns:
+            plugin_ids (list): Ids of the created plugins, in order
+        """
+        plugin_query = "INSERT INTO plugins(name, repo_url, version) " \
+                       "VALUES(%s, %s, %s)"
+        parameter_query = "INSERT INTO parameters(plugin_id, " \
+                          "parameter_key, parameter_type, " \
+                          "default_value, " \
+                          "is_mandatory, is_read_only) " \
+                          "VALUES(%s, %s, %s, %s, %s, %s)"
+        change_query = "INSERT INTO plugin_changes(plugin_id) VALUES(%s)"
+
+        plugin_ids = []
+        parameter_args = []
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            connector.begin()
+            for plugin in plugins:
+                cursor.execute(query=plugin_query, args=(plugin["name"], plugin["repo_url"], plugin["version"]))
+                plugin_ids.append(cursor.lastrowid)
+                parameter_args.extend((cursor.lastrowid, parameter["parameter_key"], parameter["parameter_type"],
+                                       parameter.get("default_value"), parameter["is_mandatory"], parameter["is_read_only"])
+                                      for parameter in plugin["parameters"])
+            if parameter_args:
+                cursor.executemany(query=parameter_query, args=parameter_args)
+            if plugin_ids:
+                cursor.executemany(query=change_query, args=[(plugin_id,) for plugin_id in plugin_ids])
+            connector.commit()
+
+        return plugin_ids
+
+
+    def insert_parameters(self, cursor, plugin_id: int, parameters: list):
+        """
+        Batch inserts parameter entries of a plugin using the given cursor, without committing.
+
+        Arguments:
+            cursor: Cursor of the ongoing transaction
+            plugin_id (int): Plugin id
+            parameters (list): Parameter dicts as accepted by create_parameter
+        """
+        if not parameters:
+            return
+
+        query = "INSERT INTO parameters(plugin_id, " \
+                "parameter_key, parameter_type, " \
+                "default_value, " \
+                "is_mandatory, is_read_only) " \
+                "VALUES(%s, %s, %s, %s, %s, %s)"
+        args = [(plugin_id, parameter["parameter_key"], parameter["parameter_type"], parameter.get("default_value"),
+                 parameter["is_mandatory"], parameter["is_read_only"]) for parameter in parameters]
+
+        cursor.executemany(query=query, args=args)
 
 
     # READ
+    @timed(query_seconds, "read_plugin_by_id")
+    @retried
     def read_plugin_by_id(self, id: str) -> tuple:
         """
         Returns query response for entry within 'plugins' table based on provided plugin id.
@@ -112,21 +349,18 @@ class MySQLManager():
             plugins_ruple (tuple): Tuple containing the query response as 
                                     ((id, name, repo_url, version),)
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "SELECT * FROM plugins " \
                 "WHERE id=%s"
         args = (id)
 
-        cursor.execute(query=query, args=args)
-        plugin_tuple = cursor.fetchall()
-
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            plugin_tuple = cursor.fetchall()
 
         return plugin_tuple
 
+    @timed(query_seconds, "read_plugin_by_name_and_version")
+    @retried
     def read_plugin_by_name_and_version(self, name: str, version: str) -> tuple:
         """
         Returns query response for entry within 'plugins' table based on provided plugin name.
@@ -136,21 +370,18 @@ class MySQLManager():
             plugins (tuple): Tuple containing the query response as 
                                 ((id, name, repo_url, version),)
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "SELECT * FROM plugins " \
                 "WHERE name=%s AND version=%s"
         args = (name, version)
 
-        cursor.execute(query=query, args=args)
-        plugin = cursor.fetchall()
-
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            plugin = cursor.fetchall()
 
         return plugin
     
+    @timed(query_seconds, "read_parameter")
+    @retried
     def read_parameter(self, id: int) -> tuple:
         """
         Returns query response for parameter entry.
@@ -162,22 +393,19 @@ class MySQLManager():
             parameter (tuple): Tuple containing the query response as 
                                 ((id, plugin_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only),)
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "SELECT * FROM parameters " \
                 "WHERE id=%s"
         args = (id)
 
-        cursor.execute(query=query, args=args)
-        parameter = cursor.fetchall()
-
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            parameter = cursor.fetchall()
 
         return parameter
 
 
+    @timed(query_seconds, "read_plugins")
+    @retried
     def read_plugins(self) -> tuple:
         """
         Returns query response for all entries within 'plugins' table.
@@ -186,20 +414,17 @@ class MySQLManager():
             plugins (tuple): Tuple containing the query response as 
                                 ((id, name, repo_url, version), ...)
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "SELECT * FROM plugins"
 
-        cursor.execute(query=query)
-        plugins_tuple = cursor.fetchall()
-
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query)
+            plugins_tuple = cursor.fetchall()
 
         return plugins_tuple
 
 
+    @timed(query_seconds, "read_parameters")
+    @retried
     def read_parameters(self, plugin_id: int) -> tuple:
         """
         Returns query response for all entries within 'parameters' table corresponding to the provided plugin.
@@ -211,23 +436,106 @@ class MySQLManager():
             parameters (tuple): Tuple containing the query response as 
                                 ((id, plugin_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only), ...)
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "SELECT * FROM parameters " \
                 "WHERE plugin_id=%s"
         args = (plugin_id)
 
-        cursor.execute(query=query, args=args)
-        parameters = cursor.fetchall()
-
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            parameters = cursor.fetchall()
 
         return parameters
 
 
+    @timed(query_seconds, "read_plugins_with_parameters")
+    @retried
+    def read_plugins_with_parameters(self, plugin_id: Union[int, None] = None) -> tuple:
+        """
+        Returns plugins joined with their parameters in a single query, ordered by plugin id then parameter id.
+        Plugins without parameters are returned once with the parameter columns set to None.
+
+        Arguments:
+            plugin_id (int): Optional plugin id restricting the result to a single plugin
+
+        Returns:
+            rows (tuple): Tuple containing the query response as
+                            ((id, name, repo_url, version,
+                              parameter_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only), ...)
+        """
+        query = "SELECT plugins.id, plugins.name, plugins.repo_url, plugins.version, " \
+                "parameters.id, parameters.parameter_key, parameters.parameter_type, " \
+                "parameters.default_value, parameters.is_mandatory, parameters.is_read_only " \
+                "FROM plugins " \
+                "LEFT JOIN parameters ON parameters.plugin_id=plugins.id "
+        args = None
+        if plugin_id is not None:
+            query += "WHERE plugins.id=%s "
+            args = (plugin_id,)
+        query += "ORDER BY plugins.id, parameters.id"
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            rows = cursor.fetchall()
+
+        return rows
+
+
+    @timed(query_seconds, "read_plugins_page")
+    @retried
+    def read_plugins_page(self,
+                          after_id: int,
+                          limit: int,
+                          name_prefix: Union[str, None] = None,
+                          version: Union[str, None] = None,
+                          with_parameters: bool = True) -> tuple:
+        """
+        Returns one page of plugins ordered by id, optionally joined with their parameters in the same query.
+        Pages are keyset-paginated on the primary key, so reading a page costs the same wherever it starts.
+
+        Arguments:
+            after_id (int): Id of the last plugin of the previous page, 0 for the first page
+            limit (int): Maximum number of plugins in the page
+            name_prefix (str): Optional prefix plugin names must start with, case-insensitive under the default collation
+            version (str): Optional version plugins must have, compared the same way
+            with_parameters (bool): Whether parameter columns are joined
+
+        Returns:
+            rows (tuple): Tuple containing the query response as
+                            ((id, name, repo_url, version,
+                              parameter_id, parameter_key, parameter_type, default_value, is_mandatory, is_read_only), ...)
+                          or ((id, name, repo_url, version), ...) without parameters
+        """
+        page_query = "SELECT id, name, repo_url, version FROM plugins WHERE id>%s "
+        args = [after_id]
+        if name_prefix:
+            # '!' rather than backslash as escape character, it needs no escaping itself in the query
+            page_query += "AND name LIKE %s ESCAPE '!' "
+            args.append(name_prefix.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%")
+        if version is not None:
+            page_query += "AND version=%s "
+            args.append(version)
+        page_query += "ORDER BY id LIMIT %s"
+        args.append(limit)
+
+        if with_parameters:
+            query = "SELECT plugins.id, plugins.name, plugins.repo_url, plugins.version, " \
+                    "parameters.id, parameters.parameter_key, parameters.parameter_type, " \
+                    "parameters.default_value, parameters.is_mandatory, parameters.is_read_only " \
+                    f"FROM ({page_query}) AS plugins " \
+                    "LEFT JOIN parameters ON parameters.plugin_id=plugins.id " \
+                    "ORDER BY plugins.id, parameters.id"
+        else:
+            query = page_query
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=tuple(args))
+            rows = cursor.fetchall()
+
+        return rows
+
+
     # UPDATE
+    @timed(query_seconds, "update_plugin")
     def update_plugin(self, id: int, name: str, repo_url: str, version: str):
         """
         Updates a plugin based on the received data.
@@ -238,21 +546,17 @@ class MySQLManager():
             repo_url (str): Plugin url
             version (str): Plugin version
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "UPDATE plugins " \
                 "SET  name=%s, repo_url=%s, version=%s " \
                 "WHERE id=%s"
         args = (name, repo_url, version, id)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
-        
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
 
 
+    @timed(query_seconds, "update_parameter")
     def update_parameter(self,
                          id: int,
                          parameter_key: str, parameter_type: str,
@@ -269,23 +573,65 @@ class MySQLManager():
             is_mandatory (bool): Argument indicating if parameter is mandatory
             is_read_only (bool): Argument indicating if parameter is read only
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "UPDATE parameters " \
                 "SET parameter_key=%s, parameter_type=%s, default_value=%s, " \
                 "is_mandatory=%s, is_read_only=%s " \
                 "WHERE id=%s"
         args = (parameter_key, parameter_type, default_value, is_mandatory, is_read_only, id)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
-        
-        cursor.close()
-        connector.close()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
+
+
+    @timed(query_seconds, "update_plugin_with_parameters")
+    def update_plugin_with_parameters(self, id: int, name: str, repo_url: str, version: str, parameters: list):
+        """
+        Updates a plugin and synchronises its parameters within a single transaction.
+        Parameters carrying an id are updated, the ones without are created and stored ones missing from the list are deleted.
+
+        Parameters:
+            id (int): Plugin id
+            name (str): Plugin name
+            repo_url (str): Plugin url
+            version (str): Plugin version
+            parameters (list): Parameter dicts as accepted by update_parameter/create_parameter
+        """
+        plugin_query = "UPDATE plugins " \
+                       "SET  name=%s, repo_url=%s, version=%s " \
+                       "WHERE id=%s"
+        plugin_args = (name, repo_url, version, id)
+
+        update_query = "UPDATE parameters " \
+                       "SET parameter_key=%s, parameter_type=%s, default_value=%s, " \
+                       "is_mandatory=%s, is_read_only=%s " \
+                       "WHERE id=%s AND plugin_id=%s"
+        update_args = [(parameter["parameter_key"], parameter["parameter_type"], parameter.get("default_value"),
+                        parameter["is_mandatory"], parameter["is_read_only"], parameter["id"], id)
+                       for parameter in parameters if "id" in parameter]
+        created_parameters = [parameter for parameter in parameters if "id" not in parameter]
+
+        # Everything not listed anymore is deleted, in one statement
+        kept_ids = [parameter["id"] for parameter in parameters if "id" in parameter]
+        delete_query = "DELETE FROM parameters " \
+                       "WHERE plugin_id=%s"
+        if kept_ids:
+            delete_query += " AND id NOT IN (" + ", ".join(["%s"] * len(kept_ids)) + ")"
+        delete_args = (id, *kept_ids)
+
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            connector.begin()
+            cursor.execute(query=plugin_query, args=plugin_args)
+            cursor.execute(query=delete_query, args=delete_args)
+            if update_args:
+                cursor.executemany(query=update_query, args=update_args)
+            self.insert_parameters(cursor=cursor, plugin_id=id, parameters=created_parameters)
+            self.log_change(cursor=cursor, plugin_id=id)
+            connector.commit()
 
 
     # DELETE
+    @timed(query_seconds, "delete_plugin")
     def delete_plugin(self, id: int):
         """
         Deletes the plugin entry.
@@ -293,19 +639,18 @@ class MySQLManager():
         Parameters:
             id (int): Plugin id
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "DELETE FROM plugins " \
                 "WHERE id=%s"
         args = (id)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            connector.begin()
+            cursor.execute(query=query, args=args)
+            self.log_change(cursor=cursor, plugin_id=id)
+            connector.commit()
 
-        cursor.close()
-        connector.close()
 
+    @timed(query_seconds, "delete_parameter")
     def delete_parameter(self, id: int):
         """
         Deletes the parameter entry.
@@ -313,19 +658,16 @@ class MySQLManager():
         Parameters:
             id (id): Parameter's id
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "DELETE FROM parameters " \
                 "WHERE id=%s"
         args = (id)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
 
-        cursor.close()
-        connector.close()
 
+    @timed(query_seconds, "delete_parameters")
     def delete_parameters(self, plugin_id: int):
         """
         Deletes the parameters entries of a plugin.
@@ -333,15 +675,10 @@ class MySQLManager():
         Parameters:
             plugin_id (id): Parameter's plugin id
         """
-        connector = self.mysql.connect()
-        cursor = connector.cursor()
-
         query = "DELETE FROM parameters " \
                 "WHERE plugin_id=%s"
         args = (plugin_id)
 
-        cursor.execute(query=query, args=args)
-        connector.commit()
-
-        cursor.close()
-        connector.close()
\ No newline at end of file
+        with self.pool.connection() as connector, connector.cursor() as cursor:
+            cursor.execute(query=query, args=args)
+            connector.commit()
\ No newline at end of file
@@ -0,0 +1,292 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable
+
+
+class PooledConnection():
+    """
+    Wraps a raw connection with the timestamps used for eviction.
+
+    Parameters:
+        connection: Raw DB-API connection
+        generation (int): Pool generation the connection was created in
+    """
+    __slots__ = ("connection", "generation", "created_at", "last_used_at")
+
+    def __init__(self, connection, generation: int):
+        self.connection = connection
+        self.generation = generation
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class MySQLConnectionPool():
+    """
+    Bounded pool of reusable MySQL connections.
+
+    Idle connections are reused last-in first-out so the hot ones stay warm, and are evicted
+    once they exceed the max idle time or the max lifetime. A connection idle for longer than
+    the health check interval is pinged before being handed out and silently replaced if the
+    server dropped it. A connection error raised by a with block discards its connection, and
+    until then every idle connection last used before it is pinged too, as the same outage
+    likely dropped them (retrying the block is left to the caller, which knows if it is idempotent).
+
+    Parameters:
+        connect (callable): Factory returning a new raw connection
+        max_size (int): Maximum number of open connections
+        max_idle_time (float): Seconds an idle connection is kept before being closed
+        max_lifetime (float): Seconds after which a connection is recycled
+        health_check_interval (float): Idle seconds after which a connection is pinged on checkout
+        timeout (float): Seconds to wait for a free connection before raising TimeoutError
+        is_connection_error (callable): Returns whether an exception means the connection itself is broken
+    """
+    def __init__(self,
+                 connect: Callable,
+                 max_size: int = 10,
+                 max_idle_time: float = 300,
+                 max_lifetime: float = 3600,
+                 health_check_interval: float = 30,
+                 timeout: float = 30,
+                 is_connection_error: Callable = None):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.is_connection_error = is_connection_error if is_connection_error is not None else lambda e: False
+
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.generation = 0
+        self.size = 0
+        self.in_use = 0
+        self.waiters = 0
+        # Time of the latest connection error, idle connections last used before it are pinged on checkout
+        self.broken_at = None
+
+        self.created = 0
+        self.closed = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.connection_errors = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+
+    def get_stats(self) -> dict:
+        """
+        Returns a snapshot of the pool counters.
+        """
+        with self.condition:
+            return  {
+                        "pool":
+                            {
+                                "max_size": self.max_size,
+                                "size": self.size,
+                                "in_use": self.in_use,
+                                "idle": len(self.idle),
+                                "waiters": self.waiters,
+                                "created": self.created,
+                                "closed": self.closed,
+                                "acquired": self.acquired,
+                                "timeouts": self.timeouts,
+                                "connection_errors": self.connection_errors,
+                                "wait_time_total": self.wait_time_total,
+                                "wait_time_max": self.wait_time_max
+                            }
+                    }
+
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection for the duration of the with block.
+
+        The connection is rolled back if the block raises, and discarded instead of returned
+        to the pool when that rollback fails too or the block raised a connection error.
+        """
+        pooled_connection = self.acquire()
+        try:
+            yield pooled_connection.connection
+        except Exception as e:
+            if self.is_connection_error(e):
+                with self.condition:
+                    self.broken_at = time.monotonic()
+                    self.connection_errors += 1
+                self.release(pooled_connection=pooled_connection, discard=True)
+                raise
+            try:
+                pooled_connection.connection.rollback()
+            except Exception:
+                self.release(pooled_connection=pooled_connection, discard=True)
+                raise
+            self.release(pooled_connection=pooled_connection)
+            raise
+        else:
+            self.release(pooled_connection=pooled_connection)
+
+
+    def acquire(self) -> PooledConnection:
+        """
+        Returns a healthy connection, opening a new one if the pool is not yet full.
+
+        Raises:
+            TimeoutError: No connection became available within the pool timeout
+        """
+        start = time.monotonic()
+        expired = []
+        pooled_connection = None
+        timed_out = False
+        with self.condition:
+            while True:
+                expired.extend(self.evict_idle())
+                if self.idle:
+                    pooled_connection = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    timed_out = True
+                    in_use, waiters = self.in_use, self.waiters
+                    break
+                self.waiters += 1
+                try:
+                    self.condition.wait(timeout=remaining)
+                finally:
+                    self.waiters -= 1
+
+            if not timed_out:
+                self.in_use += 1
+                self.acquired += 1
+                wait_time = time.monotonic() - start
+                self.wait_time_total += wait_time
+                self.wait_time_max = max(self.wait_time_max, wait_time)
+            generation = self.generation
+
+        # Sockets are closed outside the condition, a slow close would hold up every checkout
+        self.close_all(pooled_connections=expired)
+        if timed_out:
+            raise TimeoutError(f"No MySQL connection available after {self.timeout}s "
+                               f"({in_use} in use, {waiters} waiting)")
+
+        try:
+            if pooled_connection is not None and not self.is_healthy(pooled_connection=pooled_connection):
+                self.close_all(pooled_connections=[pooled_connection])
+                pooled_connection = None
+            if pooled_connection is None:
+                pooled_connection = PooledConnection(connection=self.connect(), generation=generation)
+                with self.condition:
+                    self.created += 1
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+        return pooled_connection
+
+
+    def release(self, pooled_connection: PooledConnection, discard: bool = False):
+        """
+        Returns a connection to the pool, or closes it if discarded, expired or from a previous generation.
+        """
+        now = time.monotonic()
+        with self.condition:
+            discard = discard or \
+                      pooled_connection.generation != self.generation or \
+                      now - pooled_connection.created_at > self.max_lifetime
+            self.in_use -= 1
+            if discard:
+                self.size -= 1
+            else:
+                pooled_connection.last_used_at = now
+                self.idle.append(pooled_connection)
+            self.condition.notify()
+
+        if discard:
+            self.close_all(pooled_connections=[pooled_connection])
+
+
+    def reset(self):
+        """
+        Closes every idle connection and retires the ones in use once they are released.
+        Used when the database endpoint changes.
+        """
+        with self.condition:
+            self.generation += 1
+            idle = list(self.idle)
+            self.idle.clear()
+            self.size -= len(idle)
+            self.condition.notify_all()
+
+        self.close_all(pooled_connections=idle)
+
+
+    def evict_idle(self) -> list:
+        """
+        Removes idle connections past their max idle time or lifetime and returns them for closing.
+        Must be called holding the condition.
+        """
+        now = time.monotonic()
+        expired = [pooled_connection for pooled_connection in self.idle
+                   if now - pooled_connection.last_used_at > self.max_idle_time or
+                      now - pooled_connection.created_at > self.max_lifetime]
+        for pooled_connection in expired:
+            self.idle.remove(pooled_connection)
+            self.size -= 1
+
+        return expired
+
+
+    def is_healthy(self, pooled_connection: PooledConnection) -> bool:
+        """
+        Pings connections that sat idle past the health check interval or since before the latest connection error.
+        """
+        now = time.monotonic()
+        if now - pooled_connection.created_at > self.max_lifetime:
+            return False
+        if now - pooled_connection.last_used_at <= self.health_check_interval and \
+           (self.broken_at is None or pooled_connection.last_used_at > self.broken_at):
+            return True
+        try:
+            pooled_connection.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+
+    def close_all(self, pooled_connections: list):
+        """
+        Closes raw connections, ignoring errors from already broken sockets.
+        """
+        for pooled_connection in pooled_connections:
+            try:
+                pooled_connection.connection.close()
+            except Exception:
+                pass
+        with self.condition:
+            self.closed += len(pooled_connections)
@@ -0,0 +1,269 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+
+
+queued = "queued"
+running = "running"
+succeeded = "succeeded"
+failed = "failed"
+
+
+class OperationQueueFullError(Exception):
+    """
+    Raised when max_operations operations are all still queued or running, so none can be forgotten to make room.
+    """
+
+class OperationTracker():
+    """
+    Runs slow Galea calls on a background executor and keeps track of their state.
+
+    Operations on the same release run one after the other in submission order (a quick install then
+    delete reaches Galea in that order), operations on different releases run concurrently. After
+    run_on_loop, operations run as tasks of an event loop instead, bounded by the Galea session rather
+    than by max_workers.
+
+    Parameters:
+        max_workers (int): Number of operations running concurrently
+        max_operations (int): Number of operations remembered, oldest finished ones are forgotten first; new
+                              submissions are rejected while that many are unfinished
+    """
+    def __init__(self, max_workers: int = 4, max_operations: int = 1000):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="operation")
+        self.max_operations = max_operations
+        self.lock = threading.Lock()
+        self.operations = OrderedDict()
+        # release name -> deque of its (operation dict, function, arguments, context), the running one first
+        self.pending = {}
+        self.loop = None
+
+
+    def run_on_loop(self, loop: asyncio.AbstractEventLoop):
+        """
+        Runs operations submitted from now on as tasks of loop, their functions then being coroutine functions.
+        """
+        self.loop = loop
+
+
+    def submit(self, kind: str, release_name: str, function: Callable, arguments: dict) -> dict:
+        """
+        Queues function(**arguments) and returns the operation dict.
+
+        Arguments:
+            kind (str): Operation kind (install, update, delete)
+            release_name (str): Release the operation applies to
+            function (callable): Function run on the executor, or coroutine function run on the loop
+            arguments (dict): Keyword arguments passed to function
+        """
+        operation_dict =    {
+                                "operation":
+                                    {
+                                        "id": uuid.uuid4().hex,
+                                        "kind": kind,
+                                        "release": release_name,
+                                        "status": queued,
+                                        "created_at": time.time(),
+                                        "started_at": None,
+                                        "finished_at": None,
+                                        "queue_time": None,
+                                        "run_time": None,
+                                        "result": None,
+                                        "error": None
+                                    }
+                            }
+        # Run in a copy of the submitting request's context, so the Galea call joins its trace
+        context = contextvars.copy_context()
+        with self.lock:
+            self.make_room()
+            self.operations[operation_dict["operation"]["id"]] = operation_dict
+            submitted_dict = self.copy(operation_dict=operation_dict)
+            queue = self.pending.get(release_name)
+            start_draining = queue is None
+            if start_draining:
+                queue = self.pending[release_name] = deque()
+            queue.append((operation_dict, function, arguments, context))
+
+        if start_draining:
+            if self.loop is not None:
+                asyncio.run_coroutine_threadsafe(self.drain_async(release_name), self.loop)
+            else:
+                self.executor.submit(self.drain, release_name)
+
+        return submitted_dict
+
+
+    def drain(self, release_name: str):
+        """
+        Runs a release's queued operations one at a time on a single worker.
+        """
+        while True:
+            queued_operation = self.get_next(release_name=release_name)
+            if queued_operation is None:
+                return
+            operation_dict, function, arguments, context = queued_operation
+            context.run(self.execute, operation_dict, function, arguments)
+            self.remove_next(release_name=release_name)
+
+
+    async def drain_async(self, release_name: str):
+        """
+        Runs a release's queued operations one at a time as tasks of the loop.
+        """
+        while True:
+            queued_operation = self.get_next(release_name=release_name)
+            if queued_operation is None:
+                return
+            operation_dict, function, arguments, context = queued_operation
+            # A task runs in a copy of the context it is created in, here the submitting request's
+            await context.run(asyncio.ensure_future, self.execute_async(operation_dict, function, arguments))
+            self.remove_next(release_name=release_name)
+
+
+    def get_next(self, release_name: str) -> Union[tuple, None]:
+        """
+        Returns a release's next queued operation, or None once there is none left.
+        """
+        with self.lock:
+            queue = self.pending[release_name]
+            if not queue:
+                del self.pending[release_name]
+                return None
+            # Left in the queue while it runs, so operations submitted meanwhile wait for it
+            return queue[0]
+
+
+    def remove_next(self, release_name: str):
+        with self.lock:
+            self.pending[release_name].popleft()
+
+
+    def execute(self, operation_dict: dict, function: Callable, arguments: dict):
+        """
+        Runs an operation on the executor, recording status and timings.
+        """
+        started_at = self.set_running(operation_dict=operation_dict)
+        try:
+            result = function(**arguments)
+            status, error = succeeded, None
+        except Exception as e:
+            print("Exception:", e, str(e))
+            result, status, error = None, failed, str(e)
+        self.set_finished(operation_dict=operation_dict, started_at=started_at, status=status, result=result, error=error)
+
+
+    async def execute_async(self, operation_dict: dict, function: Callable, arguments: dict):
+        """
+        Runs an operation on the loop, recording status and timings.
+        """
+        started_at = self.set_running(operation_dict=operation_dict)
+        try:
+            result = await function(**arguments)
+            status, error = succeeded, None
+        except Exception as e:
+            print("Exception:", e, str(e))
+            result, status, error = None, failed, str(e)
+        self.set_finished(operation_dict=operation_dict, started_at=started_at, status=status, result=result, error=error)
+
+
+    def set_running(self, operation_dict: dict) -> float:
+        operation = operation_dict["operation"]
+        started_at = time.time()
+        with self.lock:
+            operation["status"] = running
+            operation["started_at"] = started_at
+            operation["queue_time"] = started_at - operation["created_at"]
+        return started_at
+
+
+    def set_finished(self, operation_dict: dict, started_at: float, status: str, result: Union[dict, None], error: Union[str, None]):
+        operation = operation_dict["operation"]
+        finished_at = time.time()
+        with self.lock:
+            operation["status"] = status
+            operation["result"] = result
+            operation["error"] = error
+            operation["finished_at"] = finished_at
+            operation["run_time"] = finished_at - started_at
+
+
+    def is_pending(self, release_name: str) -> bool:
+        """
+        Returns whether an operation on the release is queued or running.
+        """
+        with self.lock:
+            return release_name in self.pending
+
+
+    def get_operation(self, operation_id: str) -> Union[dict, None]:
+        """
+        Returns a copy of the operation dict, or None if unknown.
+        """
+        with self.lock:
+            operation_dict = self.operations.get(operation_id)
+            if operation_dict is None:
+                return None
+            return self.copy(operation_dict=operation_dict)
+
+
+    def get_operations(self) -> dict:
+        """
+        Returns copies of all remembered operations, oldest first.
+        """
+        with self.lock:
+            return  {
+                        "operations": [self.copy(operation_dict=operation_dict) for operation_dict in self.operations.values()]
+                    }
+
+
+    def check_capacity(self):
+        """
+        Raises OperationQueueFullError if an operation submitted now would be rejected, so callers can refuse
+        a request before making the change the operation would follow.
+        """
+        with self.lock:
+            self.make_room()
+
+
+    def make_room(self):
+        """
+        Forgets the oldest finished operations until one more fits in max_operations. Must be called holding the lock.
+
+        Raises:
+            OperationQueueFullError: Every remembered operation is still queued or running
+        """
+        overflow = len(self.operations) - self.max_operations + 1
+        if overflow <= 0:
+            return
+        finished_ids = [operation_id for operation_id, operation_dict in self.operations.items()
+                        if operation_dict["operation"]["status"] in (succeeded, failed)][:overflow]
+        for operation_id in finished_ids:
+            del self.operations[operation_id]
+        if len(finished_ids) < overflow:
+            raise OperationQueueFullError(f"{len(self.operations)} release operations are already queued or running")
+
+
+    def copy(self, operation_dict: dict) -> dict:
+        return  {
+                    "operation": dict(operation_dict["operation"])
+                }
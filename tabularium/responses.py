@@ -0,0 +1,206 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import threading
+from typing import Callable, Union
+from snapshot import Snapshot
+from operations import OperationQueueFullError
+
+
+# Bodies smaller than this are not worth compressing
+gzip_min_size = 1024
+
+
+# Request parsing and response building of the route handlers of routes.py, served by apiserver.py (Flask) and
+# asgiserver.py (Quart). Arguments named args and headers are the request's query arguments and headers,
+# response_class is the framework's Response class.
+
+
+# Query parameters of a plugin listing asking for a page rather than the full catalog
+page_args = ("limit", "cursor", "name_prefix", "version", "fields")
+
+
+def has_page_args(args) -> bool:
+    return any(name in args for name in page_args)
+
+
+def read_int_arg(args, name: str, default: int = None) -> int:
+    """
+    Reads an integer query parameter, raising ValueError naming it when it is not an integer.
+    """
+    if name not in args:
+        return default
+    try:
+        return int(args[name])
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got '{args[name]}'") from None
+
+
+def read_page_args(args) -> dict:
+    """
+    Reads the pagination (limit, cursor), filter (name_prefix, version) and projection (fields) query parameters of a plugin listing.
+    """
+    return  {
+                "limit": read_int_arg(args=args, name="limit"),
+                "cursor": read_int_arg(args=args, name="cursor", default=0),
+                "name_prefix": args.get("name_prefix"),
+                "version": args.get("version"),
+                "fields": args["fields"].split(",") if "fields" in args else None
+            }
+
+
+def read_flag(args, name: str) -> bool:
+    return args.get(name, "0").lower() in ("1", "true")
+
+
+def read_stream_format(args, headers) -> str:
+    """
+    Returns how a run's output is streamed: "sse" (?stream=sse or an Accept: text/event-stream header),
+    another ?stream value for plain text, or None when the run is not streamed.
+    """
+    if "text/event-stream" in headers.get("Accept", ""):
+        return "sse"
+    return args.get("stream")
+
+
+def read_trace_args(args) -> dict:
+    """
+    Reads the ?limit (default 100) and ?min_ms (default 0) query parameters of a trace listing.
+    """
+    return  {
+                "limit": read_int_arg(args=args, name="limit", default=100),
+                "min_duration": float(args.get("min_ms", "0")) / 1000
+            }
+
+
+def make_json_response(data_dict: dict, status: int, response_class, headers: dict = None):
+    return response_class(response=json.dumps(data_dict), status=status, headers=headers)
+
+
+def make_error_response(e: Exception, response_class):
+    """
+    Logs a failed request's exception and answers 400 with its type and message, 503 when the release
+    operation backlog is full.
+    """
+    print("Exception:", e, str(e))
+    return make_json_response(data_dict={"err": type(e).__name__, "strerr": str(e)},
+                              status=503 if isinstance(e, OperationQueueFullError) else 400, response_class=response_class)
+
+
+def make_lookup_response(data_dict: dict, found: bool, response_class):
+    """
+    Answers a lookup by id, 404 with the empty dict when nothing was found.
+    """
+    return make_json_response(data_dict=data_dict, status=200 if found else 404, response_class=response_class)
+
+
+def make_operation_response(operation_dict: dict, response_class):
+    """
+    Answers 202 with a queued release operation, pointing at where its status is read.
+    """
+    return make_json_response(data_dict=operation_dict, status=202, response_class=response_class,
+                              headers={"Location": f"/operations/{operation_dict['operation']['id']}"})
+
+
+def make_import_response(import_dict: dict, response_class):
+    """
+    Answers an import, 202 when release installs were queued.
+    """
+    return make_json_response(data_dict=import_dict, status=202 if import_dict["import"]["operations"] else 200,
+                              response_class=response_class)
+
+
+def make_import_error_response(e: Exception, import_dict: dict, response_class):
+    """
+    Answers 400 to an import that stopped early, with what was imported (and queued) before it stopped.
+    """
+    print("Exception:", e, str(e))
+    return make_json_response(data_dict=dict(import_dict, err=type(e).__name__, strerr=str(e)), status=400,
+                              response_class=response_class)
+
+
+def make_readiness_response(readiness_dict: dict, response_class):
+    return make_json_response(data_dict=readiness_dict, status=200 if readiness_dict["ready"] else 503, response_class=response_class)
+
+
+def make_trace_response(trace_dict: dict, response_class):
+    if trace_dict is None:
+        return make_json_response(data_dict={"trace": {}}, status=404, response_class=response_class)
+    return make_json_response(data_dict=trace_dict, status=200, response_class=response_class)
+
+
+def make_warm_snapshot_response(ready: threading.Event, component: str, get_snapshot: Callable[[], Snapshot], retry_after: float,
+                                request, response_class):
+    """
+    Serves a cache's snapshot once the cache is warm (ready set), 503 while it is still loading.
+    """
+    if not ready.is_set():
+        return make_unavailable_response(component=component, retry_after=retry_after, response_class=response_class)
+    return make_snapshot_response(snapshot=get_snapshot(), request=request, response_class=response_class)
+
+
+def make_snapshot_response(snapshot: Snapshot, request, response_class):
+    """
+    Serves a pre-serialized body with a strong ETag, answering 304 when the client already has it
+    and gzip-compressing it when the client accepts gzip.
+
+    Arguments:
+        snapshot (Snapshot): Serialized body
+        request: Current Flask or Quart request
+        response_class: Flask or Quart Response class
+    """
+    use_gzip = len(snapshot.body) >= gzip_min_size and request.accept_encodings["gzip"] > 0
+    # Each encoding is a different representation, hence a different strong ETag
+    etag = f"{snapshot.etag}-gzip" if use_gzip else snapshot.etag
+    headers = {"ETag": f'"{etag}"', "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+
+    if request.if_none_match.contains_weak(snapshot.etag) or request.if_none_match.contains_weak(f"{snapshot.etag}-gzip"):
+        return response_class(response="", status=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return response_class(response=snapshot.get_gzip_body(), status=200, headers=headers)
+
+    return response_class(response=snapshot.body, status=200, headers=headers)
+
+
+def format_event(text: str) -> str:
+    """
+    Formats streamed output as a server-sent event, one data line per line of text.
+    """
+    return "".join(f"data: {line}\n" for line in text.split("\n")) + "\n"
+
+
+def format_named_event(event: str, data_dict: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data_dict)}\n\n"
+
+
+def format_stream_chunk(chunk: Union[str, dict], sse: bool) -> Union[str, None]:
+    """
+    Formats a chunk of a streamed run, output text then the recorded result dict, as plain text or as a server-sent
+    event ending with a result event. Returns None for what is not forwarded (the result of a plain text stream).
+    """
+    if isinstance(chunk, str):
+        return format_event(text=chunk) if sse else chunk
+    return format_named_event(event="result", data_dict=chunk) if sse else None
+
+
+def make_unavailable_response(component: str, retry_after: float, response_class):
+    """
+    Answers 503 with a Retry-After header while a cache the request reads from is still warming up.
+    """
+    return response_class(response=json.dumps({"err": "unavailable", "strerr": f"still loading {component}"}), status=503,
+                          headers={"Retry-After": str(max(1, int(retry_after)))})
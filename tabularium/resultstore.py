@@ -0,0 +1,171 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Union
+
+
+def estimate_size(value) -> int:
+    """
+    Returns about the number of bytes value takes as UTF-8 encoded JSON, without serializing it.
+    """
+    if isinstance(value, str):
+        # Quotes included, escapes ignored
+        return (len(value) if value.isascii() else len(value.encode("utf-8"))) + 2
+    if isinstance(value, dict):
+        return 2 + sum(estimate_size(value=key) + estimate_size(value=item) + 2 for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(estimate_size(value=item) + 1 for item in value)
+    if value is None:
+        return 4
+
+    return len(str(value))
+
+
+class ResultStore():
+    """
+    Bounded in-memory store of run results, indexed by run id and by plugin.
+
+    Results are kept in insertion order, so the oldest ones are evicted first once the store holds
+    more than max_results results or max_bytes of results, or once they are older than
+    max_age seconds. Every plugin keeps its full history of retained results. A result larger than
+    max_bytes on its own is not stored, rather than pushing out every other result.
+
+    Parameters:
+        max_results (int): Maximum number of results kept
+        max_bytes (int): Maximum total size of the results kept, estimated in bytes of UTF-8 encoded JSON
+        max_age (float): Seconds a result is kept, 0 keeps results until they are pushed out by size
+    """
+    def __init__(self, max_results: int = 10000, max_bytes: int = 64 * 1024 * 1024, max_age: float = 0):
+        self.max_results = max_results
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # run id -> (result dict, size, created_at), oldest first
+        self.results_by_id = OrderedDict()
+        # plugin -> OrderedDict of its run ids, oldest first
+        self.run_ids_by_plugin = {}
+        self.total_bytes = 0
+        self.evictions = 0
+        self.oversized = 0
+
+
+    def add(self, result_dict: dict) -> str:
+        """
+        Stores a result, setting its "id", and returns the run id.
+        """
+        run_id = uuid.uuid4().hex
+        result_dict["result"]["id"] = run_id
+        size = estimate_size(value=result_dict)
+        plugin = result_dict["result"]["plugin"]
+
+        with self.lock:
+            if size > self.max_bytes:
+                self.oversized += 1
+                return run_id
+            self.results_by_id[run_id] = (result_dict, size, time.monotonic())
+            self.run_ids_by_plugin.setdefault(plugin, OrderedDict())[run_id] = None
+            self.total_bytes += size
+            self.evict()
+
+        return run_id
+
+
+    def evict(self):
+        """
+        Drops the oldest results until the store fits its bounds. Must be called holding the lock.
+        """
+        expired_before = time.monotonic() - self.max_age if self.max_age > 0 else None
+        while self.results_by_id:
+            run_id, (_, _, created_at) = next(iter(self.results_by_id.items()))
+            if (len(self.results_by_id) <= self.max_results and self.total_bytes <= self.max_bytes and
+                (expired_before is None or created_at >= expired_before)):
+                break
+            self.remove(run_id=run_id)
+            self.evictions += 1
+
+
+    def remove(self, run_id: str):
+        """
+        Drops a single result. Must be called holding the lock.
+        """
+        result_dict, size, _ = self.results_by_id.pop(run_id)
+        self.total_bytes -= size
+        plugin = result_dict["result"]["plugin"]
+        run_ids = self.run_ids_by_plugin[plugin]
+        del run_ids[run_id]
+        if not run_ids:
+            del self.run_ids_by_plugin[plugin]
+
+
+    def get(self, run_id: str) -> Union[dict, None]:
+        with self.lock:
+            self.evict()
+            entry = self.results_by_id.get(run_id)
+            return entry[0] if entry is not None else None
+
+
+    def get_latest(self, plugin: str) -> Union[dict, None]:
+        with self.lock:
+            self.evict()
+            run_ids = self.run_ids_by_plugin.get(plugin)
+            if not run_ids:
+                return None
+            return self.results_by_id[next(reversed(run_ids))][0]
+
+
+    def get_history(self, plugin: str) -> list:
+        """
+        Returns a plugin's retained results, oldest first.
+        """
+        with self.lock:
+            self.evict()
+            return [self.results_by_id[run_id][0] for run_id in self.run_ids_by_plugin.get(plugin, ())]
+
+
+    def get_latest_per_plugin(self) -> list:
+        with self.lock:
+            self.evict()
+            return [self.results_by_id[next(reversed(run_ids))][0] for run_ids in self.run_ids_by_plugin.values()]
+
+
+    def remove_plugin(self, plugin: str):
+        """
+        Drops every result of a plugin.
+        """
+        with self.lock:
+            for run_id in list(self.run_ids_by_plugin.get(plugin, ())):
+                self.remove(run_id=run_id)
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return  {
+                        "results":
+                            {
+                                "results": len(self.results_by_id),
+                                "plugins": len(self.run_ids_by_plugin),
+                                "bytes": self.total_bytes,
+                                "max_results": self.max_results,
+                                "max_bytes": self.max_bytes,
+                                "max_age": self.max_age,
+                                "evictions": self.evictions,
+                                "oversized": self.oversized
+                            }
+                    }
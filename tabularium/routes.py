@@ -0,0 +1,540 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import time
+from typing import Callable, Iterator, Union
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from tabularium import Tabularium, PluginImportError
+from metrics import get_route, start_request, finish_request
+from tracing import tracer, is_traced_route, SlowRequestProfiler
+from responses import (has_page_args, read_page_args, read_flag, read_stream_format, read_trace_args, make_json_response,
+                       make_error_response, make_lookup_response, make_operation_response, make_import_response, make_import_error_response,
+                       make_readiness_response, make_trace_response, make_warm_snapshot_response, make_unavailable_response)
+
+
+# Route table served by apiserver.py (Flask) and asgiserver.py (Quart): (rule, methods, handler), see route.
+# Handlers are coroutines taking the Server serving them. Quart awaits them on its event loop, Flask runs them
+# with run_to_completion: its Server makes blocking calls in place, so its handlers never suspend.
+routes = []
+
+
+def route(rule: str, methods: list) -> Callable:
+    """
+    Adds the decorated handler to the route table.
+    """
+    def add(handler: Callable) -> Callable:
+        routes.append((rule, methods, handler))
+        return handler
+    return add
+
+
+def register_routes(app, make_view: Callable):
+    """
+    Adds every route of the table to a Flask or Quart app, make_view turning a handler into the app's view function.
+    """
+    for rule, methods, handler in routes:
+        app.add_url_rule(rule, endpoint=handler.__name__, view_func=make_view(handler), methods=methods)
+
+
+def run_to_completion(coroutine):
+    """
+    Runs a handler coroutine that never suspends without an event loop, returning its result.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError("Route handler suspended outside of an event loop")
+
+
+class Server():
+    """
+    What route handlers need of the framework serving them, implemented by apiserver.py and asgiserver.py.
+
+    Parameters:
+        tabularium (Tabularium): Tabularium served
+        request: Flask or Quart request proxy
+        response_class: Flask or Quart Response class
+    """
+    def __init__(self, tabularium: Tabularium, request, response_class):
+        self.tabularium = tabularium
+        self.request = request
+        self.response_class = response_class
+
+
+    async def get_json(self):
+        """
+        Returns the request's JSON body.
+        """
+        raise NotImplementedError
+
+
+    async def call(self, function: Callable, **kwargs):
+        """
+        Returns the result of a blocking Tabularium call (MySQL).
+        """
+        raise NotImplementedError
+
+
+    def read_body(self) -> Iterator[bytes]:
+        """
+        Returns the request body's chunks, iterated by a blocking call.
+        """
+        raise NotImplementedError
+
+
+    def iterate(self, iterator: Iterator):
+        """
+        Returns a response body streaming a blocking iterator (MySQL reads).
+        """
+        raise NotImplementedError
+
+
+    async def run(self, test_dict: dict, version: Union[str, None]) -> dict:
+        raise NotImplementedError
+
+
+    async def run_batch(self, batch_dict: dict) -> dict:
+        raise NotImplementedError
+
+
+    async def run_pipeline(self, pipeline_dict: dict) -> dict:
+        raise NotImplementedError
+
+
+    async def open_stream(self, test_dict: dict):
+        """
+        Sends a test to its plugin service, returning the chunks of its output then the recorded result dict, see Marathon.stream.
+        """
+        raise NotImplementedError
+
+
+    def format_stream(self, chunks, sse: bool):
+        """
+        Returns a response body forwarding the chunks of open_stream as plain text or server-sent events,
+        see responses.format_stream_chunk.
+        """
+        raise NotImplementedError
+
+
+def start_request_telemetry(request, g, profiler: Union[SlowRequestProfiler, None]):
+    """
+    Starts a request's metrics, and its trace (and profile) when its route is traced. Runs before every request.
+    """
+    route = get_route(url_rule=request.url_rule)
+    g.request_metrics = start_request(route=route)
+    g.request_span = None
+    g.request_profile = None
+    if is_traced_route(route=route):
+        g.request_span = tracer.start_request(name=f"{request.method} {route}", traceparent=request.headers.get("traceparent"))
+        g.request_profile = profiler.start() if profiler is not None else None
+
+
+def finish_request_telemetry(request, g, response, profiler: Union[SlowRequestProfiler, None]):
+    """
+    Records a request's metrics, trace and profile. Runs after every request, failed ones included.
+    """
+    span = g.request_span
+    if g.request_profile is not None:
+        path = profiler.finish(profile=g.request_profile, seconds=time.perf_counter() - span.started_at, name=span.name,
+                               trace_id=span.trace.trace_id)
+        if path is not None:
+            span.attributes["profile"] = path
+    finish_request(request_metrics=g.request_metrics, method=request.method, status=response.status_code)
+    if span is not None:
+        tracer.finish_request(span=span, status=response.status_code)
+        response.headers["X-Trace-Id"] = span.trace.trace_id
+    return response
+
+
+def catalog_response(server: Server):
+    tabularium = server.tabularium
+    return make_warm_snapshot_response(ready=tabularium.catalog_ready, component="catalog", get_snapshot=tabularium.get_plugins_snapshot,
+                                       retry_after=tabularium.warm_up_retry_interval, request=server.request,
+                                       response_class=server.response_class)
+
+def releases_response(server: Server):
+    tabularium = server.tabularium
+    return make_warm_snapshot_response(ready=tabularium.releases_ready, component="releases", get_snapshot=tabularium.get_releases_snapshot,
+                                       retry_after=tabularium.warm_up_retry_interval, request=server.request,
+                                       response_class=server.response_class)
+
+
+# CREATE
+@route("/plugins", methods=["POST"])
+async def create_plugin(server: Server):
+    """
+    Creates plugin and parameters entries based on provided JSON and queues the release install.
+    """
+    try:
+        operation_dict = await server.call(server.tabularium.create_plugin, plugin_dict=await server.get_json())
+
+        return make_operation_response(operation_dict=operation_dict, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+
+@route("/plugins/import", methods=["POST"])
+async def import_plugins(server: Server):
+    """
+    Creates plugins from an NDJSON body (one plugin per line, as exported) in batched transactions.
+    With ?install=1 a release install is queued per plugin.
+    """
+    try:
+        import_dict = await server.call(server.tabularium.import_plugins, chunks=server.read_body(),
+                                        install=read_flag(args=server.request.args, name="install"))
+
+        return make_import_response(import_dict=import_dict, response_class=server.response_class)
+    except PluginImportError as e:
+        return make_import_error_response(e=e, import_dict=e.import_dict, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# READ
+@route("/plugins", methods=["GET"])
+async def read_plugins(server: Server):
+    """
+    Reads plugins and their parameters from the in-memory catalog and return as JSON.
+    With any of the limit, cursor, name_prefix, version or fields query parameters, returns a single page instead,
+    see Tabularium.get_plugins_page.
+    """
+    try:
+        if has_page_args(args=server.request.args):
+            page_dict = await server.call(server.tabularium.get_plugins_page, **read_page_args(args=server.request.args))
+
+            return make_json_response(data_dict=page_dict, status=200, response_class=server.response_class)
+        return catalog_response(server=server)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+    
+
+@route("/plugins/export", methods=["GET"])
+async def export_plugins(server: Server):
+    """
+    Streams every plugin and its parameters from MySQL as NDJSON, one plugin per line, ordered by id.
+    """
+    try:
+        return server.response_class(response=server.iterate(iterator=server.tabularium.export_plugins()), status=200,
+                                     mimetype="application/x-ndjson")
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/plugins/<int:plugin_id>", methods=["GET"])
+async def read_plugin(server: Server, plugin_id: int):
+    """
+    Reads plugin and its parameters from the in-memory catalog.
+    """
+    tabularium = server.tabularium
+    try:
+        if not tabularium.catalog_ready.is_set():
+            return make_unavailable_response(component="catalog", retry_after=tabularium.warm_up_retry_interval,
+                                             response_class=server.response_class)
+        plugin_dict = tabularium.get_plugin(plugin_id=plugin_id)
+
+        return make_lookup_response(data_dict=plugin_dict, found=bool(plugin_dict["plugin"]), response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+    
+
+@route("/plugins/resync", methods=["POST"])
+async def resync_plugins(server: Server):
+    """
+    Reloads the whole in-memory catalog from 'plugins' and 'parameters' tables.
+    """
+    try:
+        await server.call(server.tabularium.refresh_plugins)
+
+        return server.response_class(response="", status=204)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/releases", methods=["GET"])
+async def read_releases(server: Server):
+    """
+    Reads releases.
+    """
+    try:
+        return releases_response(server=server)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/operations", methods=["GET"])
+async def read_operations(server: Server):
+    """
+    Reads queued, running and finished release operations.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.get_operations(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/operations/<string:operation_id>", methods=["GET"])
+async def read_operation(server: Server, operation_id: str):
+    """
+    Reads a release operation status (queued, running, succeeded, failed) and timings.
+    """
+    try:
+        operation_dict = server.tabularium.get_operation(operation_id=operation_id)
+
+        return make_lookup_response(data_dict=operation_dict, found=bool(operation_dict["operation"]), response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# UPDATE
+@route("/plugins/<int:plugin_id>", methods=["PUT"])
+async def update_plugin(server: Server, plugin_id: int):
+    # ToDo: Align with new route and logic
+    """
+    Updates plugins and parameters into database based on provided JSON and queues the release upgrade.
+    """
+    try:
+        operation_dict = await server.call(server.tabularium.update_plugin, plugin_dict=await server.get_json())
+
+        return make_operation_response(operation_dict=operation_dict, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# DELETE
+@route("/plugins/<int:plugin_id>", methods=["DELETE"])
+async def delete_plugin(server: Server, plugin_id: int):
+    """
+    Deletes plugin and parameters from database and queues the release uninstall.
+    """
+    try:
+        operation_dict = await server.call(server.tabularium.delete_plugin_and_parameters, plugin_id=plugin_id)
+
+        return make_operation_response(operation_dict=operation_dict, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# RUN
+@route("/run", methods=["POST"])
+async def run(server: Server):
+    """
+    Runs test. With ?stream=1 the plugin output is forwarded as it arrives (chunked transfer), with
+    ?stream=sse or an Accept: text/event-stream header as server-sent events ending with a result event.
+    """
+    try:
+        test_dict = await server.get_json()
+        stream_format = read_stream_format(args=server.request.args, headers=server.request.headers)
+        if stream_format:
+            chunks = await server.open_stream(test_dict=test_dict)
+            if stream_format == "sse":
+                return server.response_class(response=server.format_stream(chunks=chunks, sse=True), status=201, mimetype="text/event-stream",
+                                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            return server.response_class(response=server.format_stream(chunks=chunks, sse=False), status=201, mimetype="text/plain",
+                                         headers={"X-Accel-Buffering": "no"})
+
+        version = server.tabularium.get_plugin_version(plugin_name=test_dict["test"]["plugin"])
+        result_dict = await server.run(test_dict=test_dict, version=version)
+
+        return make_json_response(data_dict=result_dict, status=201, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/run/batch", methods=["POST"])
+async def run_batch(server: Server):
+    """
+    Runs one prompt against several plugins, or a list of tests, concurrently.
+    """
+    try:
+        results_dict = await server.run_batch(batch_dict=await server.get_json())
+
+        return make_json_response(data_dict=results_dict, status=201, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/run/pipeline", methods=["POST"])
+async def run_pipeline(server: Server):
+    """
+    Runs a prompt through an ordered chain of plugins.
+    """
+    try:
+        pipeline_dict = await server.run_pipeline(pipeline_dict=await server.get_json())
+
+        return make_json_response(data_dict=pipeline_dict, status=201, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# RESULTS
+@route("/results", methods=["GET"])
+async def read_results(server: Server):
+    """
+    Reads the latest run result of every plugin.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.marathon.get_results(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/results/<string:plugin>", methods=["GET"])
+async def read_plugin_results(server: Server, plugin: str):
+    """
+    Reads every retained run result of a plugin, oldest first.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.marathon.get_result_history(plugin=plugin), status=200,
+                                  response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/runs/<string:run_id>", methods=["GET"])
+async def read_run(server: Server, run_id: str):
+    """
+    Reads a single run result by its id.
+    """
+    try:
+        result_dict = server.tabularium.marathon.get_run(run_id=run_id)
+
+        return make_lookup_response(data_dict=result_dict or {"result": {}}, found=bool(result_dict), response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# TEST
+@route("/test/plugins", methods=["GET"])
+async def get_plugins(server: Server):
+    """
+    Gets plugins.
+    """
+    try:
+        return catalog_response(server=server)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+    
+
+@route("/test/releases", methods=["GET"])
+async def get_releases(server: Server):
+    """
+    Gets releases.
+    """
+    try:
+        return releases_response(server=server)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+# READINESS
+@route("/ready", methods=["GET"])
+async def read_readiness(server: Server):
+    """
+    Reports whether the catalog is warm (200) or still loading (503), whether releases are, and the startup time breakdown.
+    """
+    return make_readiness_response(readiness_dict=server.tabularium.get_readiness(), response_class=server.response_class)
+
+
+# METRICS
+@route("/metrics", methods=["GET"])
+async def read_metrics(server: Server):
+    """
+    Exposes request, MySQL query, Galea call and plugin call timings in Prometheus text format.
+    """
+    return server.response_class(response=generate_latest(), status=200, content_type=CONTENT_TYPE_LATEST)
+
+
+# TRACES
+@route("/traces", methods=["GET"])
+async def read_traces(server: Server):
+    """
+    Reads the most recent recorded traces, newest first: at most ?limit (default 100), slower than ?min_ms if given.
+    """
+    try:
+        return make_json_response(data_dict=tracer.get_traces(**read_trace_args(args=server.request.args)), status=200,
+                                  response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/traces/<string:trace_id>", methods=["GET"])
+async def read_trace(server: Server, trace_id: str):
+    """
+    Reads a recent trace as span trees, or with ?format=otlp as an OTLP/JSON export request.
+    """
+    if server.request.args.get("format") == "otlp":
+        trace_dict = tracer.get_otlp_trace(trace_id=trace_id)
+    else:
+        trace_dict = tracer.get_trace(trace_id=trace_id)
+
+    return make_trace_response(trace_dict=trace_dict, response_class=server.response_class)
+
+
+# STATS
+@route("/stats/tracing", methods=["GET"])
+async def read_tracing_stats(server: Server):
+    """
+    Reads recorded trace count and OTLP export counters.
+    """
+    return make_json_response(data_dict=tracer.get_stats(), status=200, response_class=server.response_class)
+
+
+@route("/stats/mysql", methods=["GET"])
+async def read_mysql_stats(server: Server):
+    """
+    Reads MySQL connection pool statistics.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.mysqlmgr.get_pool_stats(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/stats/galea", methods=["GET"])
+async def read_galea_stats(server: Server):
+    """
+    Reads Galea circuit breaker state.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.get_galea_stats(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/stats/results", methods=["GET"])
+async def read_results_stats(server: Server):
+    """
+    Reads run result store size and evictions.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.marathon.results.get_stats(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
+
+
+@route("/stats/runs", methods=["GET"])
+async def read_run_cache_stats(server: Server):
+    """
+    Reads run cache hits, misses and size.
+    """
+    try:
+        return make_json_response(data_dict=server.tabularium.get_run_cache_stats(), status=200, response_class=server.response_class)
+    except Exception as e:
+        return make_error_response(e=e, response_class=server.response_class)
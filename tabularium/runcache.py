@@ -0,0 +1,142 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Union
+
+
+class RunCache():
+    """
+    Memoizes run results by a hash of (plugin, plugin version, prompt, parameters).
+
+    Entries expire after ttl seconds and the least recently used ones are evicted beyond
+    max_entries. Invalidating a plugin drops its entries and bumps its generation (clearing the
+    cache bumps the epoch of all plugins), so a run that started before the invalidation does not
+    store its now stale result.
+
+    Parameters:
+        max_entries (int): Maximum number of cached results
+        ttl (float): Seconds a cached result is served
+    """
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (plugin, result dict, expires_at), least recently used first
+        self.entries = OrderedDict()
+        self.keys_by_plugin = {}
+        self.generations = {}
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+
+    def make_key(self, plugin: str, version: str, prompt: str, parameters) -> str:
+        content = json.dumps([plugin, version, prompt, parameters], sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+    def get_generation(self, plugin: str) -> tuple:
+        with self.lock:
+            return self.epoch, self.generations.get(plugin, 0)
+
+
+    def get(self, key: str) -> Union[dict, None]:
+        """
+        Returns the cached result dict, or None on miss or expiry.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] <= time.monotonic():
+                if entry is not None:
+                    self.remove(key=key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def put(self, key: str, plugin: str, result_dict: dict, generation: tuple):
+        """
+        Caches a result unless the plugin was invalidated since generation was read.
+        """
+        with self.lock:
+            if (self.epoch, self.generations.get(plugin, 0)) != generation:
+                return
+            self.remove(key=key)
+            self.entries[key] = (plugin, result_dict, time.monotonic() + self.ttl)
+            self.keys_by_plugin.setdefault(plugin, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self.remove(key=next(iter(self.entries)))
+                self.evictions += 1
+
+
+    def remove(self, key: str):
+        """
+        Drops a single entry if present. Must be called holding the lock.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.keys_by_plugin[entry[0]]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_plugin[entry[0]]
+
+
+    def invalidate(self, plugin: str):
+        """
+        Drops every cached result of a plugin.
+        """
+        with self.lock:
+            self.generations[plugin] = self.generations.get(plugin, 0) + 1
+            for key in list(self.keys_by_plugin.get(plugin, ())):
+                self.remove(key=key)
+            self.invalidations += 1
+
+
+    def clear(self):
+        """
+        Drops every cached result.
+        """
+        with self.lock:
+            self.epoch += 1
+            self.entries.clear()
+            self.keys_by_plugin.clear()
+            self.invalidations += 1
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return  {
+                        "run_cache":
+                            {
+                                "entries": len(self.entries),
+                                "max_entries": self.max_entries,
+                                "ttl": self.ttl,
+                                "hits": self.hits,
+                                "misses": self.misses,
+                                "evictions": self.evictions,
+                                "invalidations": self.invalidations
+                            }
+                    }
@@ -0,0 +1,57 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import zlib
+import hashlib
+import threading
+from typing import Union
+
+
+class Snapshot():
+    """
+    Serialized JSON body of a response dict, with its strong ETag and a lazily compressed gzip body.
+
+    A snapshot belongs to one source dict: owners replace the dict whenever its content changes, so
+    comparing the source by identity tells whether the snapshot is still current.
+
+    Parameters:
+        source (dict): Dict the body is serialized from
+    """
+    def __init__(self, source: dict):
+        self.source = source
+        self.body = json.dumps(source).encode("utf-8")
+        self.etag = hashlib.sha256(self.body).hexdigest()
+        self.lock = threading.Lock()
+        self.gzip_body = None
+
+
+    def get_gzip_body(self) -> bytes:
+        with self.lock:
+            if self.gzip_body is None:
+                # zlib rather than gzip.compress so the output (hence the gzip ETag) is deterministic on Python 3.7
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+                self.gzip_body = compressor.compress(self.body) + compressor.flush()
+            return self.gzip_body
+
+
+def get_snapshot(snapshot: Union[Snapshot, None], source: dict) -> Snapshot:
+    """
+    Returns snapshot if it was serialized from source, a new snapshot of source otherwise.
+    """
+    if snapshot is not None and snapshot.source is source:
+        return snapshot
+    return Snapshot(source=source)
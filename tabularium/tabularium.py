@@ -14,43 +14,312 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Iterable, Iterator, Union
 from mysqlmgr import MySQLManager
 from galeadispatcher import GaleaDispacher
 from marathon import Marathon
+from catalog import PluginCatalog
+from operations import OperationTracker, OperationQueueFullError
+from snapshot import Snapshot, get_snapshot
+
+
+# Plugin fields a listing can be projected on, in response order
+plugin_fields = ("id", "name", "repo_url", "version", "parameters")
+
+
+class PluginImportError(Exception):
+    """
+    Raised when an import stops on a malformed line or a failed write, carrying the import dict of the
+    plugins written before it.
+    """
+    def __init__(self, message: str, import_dict: dict):
+        super().__init__(message)
+        self.import_dict = import_dict
 
 
 class Tabularium():
-    def __init__(self, app):
+    """
+    Plugin catalog, releases and test runs behind the API server.
+
+    Construction does no I/O: the catalog is loaded from MySQL and releases are read from Galea by a
+    background warm-up, retried until it succeeds, so the server binds immediately. Catalog reads are
+    served once the catalog is warm (see get_readiness).
+
+    Parameters:
+        app: Flask or Quart application holding config data
+        import_time (float): Seconds the server spent importing modules, reported in the startup breakdown
+    """
+    def __init__(self, app, import_time: float = None):
         self.mysqlmgr = MySQLManager(app=app)
-        self.plugins = self.read_plugins()
+        self.catalog = PluginCatalog()
+        # Seconds between polls of the change log, bounding how stale this worker's catalog can be (0 disables polling)
+        self.catalog_poll_interval = float(os.getenv("CATALOG_POLL_INTERVAL", "2"))
+        # Seconds a change log entry is re-read for, so a transaction committing out of id order is not missed
+        self.catalog_change_settle = float(os.getenv("CATALOG_CHANGE_SETTLE", "10"))
+        self.catalog_change_retention = float(os.getenv("CATALOG_CHANGE_RETENTION", "3600"))
+        # Above this many changed plugins per poll the whole catalog is reloaded at once
+        self.catalog_max_partial_refresh = int(os.getenv("CATALOG_MAX_PARTIAL_REFRESH", "100"))
+        self.releases_refresh_interval = float(os.getenv("RELEASES_REFRESH_INTERVAL", "30"))
+        # Largest page of plugins a listing returns, also the page size when none is asked for
+        self.plugins_page_max_limit = int(os.getenv("PLUGINS_PAGE_MAX_LIMIT", "1000"))
+        # Plugins written per transaction by bulk imports
+        self.import_batch_size = int(os.getenv("PLUGINS_IMPORT_BATCH_SIZE", "500"))
+        # Seconds between warm-up attempts while MySQL or Galea are unreachable
+        self.warm_up_retry_interval = float(os.getenv("WARM_UP_RETRY_INTERVAL", "5"))
+        # Changes up to change_low_water are applied, the ones above it seen so far map to when they were first seen
+        self.change_low_water = 0
+        self.changes_first_seen = {}
         self.galea_dispatcher = GaleaDispacher()
-        self.releases = self.galea_dispatcher.dispatch_read_all()
+        self.releases =     {
+                                "releases": []
+                            }
+        self.releases_refreshed_at = None
+        self.releases_snapshot = None
+        self.operations = OperationTracker(max_workers=int(os.getenv("GALEA_DISPATCH_WORKERS", "4")),
+                                           max_operations=int(os.getenv("GALEA_MAX_OPERATIONS", "1000")))
+        # Functions the operation tracker runs per operation kind, coroutine functions once use_async_galea is called
+        self.release_operations =   {
+                                        "install": self.install_release,
+                                        "update": self.update_release,
+                                        "delete": self.delete_release
+                                    }
+        self.async_galea_dispatcher = None
         self.marathon = Marathon()
-        self.results = self.marathon.get_results()
+
+        self.catalog_ready = threading.Event()
+        self.releases_ready = threading.Event()
+        self.startup_times =    {
+                                    "import": import_time,
+                                    "db": None,
+                                    "galea": None
+                                }
+        self.start_warm_up()
+
+
+    def start_warm_up(self):
+        """
+        Starts the background thread loading the catalog and releases.
+        """
+        threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+
+    def warm_up(self):
+        """
+        Loads the catalog, then releases, retrying each until it succeeds, logs the startup time breakdown
+        and starts the change poller. Releases do not gate readiness, so a Galea outage does not keep the
+        server from serving the catalog.
+        """
+        start = time.perf_counter()
+        while True:
+            try:
+                self.mysqlmgr.ensure_change_log()
+                self.change_low_water = self.mysqlmgr.read_last_change_id()
+                self.refresh_plugins()
+                break
+            except Exception as e:
+                print("Exception:", e, str(e))
+                time.sleep(self.warm_up_retry_interval)
+        self.startup_times["db"] = time.perf_counter() - start
+        self.catalog_ready.set()
+
+        start = time.perf_counter()
+        while True:
+            try:
+                self.refresh_releases()
+                break
+            except Exception as e:
+                print("Exception:", e, str(e))
+                time.sleep(self.warm_up_retry_interval)
+        self.startup_times["galea"] = time.perf_counter() - start
+
+        print("Startup: " + ", ".join(f"{step} {seconds:.3f}s" for step, seconds in self.startup_times.items() if seconds is not None))
+
+        if self.catalog_poll_interval > 0:
+            self.start_change_poller()
+
+    def get_readiness(self) -> dict:
+        """
+        Returns whether the catalog is warm (ready), whether releases are, and the startup time breakdown.
+        """
+        return  {
+                    "ready": self.catalog_ready.is_set(),
+                    "catalog": self.catalog_ready.is_set(),
+                    "releases": self.releases_ready.is_set(),
+                    "startup": self.startup_times
+                }
+
+
+    def start_change_poller(self):
+        """
+        Starts the background thread applying plugin changes made by other workers and replicas.
+        """
+        threading.Thread(target=self.poll_changes, name="catalog-poller", daemon=True).start()
+
+    def poll_changes(self):
+        """
+        Applies new change log entries every poll interval, refreshes releases every releases refresh
+        interval and prunes old change log entries.
+        """
+        pruned_at = time.monotonic()
+        while True:
+            time.sleep(self.catalog_poll_interval)
+            try:
+                self.apply_changes()
+                if time.monotonic() - pruned_at >= self.catalog_change_retention / 10:
+                    self.mysqlmgr.prune_changes(retention=self.catalog_change_retention)
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                print("Exception:", e, str(e))
+            try:
+                if time.monotonic() - self.releases_refreshed_at >= self.releases_refresh_interval:
+                    self.refresh_releases()
+            except Exception as e:
+                print("Exception:", e, str(e))
+
+    def apply_changes(self):
+        """
+        Refreshes the plugins changed since the last poll, or the whole catalog when too many changed
+        or when entries this worker has not applied yet were already pruned.
+        """
+        changes_tuple, pruned_through = self.mysqlmgr.read_changes(after_id=self.change_low_water)
+        now = time.monotonic()
+
+        changed_plugin_ids = set()
+        for change_id, plugin_id in changes_tuple:
+            if change_id not in self.changes_first_seen:
+                self.changes_first_seen[change_id] = now
+                changed_plugin_ids.add(plugin_id)
+
+        # Ids missing from the log can also be rolled back inserts, only the prune watermark tells entries were lost
+        missed_changes = pruned_through > self.change_low_water
+        if missed_changes or len(changed_plugin_ids) > self.catalog_max_partial_refresh:
+            self.refresh_plugins()
+            if self.marathon.run_cache is not None:
+                self.marathon.run_cache.clear()
+            if missed_changes:
+                self.change_low_water = pruned_through
+                for change_id in [change_id for change_id in self.changes_first_seen if change_id <= pruned_through]:
+                    del self.changes_first_seen[change_id]
+        else:
+            for plugin_id in changed_plugin_ids:
+                self.apply_plugin_change(plugin_id=plugin_id)
+
+        # Entries seen longer than the settle time ago cannot be preceded by an uncommitted one anymore
+        for change_id in sorted(self.changes_first_seen):
+            if now - self.changes_first_seen[change_id] < self.catalog_change_settle:
+                break
+            self.change_low_water = change_id
+            del self.changes_first_seen[change_id]
+
+    def apply_plugin_change(self, plugin_id: int):
+        """
+        Refreshes a plugin changed by any worker and drops the run results memoized under its old and new name.
+        """
+        previous_plugin_dict = self.catalog.get(plugin_id=plugin_id)
+        self.refresh_plugin(plugin_id=plugin_id)
+        plugin_dict = self.catalog.get(plugin_id=plugin_id)
+        for changed_plugin_dict in (previous_plugin_dict, plugin_dict):
+            if changed_plugin_dict is not None:
+                self.marathon.invalidate(plugin=changed_plugin_dict["plugin"]["name"])
 
 
     def refresh_plugins(self):
-        self.plugins = self.read_plugins()
+        """
+        Reloads the whole catalog from MySQL (explicit resync).
+        """
+        self.catalog.load(plugins_list=self.read_plugins()["plugins"])
+
+    def refresh_plugin(self, plugin_id: int):
+        """
+        Reloads a single plugin from MySQL into the catalog, dropping it if it no longer exists.
+        """
+        rows = self.mysqlmgr.read_plugins_with_parameters(plugin_id=plugin_id)
+        if rows:
+            self.catalog.upsert(plugin_dict=self.assemble_plugins(rows=rows)[0])
+        else:
+            self.catalog.remove(plugin_id=plugin_id)
 
     def refresh_releases(self):
-        self.releases = self.galea_dispatcher.dispatch_read_all()
+        self.set_releases(releases=self.galea_dispatcher.dispatch_read_all())
+
+    async def refresh_releases_async(self):
+        self.set_releases(releases=await self.async_galea_dispatcher.dispatch_read_all())
+
+    def set_releases(self, releases: dict):
+        self.releases = releases
+        self.releases_refreshed_at = time.monotonic()
+        self.releases_ready.set()
 
     def get_plugins(self) -> dict:
-        return self.plugins
+        return self.catalog.to_dict()
 
     def get_plugin(self, plugin_id: int) -> dict:
-        for plugin_dict in self.plugins["plugins"]:
-            if plugin_dict["plugin"]["id"] == plugin_id:
-                return plugin_dict
+        plugin_dict = self.catalog.get(plugin_id=plugin_id)
+        if plugin_dict is not None:
+            return plugin_dict
         return  {
                     "plugin": {}
                 }
     
     def get_releases(self):
         return self.releases
+
+    def get_plugins_page(self,
+                         limit: Union[int, None] = None,
+                         cursor: int = 0,
+                         name_prefix: Union[str, None] = None,
+                         version: Union[str, None] = None,
+                         fields: Union[list, None] = None) -> dict:
+        """
+        Returns a page of plugins ordered by id as {"plugins": [...], "next_cursor": id or None}, read from the
+        in-memory catalog once it is warm and from MySQL before.
+
+        Arguments:
+            limit (int): Maximum number of plugins in the page, at most (and by default) plugins_page_max_limit
+            cursor (int): next_cursor of the previous page, 0 for the first page
+            name_prefix (str): Optional prefix plugin names must start with
+            version (str): Optional version plugins must have
+            fields (list): Optional plugin fields to return, all of them by default
+        """
+        if limit is None:
+            limit = self.plugins_page_max_limit
+        if not 0 < limit <= self.plugins_page_max_limit:
+            raise ValueError(f"limit must be between 1 and {self.plugins_page_max_limit}")
+        unknown_fields = set(fields or ()) - set(plugin_fields)
+        if unknown_fields:
+            raise ValueError(f"Unknown plugin fields {sorted(unknown_fields)}, expected some of {list(plugin_fields)}")
+        projected_fields = [field for field in plugin_fields if not fields or field in fields]
+
+        if self.catalog_ready.is_set():
+            plugins_list = self.catalog.get_page(after_id=cursor, limit=limit, name_prefix=name_prefix, version=version)
+        else:
+            rows = self.mysqlmgr.read_plugins_page(after_id=cursor, limit=limit, name_prefix=name_prefix, version=version,
+                                                   with_parameters="parameters" in projected_fields)
+            plugins_list = self.assemble_plugins(rows=rows)
+
+        next_cursor = plugins_list[-1]["plugin"]["id"] if len(plugins_list) == limit else None
+        if len(projected_fields) < len(plugin_fields):
+            plugins_list = [{"plugin": {field: plugin_dict["plugin"][field] for field in projected_fields}}
+                            for plugin_dict in plugins_list]
+
+        return  {
+                    "plugins": plugins_list,
+                    "next_cursor": next_cursor
+                }
+
+    def get_plugins_snapshot(self) -> Snapshot:
+        return self.catalog.to_snapshot()
+
+    def get_releases_snapshot(self) -> Snapshot:
+        self.releases_snapshot = get_snapshot(snapshot=self.releases_snapshot, source=self.releases)
+        return self.releases_snapshot
     
     def get_release(self, release_name: str) -> dict:
-        for plugin_dict in self.plugins["releases"]:
+        for plugin_dict in self.releases["releases"]:
             if plugin_dict["release"]["name"] == release_name:
                 return plugin_dict
         return  {
@@ -58,200 +327,394 @@ class Tabularium():
                 }
 
 
+    def get_operations(self) -> dict:
+        return self.operations.get_operations()
+
+    def get_operation(self, operation_id: str) -> dict:
+        operation_dict = self.operations.get_operation(operation_id=operation_id)
+        if operation_dict is not None:
+            return operation_dict
+        return  {
+                    "operation": {}
+                }
+
+
+    # STATS
+    def get_galea_stats(self) -> dict:
+        return  {
+                    "circuit_breaker": self.galea_dispatcher.circuit_breaker.get_state()
+                }
+
+    def get_run_cache_stats(self) -> dict:
+        if self.marathon.run_cache is None:
+            return  {
+                        "run_cache": {}
+                    }
+        return self.marathon.run_cache.get_stats()
+
+
+    # GALEA OPERATIONS (run on the operation tracker's executor until use_async_galea is called)
+    def install_release(self, release_name: str, repo_url: str, version: str, refresh: bool = True) -> dict:
+        release_dict = self.galea_dispatcher.dispatch_install(release_name=release_name, repo_url=repo_url, version=version)
+        if refresh:
+            self.refresh_releases()
+        return release_dict
+
+    # Results memoized while the release was changing may come from either version, and are dropped again
+    def update_release(self, release_name: str, repo_url: str, version: str) -> dict:
+        try:
+            release_dict = self.galea_dispatcher.dispatch_update(release_name=release_name, repo_url=repo_url, version=version)
+        finally:
+            self.marathon.invalidate(plugin=release_name)
+        self.refresh_releases()
+        return release_dict
+
+    def delete_release(self, release_name: str) -> dict:
+        try:
+            release_dict = self.galea_dispatcher.dispatch_delete(release_name=release_name)
+        finally:
+            self.marathon.invalidate(plugin=release_name)
+        self.refresh_releases()
+        return release_dict
+
+
+    # GALEA OPERATIONS (run on the serving event loop, see use_async_galea)
+    def use_async_galea(self, dispatcher, loop: asyncio.AbstractEventLoop):
+        """
+        Runs release operations submitted from now on as tasks of the serving event loop, their Galea calls made
+        with dispatcher (an AsyncGaleaDispacher) rather than on the operation workers. Called by asgiserver.py
+        before serving; background reads (warm-up, releases refresh) keep using the blocking dispatcher.
+        """
+        self.async_galea_dispatcher = dispatcher
+        self.release_operations =   {
+                                        "install": self.install_release_async,
+                                        "update": self.update_release_async,
+                                        "delete": self.delete_release_async
+                                    }
+        self.operations.run_on_loop(loop=loop)
+
+    async def install_release_async(self, release_name: str, repo_url: str, version: str, refresh: bool = True) -> dict:
+        release_dict = await self.async_galea_dispatcher.dispatch_install(release_name=release_name, repo_url=repo_url, version=version)
+        if refresh:
+            await self.refresh_releases_async()
+        return release_dict
+
+    async def update_release_async(self, release_name: str, repo_url: str, version: str) -> dict:
+        try:
+            release_dict = await self.async_galea_dispatcher.dispatch_update(release_name=release_name, repo_url=repo_url, version=version)
+        finally:
+            self.marathon.invalidate(plugin=release_name)
+        await self.refresh_releases_async()
+        return release_dict
+
+    async def delete_release_async(self, release_name: str) -> dict:
+        try:
+            release_dict = await self.async_galea_dispatcher.dispatch_delete(release_name=release_name)
+        finally:
+            self.marathon.invalidate(plugin=release_name)
+        await self.refresh_releases_async()
+        return release_dict
+
+
     # CREATE
-    def create_plugin(self, plugin_dict: dict) -> None:
+    def create_plugin(self, plugin_dict: dict) -> dict:
         """
-        Creates plugin entry into 'plugins' table and parameters entries into 'parameters' table.
+        Creates plugin entry into 'plugins' table and parameters entries into 'parameters' table,
+        then queues the release install.
 
         Arguments:
             plugin_dict (dict): Plugin dictionary containing plugin details and its parameters
+
+        Returns:
+            operation_dict (dict): Queued install operation
         """
-        # Create plugin record
-        self.mysqlmgr.create_plugin(name=plugin_dict["plugin"]["name"],
-                              repo_url=plugin_dict["plugin"]["repo_url"],
-                              version=plugin_dict["plugin"]["version"])
+        # Refused before writing, rather than leaving a plugin without its install
+        self.operations.check_capacity()
 
-        # Read created plugin by name to get id
-        plugin_id = self.mysqlmgr.read_plugin_by_name_and_version(name=plugin_dict["plugin"]["name"], version=plugin_dict["plugin"]["version"])[0][0]
+        # Create plugin and parameters records in one transaction
+        plugin_id = self.mysqlmgr.create_plugin_with_parameters(name=plugin_dict["plugin"]["name"],
+                                                    repo_url=plugin_dict["plugin"]["repo_url"],
+                                                    version=plugin_dict["plugin"]["version"],
+                                                    parameters=[parameter_dict["parameter"] for parameter_dict in plugin_dict["plugin"]["parameters"]])
 
-        plugin_parameters_list = plugin_dict["plugin"]["parameters"]
-        for parameter_dict in plugin_parameters_list:
-            parameter = parameter_dict["parameter"]
-            self.mysqlmgr.create_parameter(plugin_id=plugin_id, **parameter)
+        self.refresh_plugin(plugin_id=plugin_id)
 
-        self.galea_dispatcher.dispatch_install(release_name=plugin_dict["plugin"]["name"],
-                                               repo_url=plugin_dict["plugin"]["repo_url"],
-                                               version=plugin_dict["plugin"]["version"])
-        
-        self.refresh_plugins()
-        self.refresh_releases()
+        return self.operations.submit(kind="install",
+                                      release_name=plugin_dict["plugin"]["name"],
+                                      function=self.release_operations["install"],
+                                      arguments={
+                                                    "release_name": plugin_dict["plugin"]["name"],
+                                                    "repo_url": plugin_dict["plugin"]["repo_url"],
+                                                    "version": plugin_dict["plugin"]["version"]
+                                                })
 
 
-    # READ
-    def read_plugins(self) -> dict:
+    def import_plugins(self, chunks: Iterable[bytes], install: bool = False) -> dict:
         """
-        Returns queried plugins and their parameters as a dictionary.
+        Creates plugins from NDJSON, one plugin dict per line in the shape GET /plugins/export writes (ids are
+        ignored), in transactions of import_batch_size plugins. The catalog is reloaded once at the end rather
+        than after every plugin, also when a line fails, so batches written before it are served.
+
+        Arguments:
+            chunks (iterable): Request body chunks, lines may be split across chunks
+            install (bool): Whether to queue a release install per plugin, releases then being read again on
+                            the next releases refresh rather than after every install
+
+        Returns:
+            import_dict (dict): Number of plugins and batches written, queued install operations and latency
+
+        Raises:
+            PluginImportError: On a malformed line or a failed write, with the import dict of the batches written before it
         """
-        # Prepare plugins dict
-        plugins_dict =  {
-                            "plugins": []
+        start = time.perf_counter()
+        if install:
+            self.operations.check_capacity()
+        plugins_list = []
+        batches = 0
+        batch_list = []
+        error = None
+        try:
+            for line_number, line in enumerate(split_lines(chunks=chunks), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    plugin = json.loads(line)["plugin"]
+                    batch_list.append({
+                                        "name": plugin["name"],
+                                        "repo_url": plugin["repo_url"],
+                                        "version": plugin["version"],
+                                        "parameters": [parameter_dict["parameter"] for parameter_dict in plugin.get("parameters", [])]
+                                      })
+                except Exception as e:
+                    raise ValueError(f"Line {line_number}: invalid plugin ({type(e).__name__}: {e})") from e
+                if len(batch_list) == self.import_batch_size:
+                    self.mysqlmgr.create_plugins_with_parameters(plugins=batch_list)
+                    plugins_list.extend(batch_list)
+                    batches += 1
+                    batch_list = []
+            if batch_list:
+                self.mysqlmgr.create_plugins_with_parameters(plugins=batch_list)
+                plugins_list.extend(batch_list)
+                batches += 1
+        except Exception as e:
+            error = e
+        finally:
+            if plugins_list:
+                self.refresh_plugins()
+                for plugin in plugins_list:
+                    self.marathon.invalidate(plugin=plugin["name"])
+
+        # Plugins written before a failure are kept, so their releases are installed as well
+        operations_list = []
+        if install:
+            for plugin in plugins_list:
+                try:
+                    operations_list.append(self.operations.submit(kind="install",
+                                                                  release_name=plugin["name"],
+                                                                  function=self.release_operations["install"],
+                                                                  arguments={
+                                                                                "release_name": plugin["name"],
+                                                                                "repo_url": plugin["repo_url"],
+                                                                                "version": plugin["version"],
+                                                                                "refresh": False
+                                                                            }))
+                # The plugins are written, the ones past the backlog limit are reported rather than installed
+                except OperationQueueFullError as e:
+                    if error is None:
+                        error = e
+                    break
+
+        import_dict =   {
+                            "import":
+                                {
+                                    "plugins": len(plugins_list),
+                                    "batches": batches,
+                                    "operations": [operation_dict["operation"]["id"] for operation_dict in operations_list],
+                                    "latency": time.perf_counter() - start
+                                }
                         }
-        
-        # Read plugins tuple(tuple)
-        plugins_tuple = self.mysqlmgr.read_plugins()
-        
-        # Assemble plugin dicts from tuple(tuple)
-        for plugin_tuple in plugins_tuple:
-            # Assemble plugin dict from tuple
-            plugin_dict =   {
-                                "plugin":
-                                    {
-                                        "id": plugin_tuple[0], 
-                                        "name": plugin_tuple[1], 
-                                        "repo_url": plugin_tuple[2],
-                                        "version": plugin_tuple[3]
-                                    }
-                            }
-            
-            # Read parameters tuple(tuple)
-            parameters_tuple = self.mysqlmgr.read_parameters(plugin_id=plugin_tuple[0])
-            # Prepare parameters dict
-            parameters_dict =   {
-                                    "parameters": []
+        if error is not None:
+            raise PluginImportError(str(error), import_dict=import_dict) from error
+
+        return import_dict
+
+
+    # READ
+    def assemble_plugins(self, rows: tuple) -> list:
+        """
+        Groups plugin/parameter join rows into plugin dicts, preserving row order.
+
+        Arguments:
+            rows (tuple): Rows as returned by MySQLManager.read_plugins_with_parameters
+        """
+        plugins_list = []
+        plugin_dict = None
+        for row in rows:
+            # Start a new plugin dict whenever the plugin id changes
+            if plugin_dict is None or plugin_dict["plugin"]["id"] != row[0]:
+                plugin_dict =   {
+                                    "plugin":
+                                        {
+                                            "id": row[0],
+                                            "name": row[1],
+                                            "repo_url": row[2],
+                                            "version": row[3],
+                                            "parameters": []
+                                        }
                                 }
-            
-            # Assemble parameters dict from tuple(tuple)
-            for parameter_tuple in parameters_tuple:
-                # Assemble parameter dict from tuple
+                plugins_list.append(plugin_dict)
+
+            # Plugins without parameters come back once with NULL parameter columns, pages read without
+            # parameters have no parameter columns at all
+            if len(row) > 4 and row[4] is not None:
                 parameter_dict =    {
-                                        "parameter": 
+                                        "parameter":
                                             {
-                                                "id": parameter_tuple[0],
-                                                "parameter_key": parameter_tuple[2],
-                                                "parameter_type": parameter_tuple[3],
-                                                "default_value": parameter_tuple[4],
-                                                "is_mandatory": parameter_tuple[5],
-                                                "is_read_only": parameter_tuple[6]
+                                                "id": row[4],
+                                                "parameter_key": row[5],
+                                                "parameter_type": row[6],
+                                                "default_value": row[7],
+                                                "is_mandatory": row[8],
+                                                "is_read_only": row[9]
                                             }
                                     }
-                parameters_dict["parameters"].append(parameter_dict)
-            plugin_dict["plugin"].update(parameters_dict)
+                plugin_dict["plugin"]["parameters"].append(parameter_dict)
 
-            plugins_dict["plugins"].append(plugin_dict)
-        
-        return plugins_dict
+        return plugins_list
 
 
-    def read_plugin(self, plugin_id: int) -> dict:
+    def read_plugins(self) -> dict:
         """
-        Returns queried plugin and its parameters as a dictionary.
+        Returns queried plugins and their parameters as a dictionary.
         """
-        # Prepare plugin dict
-        plugin_dict =   {
-                            "plugin": {}
-                        }
-        # Prepare parameters dict
-        parameters_dict =   {
-                                "parameters": []
-                            }
-        
-        # Read plugin
-        plugin_tuple = self.mysqlmgr.read_plugin_by_id(id=plugin_id)
+        rows = self.mysqlmgr.read_plugins_with_parameters()
 
-        # Read parameters
-        parameters_tuple = self.mysqlmgr.read_parameters(plugin_id=plugin_tuple[0][0])
+        return  {
+                    "plugins": self.assemble_plugins(rows=rows)
+                }
 
-        # Assemble plugin dict from tuple(tuple)
-        plugin_dict["plugin"].update(
-                                        {
-                                            "id": plugin_tuple[0][0],
-                                            "name": plugin_tuple[0][1],
-                                            "repo_url": plugin_tuple[0][2],
-                                            "version": plugin_tuple[0][3]
-                                        }
-                                    )
-        # Assemble parameters dict from tuple(tuple)
-        for parameter_tuple in parameters_tuple:
-            # Assemble parameter dict from tuple
-            parameter_dict =    {
-                                    "parameter":
-                                        {
-                                            "id": parameter_tuple[0],
-                                            "parameter_key": parameter_tuple[2],
-                                            "parameter_type": parameter_tuple[3],
-                                            "default_value": parameter_tuple[4],
-                                            "is_mandatory": parameter_tuple[5],
-                                            "is_read_only": parameter_tuple[6]
-                                        }
-                                }
-            parameters_dict["parameters"].append(parameter_dict)
 
-        plugin_dict["plugin"].update(parameters_dict)
+    def export_plugins(self) -> Iterator[str]:
+        """
+        Yields every plugin dict as a line of NDJSON ordered by id, one page of lines at a time. Plugins are read
+        from MySQL a page at a time, so the export reflects the database rather than this worker's catalog and is
+        never held whole in memory.
+        """
+        after_id = 0
+        while True:
+            plugins_list = self.assemble_plugins(rows=self.mysqlmgr.read_plugins_page(after_id=after_id,
+                                                                                      limit=self.plugins_page_max_limit))
+            if plugins_list:
+                yield "".join(json.dumps(plugin_dict) + "\n" for plugin_dict in plugins_list)
+            if len(plugins_list) < self.plugins_page_max_limit:
+                return
+            after_id = plugins_list[-1]["plugin"]["id"]
+
+
+    def read_plugin(self, plugin_id: int) -> dict:
+        """
+        Returns queried plugin and its parameters as a dictionary.
+        """
+        rows = self.mysqlmgr.read_plugins_with_parameters(plugin_id=plugin_id)
 
-        return plugin_dict
+        return self.assemble_plugins(rows=rows)[0]
     
 
     # UPDATE
-    def update_plugin(self, plugin_dict: dict) -> None:
-        """
-        Updates plugin record and its parameters' records.
-        """
-        # Update plugin
-        self.mysqlmgr.update_plugin(id=plugin_dict["plugin"]["id"],
-                               name=plugin_dict["plugin"]["name"], repo_url=plugin_dict["plugin"]["repo_url"], version=plugin_dict["plugin"]["version"])
-
-        # Calculate deleted parameters
-        queried_parameters = self.mysqlmgr.read_parameters(plugin_id=plugin_dict["plugin"]["id"])
-        queried_parameters_ids_list = []
-        for queried_parameter in queried_parameters:
-            queried_parameter_id = queried_parameter[0]
-            queried_parameters_ids_list.append(queried_parameter_id)
-
-        plugin_parameters_list = plugin_dict["plugin"]["parameters"]
-        plugin_parameters_ids_list = [plugin_parameter["parameter"]["id"] for plugin_parameter in plugin_parameters_list if ("id" in plugin_parameter["parameter"].keys())]
-
-        deleted_parameters_ids_list = [parameter_id for parameter_id in queried_parameters_ids_list if parameter_id not in plugin_parameters_ids_list]
-        for parameter_id in deleted_parameters_ids_list:
-            self.mysqlmgr.delete_parameter(id=parameter_id)
-
-        # Update already existing parameters or create the newly added ones (identifiable by lack of id)
-        for parameter in plugin_parameters_list:
-            if "id" in parameter["parameter"].keys():
-                self.mysqlmgr.update_parameter(id=parameter["parameter"]["id"],
-                                         parameter_key=parameter["parameter"]["parameter_key"], parameter_type=parameter["parameter"]["parameter_type"], default_value=parameter["parameter"]["default_value"],
-                                         is_mandatory=parameter["parameter"]["is_mandatory"], is_read_only=parameter["parameter"]["is_read_only"])
-            else:
-                self.mysqlmgr.create_parameter(plugin_id=plugin_dict["plugin"]["id"], **parameter["parameter"])
-
-        self.galea_dispatcher.dispatch_update(release_name=plugin_dict["plugin"]["name"],
-                                              repo_url=plugin_dict["plugin"]["repo_url"],
-                                              version=plugin_dict["plugin"]["version"])
-
-        self.refresh_plugins()
-        self.refresh_releases()
+    def update_plugin(self, plugin_dict: dict) -> dict:
+        """
+        Updates plugin record and its parameters' records, then queues the release upgrade.
+
+        Returns:
+            operation_dict (dict): Queued update operation
+        """
+        # Results memoized under the previous name are stale as well
+        previous_plugin_dict = self.catalog.get(plugin_id=plugin_dict["plugin"]["id"])
+
+        self.operations.check_capacity()
+
+        # Update plugin, delete removed parameters, update existing ones and create the newly added ones
+        # (identifiable by lack of id) in one transaction
+        self.mysqlmgr.update_plugin_with_parameters(id=plugin_dict["plugin"]["id"],
+                                                    name=plugin_dict["plugin"]["name"],
+                                                    repo_url=plugin_dict["plugin"]["repo_url"],
+                                                    version=plugin_dict["plugin"]["version"],
+                                                    parameters=[parameter_dict["parameter"] for parameter_dict in plugin_dict["plugin"]["parameters"]])
+
+        self.refresh_plugin(plugin_id=plugin_dict["plugin"]["id"])
+        self.marathon.invalidate(plugin=plugin_dict["plugin"]["name"])
+        if previous_plugin_dict is not None:
+            self.marathon.invalidate(plugin=previous_plugin_dict["plugin"]["name"])
+
+        return self.operations.submit(kind="update",
+                                      release_name=plugin_dict["plugin"]["name"],
+                                      function=self.release_operations["update"],
+                                      arguments={
+                                                    "release_name": plugin_dict["plugin"]["name"],
+                                                    "repo_url": plugin_dict["plugin"]["repo_url"],
+                                                    "version": plugin_dict["plugin"]["version"]
+                                                })
 
 
     # DELETE
-    def delete_plugin_and_parameters(self, plugin_id: int) -> None:
+    def delete_plugin_and_parameters(self, plugin_id: int) -> dict:
         """
-        Deletes plugin entry and its parameters' entries.
+        Deletes plugin entry and its parameters' entries, then queues the release uninstall.
+
+        Returns:
+            operation_dict (dict): Queued delete operation
         """
+        self.operations.check_capacity()
+
         # Get plugin name
-        plugin_name = self.mysqlmgr.read_plugin_by_id(id=plugin_id)[0][1]
+        plugin_dict = self.catalog.get(plugin_id=plugin_id)
+        if plugin_dict is not None:
+            plugin_name = plugin_dict["plugin"]["name"]
+        else:
+            plugin_name = self.mysqlmgr.read_plugin_by_id(id=plugin_id)[0][1]
 
         # Delete plugin and parameters by cascade
         self.mysqlmgr.delete_plugin(id=plugin_id)
-        self.galea_dispatcher.dispatch_delete(release_name=plugin_name)
 
-        self.refresh_plugins()
-        self.refresh_releases()
+        self.catalog.remove(plugin_id=plugin_id)
+        self.marathon.invalidate(plugin=plugin_name)
+
+        return self.operations.submit(kind="delete",
+                                      release_name=plugin_name,
+                                      function=self.release_operations["delete"],
+                                      arguments={
+                                                    "release_name": plugin_name
+                                                })
 
     
     # RUN
-    def run(self, test_dict: dict) -> dict:
+    def get_plugin_version(self, plugin_name: str) -> Union[str, None]:
         """
-        Runs test via Marathon.
+        Returns the catalog version of the plugin a test runs against, or None if it is not in the catalog
+        or its release is being changed (results are then not memoized).
         """
-        result_dict = self.marathon.run(test_dict=test_dict)
+        if self.operations.is_pending(release_name=plugin_name):
+            return None
+        plugin_dict = self.catalog.find_by_name(name=plugin_name)
+        return plugin_dict["plugin"]["version"] if plugin_dict is not None else None
 
-        return result_dict
\ No newline at end of file
+    def run(self, test_dict: dict) -> dict:
+        """
+        Runs test via Marathon, passing the plugin version from the catalog so the result can be memoized.
+        """
+        result_dict = self.marathon.run(test_dict=test_dict, version=self.get_plugin_version(plugin_name=test_dict["test"]["plugin"]))
+
+        return result_dict
+
+
+def split_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Yields the lines of a body read in arbitrary chunks, without their line terminator.
+    """
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        yield from lines
+    if buffer:
+        yield buffer
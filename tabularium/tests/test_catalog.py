@@ -0,0 +1,57 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+from catalog import PluginCatalog
+
+
+def make_plugin_dict(id: int, name: str, version: str) -> dict:
+    return {"plugin": {"id": id, "name": name, "repo_url": "https://charts.example.com", "version": version, "parameters": []}}
+
+
+def test_remove_moves_name_to_remaining_version():
+    catalog = PluginCatalog()
+    catalog.load(plugins_list=[make_plugin_dict(id=1, name="plugin", version="1.0.0"),
+                               make_plugin_dict(id=2, name="plugin", version="2.0.0"),
+                               make_plugin_dict(id=3, name="other", version="1.0.0")])
+    assert catalog.find_by_name(name="plugin")["plugin"]["id"] == 2
+
+    catalog.remove(plugin_id=2)
+    assert catalog.find_by_name(name="plugin")["plugin"]["id"] == 1
+    catalog.remove(plugin_id=1)
+    assert catalog.find_by_name(name="plugin") is None
+    assert catalog.find_by_name(name="other")["plugin"]["id"] == 3
+
+
+def test_rename_moves_old_name_to_remaining_version():
+    catalog = PluginCatalog()
+    catalog.load(plugins_list=[make_plugin_dict(id=1, name="plugin", version="1.0.0"),
+                               make_plugin_dict(id=2, name="plugin", version="2.0.0")])
+    catalog.upsert(plugin_dict=make_plugin_dict(id=2, name="renamed", version="2.0.0"))
+    assert catalog.find_by_name(name="plugin")["plugin"]["id"] == 1
+    assert catalog.find_by_name(name="renamed")["plugin"]["id"] == 2
+    assert catalog.find(name="plugin", version="2.0.0") is None
+
+
+def test_page_filters_ignore_case_as_mysql():
+    catalog = PluginCatalog()
+    catalog.load(plugins_list=[make_plugin_dict(id=1, name="Plugin-a", version="1.0.0-RC1"),
+                               make_plugin_dict(id=2, name="plugin-b", version="1.0.0"),
+                               make_plugin_dict(id=3, name="other", version="1.0.0")])
+    assert [plugin_dict["plugin"]["id"] for plugin_dict in catalog.get_page(after_id=0, limit=10, name_prefix="PLUGIN")] == [1, 2]
+    assert [plugin_dict["plugin"]["id"] for plugin_dict in catalog.get_page(after_id=0, limit=10, version="1.0.0-rc1")] == [1]
+    assert [plugin_dict["plugin"]["id"] for plugin_dict in catalog.get_page(after_id=1, limit=1, name_prefix="plugin")] == [2]
@@ -0,0 +1,191 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import pytest
+import tabularium
+from tabularium import Tabularium
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+class StubMySQLManager():
+    """
+    Plugins table and change log of committed entries, recording the plugin reads apply_changes makes.
+    """
+    def __init__(self, app):
+        self.plugins = {}
+        self.changes = []
+        self.pruned_through = 0
+        self.plugin_reads = []
+
+    def commit(self, change_id: int, plugin_id: int, name: str):
+        self.plugins[plugin_id] = name
+        self.changes.append((change_id, plugin_id))
+
+    def read_changes(self, after_id: int) -> tuple:
+        return tuple(sorted(change for change in self.changes if change[0] > after_id)), self.pruned_through
+
+    def read_plugins_with_parameters(self, plugin_id: int = None) -> tuple:
+        self.plugin_reads.append(plugin_id)
+        return tuple((id, name, "https://charts.example.com", "1.0.0") for id, name in sorted(self.plugins.items())
+                     if plugin_id is None or id == plugin_id)
+
+
+class StubRunCache():
+    def __init__(self):
+        self.clears = 0
+
+    def clear(self):
+        self.clears += 1
+
+
+class StubMarathon():
+    def __init__(self):
+        self.run_cache = StubRunCache()
+        self.invalidated = []
+
+    def invalidate(self, plugin: str):
+        self.invalidated.append(plugin)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(tabularium, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def catalog_tabularium(monkeypatch, clock):
+    monkeypatch.setattr(tabularium, "MySQLManager", StubMySQLManager)
+    monkeypatch.setattr(tabularium, "Marathon", StubMarathon)
+    monkeypatch.setattr(Tabularium, "start_warm_up", lambda self: None)
+    catalog_tabularium = Tabularium(app=None)
+    catalog_tabularium.catalog_change_settle = 10
+    catalog_tabularium.catalog_max_partial_refresh = 2
+    return catalog_tabularium
+
+
+def test_change_applied_once_then_settled(catalog_tabularium, clock):
+    mysqlmgr = catalog_tabularium.mysqlmgr
+    mysqlmgr.commit(change_id=1, plugin_id=1, name="plugin-1")
+
+    catalog_tabularium.apply_changes()
+    assert mysqlmgr.plugin_reads == [1]
+    assert catalog_tabularium.catalog.get(plugin_id=1)["plugin"]["name"] == "plugin-1"
+    assert catalog_tabularium.marathon.invalidated == ["plugin-1"]
+
+    # Still re-read within the settle window, but not applied again
+    clock.now += 5
+    catalog_tabularium.apply_changes()
+    assert mysqlmgr.plugin_reads == [1]
+    assert catalog_tabularium.change_low_water == 0
+
+    clock.now += 6
+    catalog_tabularium.apply_changes()
+    assert catalog_tabularium.change_low_water == 1
+    assert catalog_tabularium.changes_first_seen == {}
+
+
+def test_out_of_order_commit_within_settle_window(catalog_tabularium, clock):
+    mysqlmgr = catalog_tabularium.mysqlmgr
+    # Change 2 belongs to a transaction still open while 1 and 3 are committed
+    mysqlmgr.commit(change_id=1, plugin_id=1, name="plugin-1")
+    mysqlmgr.commit(change_id=3, plugin_id=3, name="plugin-3")
+    catalog_tabularium.apply_changes()
+    assert sorted(mysqlmgr.plugin_reads) == [1, 3]
+
+    clock.now += 5
+    mysqlmgr.commit(change_id=2, plugin_id=2, name="plugin-2")
+    catalog_tabularium.apply_changes()
+    assert sorted(mysqlmgr.plugin_reads) == [1, 2, 3]
+    assert catalog_tabularium.catalog.get(plugin_id=2)["plugin"]["name"] == "plugin-2"
+
+    # 3 settled before 2, the low water stops below 2 until it settles too
+    clock.now += 6
+    catalog_tabularium.apply_changes()
+    assert catalog_tabularium.change_low_water == 1
+    clock.now += 5
+    catalog_tabularium.apply_changes()
+    assert catalog_tabularium.change_low_water == 3
+    assert sorted(mysqlmgr.plugin_reads) == [1, 2, 3]
+
+
+def test_prune_watermark_past_low_water_forces_full_refresh(catalog_tabularium, clock):
+    mysqlmgr = catalog_tabularium.mysqlmgr
+    mysqlmgr.commit(change_id=1, plugin_id=1, name="plugin-1")
+    catalog_tabularium.apply_changes()
+    clock.now += 11
+    catalog_tabularium.apply_changes()
+    assert catalog_tabularium.change_low_water == 1
+
+    # Entries 2 to 4 were pruned before this worker read them
+    mysqlmgr.commit(change_id=4, plugin_id=2, name="plugin-2")
+    mysqlmgr.changes = [(5, 3)]
+    mysqlmgr.plugins[3] = "plugin-3"
+    mysqlmgr.pruned_through = 4
+    catalog_tabularium.apply_changes()
+
+    assert mysqlmgr.plugin_reads == [1, None]
+    assert catalog_tabularium.catalog.get(plugin_id=2) is not None
+    assert catalog_tabularium.catalog.get(plugin_id=3) is not None
+    assert catalog_tabularium.marathon.run_cache.clears == 1
+    assert catalog_tabularium.change_low_water == 4
+    assert list(catalog_tabularium.changes_first_seen) == [5]
+
+
+def test_prune_watermark_below_low_water_ignored(catalog_tabularium, clock):
+    mysqlmgr = catalog_tabularium.mysqlmgr
+    mysqlmgr.commit(change_id=1, plugin_id=1, name="plugin-1")
+    mysqlmgr.commit(change_id=2, plugin_id=2, name="plugin-2")
+    catalog_tabularium.apply_changes()
+    clock.now += 11
+    catalog_tabularium.apply_changes()
+
+    mysqlmgr.changes = [(2, 2)]
+    mysqlmgr.pruned_through = 1
+    catalog_tabularium.apply_changes()
+    assert None not in mysqlmgr.plugin_reads
+    assert catalog_tabularium.change_low_water == 2
+
+
+def test_too_many_changes_reload_whole_catalog(catalog_tabularium, clock):
+    mysqlmgr = catalog_tabularium.mysqlmgr
+    for plugin_id in (1, 2, 3):
+        mysqlmgr.commit(change_id=plugin_id, plugin_id=plugin_id, name=f"plugin-{plugin_id}")
+
+    catalog_tabularium.apply_changes()
+    assert mysqlmgr.plugin_reads == [None]
+    assert len(catalog_tabularium.catalog.to_dict()["plugins"]) == 3
+    assert catalog_tabularium.marathon.run_cache.clears == 1
+
+    # The entries were seen, re-reading them within the settle window reloads nothing
+    catalog_tabularium.apply_changes()
+    assert mysqlmgr.plugin_reads == [None]
+    clock.now += 11
+    catalog_tabularium.apply_changes()
+    assert catalog_tabularium.change_low_water == 3
@@ -0,0 +1,130 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import asyncio
+import pytest
+import requests
+from galeadispatcher import GaleaDispacher
+from circuitbreaker import CircuitOpenError
+
+
+class FakeResponse():
+    def __init__(self, status: int):
+        self.status_code = status
+        self.status = status
+        self.content = b'{"releases": []}'
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.HTTPError(f"HTTP {self.status}")
+
+
+class FakeSession():
+    """
+    Stands in for the requests session, answering with the given statuses or raising the given exceptions in turn.
+    """
+    def __init__(self, answers: list):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def request(self, **kwargs) -> FakeResponse:
+        self.calls += 1
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(status=answer)
+
+
+@pytest.fixture
+def dispatcher(monkeypatch) -> GaleaDispacher:
+    monkeypatch.setenv("GALEA_RETRIES", "2")
+    monkeypatch.setenv("GALEA_BACKOFF", "0")
+    monkeypatch.setenv("GALEA_BREAKER_THRESHOLD", "3")
+    return GaleaDispacher()
+
+
+def test_reads_retried_until_galea_answers(dispatcher):
+    dispatcher.session = FakeSession(answers=[requests.ConnectionError("refused"), 503, 200])
+
+    assert dispatcher.dispatch_read_all() == {"releases": []}
+    assert dispatcher.session.calls == 3
+    assert dispatcher.circuit_breaker.get_state()["failures"] == 0
+
+
+def test_last_error_raised(dispatcher):
+    dispatcher.session = FakeSession(answers=[503, 503, requests.Timeout("timed out")])
+
+    with pytest.raises(requests.Timeout):
+        dispatcher.dispatch_read_all()
+    dispatcher.session = FakeSession(answers=[502])
+    # The circuit opened after three failures in a row
+    with pytest.raises(CircuitOpenError):
+        dispatcher.dispatch_read_all()
+    assert dispatcher.session.calls == 0
+
+
+def test_installs_not_retried(dispatcher):
+    dispatcher.session = FakeSession(answers=[503, 201])
+
+    with pytest.raises(requests.HTTPError):
+        dispatcher.dispatch_install(release_name="plugin", repo_url="https://charts", version="1")
+    assert dispatcher.session.calls == 1
+
+
+def test_helm_failure_not_counted_against_galea(dispatcher):
+    dispatcher.session = FakeSession(answers=[500])
+
+    with pytest.raises(requests.HTTPError):
+        dispatcher.dispatch_read(release_name="plugin")
+    assert dispatcher.session.calls == 1
+    assert dispatcher.circuit_breaker.get_state()["failures"] == 0
+
+
+class FakeAsyncSession(FakeSession):
+    """
+    Stands in for the aiohttp session of AsyncGaleaDispacher.
+    """
+    def request(self, **kwargs):
+        session = self
+
+        class Request():
+            async def __aenter__(self):
+                response = FakeSession.request(session, **kwargs)
+                async def read():
+                    return response.content
+                response.read = read
+                return response
+
+            async def __aexit__(self, *exc_info):
+                return False
+        return Request()
+
+
+def test_async_dispatcher_shares_retries_and_breaker(dispatcher):
+    asyncgaleadispatcher = pytest.importorskip("asyncgaleadispatcher")
+    aiohttp = pytest.importorskip("aiohttp")
+    async_dispatcher = asyncgaleadispatcher.AsyncGaleaDispacher(dispatcher=dispatcher)
+    session = FakeAsyncSession(answers=[aiohttp.ClientConnectionError("refused"), 503, 200,
+                                        aiohttp.ClientConnectionError("refused"), 503, 503])
+    async_dispatcher.get_session = lambda: session
+
+    assert asyncio.run(async_dispatcher.dispatch_read_all()) == {"releases": []}
+    assert session.calls == 3
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(async_dispatcher.dispatch_read_all())
+    with pytest.raises(CircuitOpenError):
+        dispatcher.dispatch_read_all()
@@ -0,0 +1,106 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+import asyncio
+import pytest
+from marathon import Marathon
+
+
+class FakeResponse():
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+
+def answer_with(answers: dict):
+    """
+    Stands in for Marathon.post_plugin, answering each plugin with its (status code, body) or raising its exception.
+    """
+    def post_plugin(test_dict: dict, timeout: float = None, stream: bool = False) -> FakeResponse:
+        answer = answers[test_dict["test"]["plugin"]]
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(status_code=answer[0], content=answer[1](test_dict["test"]["prompt"]).encode("utf-8"))
+    return post_plugin
+
+
+def upper(prompt: str) -> str:
+    return prompt.upper()
+
+
+def reverse(prompt: str) -> str:
+    return prompt[::-1]
+
+
+@pytest.fixture
+def marathon() -> Marathon:
+    return Marathon()
+
+
+def test_pipeline_chains_outputs(marathon, monkeypatch):
+    monkeypatch.setattr(marathon, "post_plugin", answer_with({"upper": (200, upper), "reverse": (200, reverse)}))
+
+    pipeline_dict = marathon.run_pipeline(pipeline_dict={"pipeline": {"prompt": "abc", "plugins": ["upper", "reverse"]}})
+
+    assert pipeline_dict["pipeline"]["status"] == "succeeded"
+    assert pipeline_dict["pipeline"]["output"] == "CBA"
+    assert [stage["prompt"] for stage in pipeline_dict["pipeline"]["stages"]] == ["abc", "ABC"]
+    assert marathon.get_result(plugin="reverse")["result"]["output"] == "CBA"
+
+
+def test_pipeline_stops_at_blocking_stage(marathon, monkeypatch):
+    monkeypatch.setattr(marathon, "post_plugin", answer_with({"guard": (403, upper), "reverse": (200, reverse)}))
+
+    pipeline_dict = marathon.run_pipeline(pipeline_dict={"pipeline": {"prompt": "abc", "plugins": ["guard", "reverse"]}})
+
+    assert pipeline_dict["pipeline"]["status"] == "blocked"
+    assert pipeline_dict["pipeline"]["output"] is None
+    assert [stage["status"] for stage in pipeline_dict["pipeline"]["stages"]] == ["blocked"]
+    assert marathon.get_result(plugin="guard") == {}
+
+
+def test_pipeline_reports_failed_call(marathon, monkeypatch):
+    monkeypatch.setattr(marathon, "post_plugin", answer_with({"upper": (200, upper), "down": ConnectionError("refused")}))
+
+    pipeline_dict = marathon.run_pipeline(pipeline_dict={"pipeline": {"prompt": "abc", "plugins": ["upper", "down", "upper"]}})
+
+    assert pipeline_dict["pipeline"]["status"] == "failed"
+    assert [(stage["plugin"], stage["status"], stage["error"]) for stage in pipeline_dict["pipeline"]["stages"]] == \
+           [("upper", "succeeded", None), ("down", "failed", "refused")]
+
+
+def test_async_pipeline_matches(marathon, monkeypatch):
+    asyncmarathon = pytest.importorskip("asyncmarathon")
+    answers = {"upper": (200, upper), "guard": (500, reverse)}
+    monkeypatch.setattr(marathon, "post_plugin", answer_with(answers))
+    async_marathon = asyncmarathon.AsyncMarathon(marathon=marathon)
+
+    async def post_plugin(test_dict: dict, timeout: float = None) -> tuple:
+        response = marathon.post_plugin(test_dict=test_dict, timeout=timeout)
+        return response.status_code, response.content
+    monkeypatch.setattr(async_marathon, "post_plugin", post_plugin)
+
+    request_dict = {"pipeline": {"prompt": "abc", "plugins": ["upper", "guard"]}}
+    expected_dict = marathon.run_pipeline(pipeline_dict=request_dict)
+    pipeline_dict = asyncio.run(async_marathon.run_pipeline(pipeline_dict=request_dict))
+
+    for result_dict in (expected_dict, pipeline_dict):
+        for stage in result_dict["pipeline"]["stages"]:
+            stage.pop("latency"), stage.pop("id", None)
+        result_dict["pipeline"].pop("latency")
+    assert pipeline_dict == expected_dict
+    assert pipeline_dict["pipeline"]["stages"][-1]["error"] == "Plugin answered with status 500"
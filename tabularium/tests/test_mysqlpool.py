@@ -0,0 +1,262 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import threading
+import pytest
+from pymysql.err import OperationalError, ProgrammingError
+from mysqlpool import MySQLConnectionPool
+from mysqlmgr import is_connection_error, retried
+
+
+class FakeConnection():
+    """
+    Raw connection recording pings, rollbacks and closes, with a ping failing once the server dropped it.
+    """
+    def __init__(self, number: int):
+        self.number = number
+        self.dropped = False
+        self.pings = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def ping(self, reconnect: bool):
+        self.pings += 1
+        if self.dropped:
+            raise OperationalError(2006, "MySQL server has gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.dropped:
+            raise OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnector():
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self) -> FakeConnection:
+        self.connections.append(FakeConnection(number=len(self.connections)))
+        return self.connections[-1]
+
+
+@pytest.fixture
+def connector():
+    return FakeConnector()
+
+
+def make_pool(connector: FakeConnector, **kwargs) -> MySQLConnectionPool:
+    return MySQLConnectionPool(connect=connector, is_connection_error=is_connection_error, **kwargs)
+
+
+def test_idle_connections_reused_last_in_first_out(connector):
+    pool = make_pool(connector=connector)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(pooled_connection=first)
+    pool.release(pooled_connection=second)
+
+    assert pool.acquire() is second
+    assert pool.acquire() is first
+    assert len(connector.connections) == 2
+
+
+def test_checkout_bounded_and_times_out(connector):
+    pool = make_pool(connector=connector, max_size=1, timeout=0.05)
+    held = pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    assert pool.get_stats()["pool"]["timeouts"] == 1
+    assert pool.get_stats()["pool"]["in_use"] == 1
+
+    pool.release(pooled_connection=held)
+    assert pool.acquire() is held
+
+
+def test_waiter_gets_released_connection(connector):
+    pool = make_pool(connector=connector, max_size=1, timeout=5)
+    held = pool.acquire()
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+
+    pool.release(pooled_connection=held)
+    waiter.join(timeout=5)
+    assert acquired == [held]
+    assert len(connector.connections) == 1
+
+
+def test_idle_connection_evicted(connector):
+    pool = make_pool(connector=connector, max_idle_time=10)
+    pooled_connection = pool.acquire()
+    pool.release(pooled_connection=pooled_connection)
+    pooled_connection.last_used_at -= 11
+
+    assert pool.acquire() is not pooled_connection
+    assert connector.connections[0].closed
+    assert pool.get_stats()["pool"]["size"] == 1
+
+
+def test_connection_past_lifetime_recycled(connector):
+    pool = make_pool(connector=connector, max_lifetime=10)
+    pooled_connection = pool.acquire()
+    pooled_connection.created_at -= 11
+    pool.release(pooled_connection=pooled_connection)
+
+    assert connector.connections[0].closed
+    assert pool.get_stats()["pool"]["idle"] == 0
+    assert pool.get_stats()["pool"]["size"] == 0
+
+
+def test_evicted_connections_closed_outside_condition(connector):
+    pool = make_pool(connector=connector, max_idle_time=10)
+    pooled_connection = pool.acquire()
+    pool.release(pooled_connection=pooled_connection)
+    pooled_connection.last_used_at -= 11
+    condition_free = []
+
+    def close():
+        # Another thread must be able to take the condition while the socket closes
+        checker = threading.Thread(target=lambda: condition_free.append(pool.condition.acquire(timeout=1) and not pool.condition.release()))
+        checker.start()
+        checker.join()
+
+    pooled_connection.connection.close = close
+    pool.acquire()
+    assert condition_free == [True]
+
+
+def test_connection_pinged_after_health_check_interval(connector):
+    pool = make_pool(connector=connector, health_check_interval=30)
+    pooled_connection = pool.acquire()
+    pool.release(pooled_connection=pooled_connection)
+
+    # Recently used, handed out without a ping
+    assert pool.acquire() is pooled_connection
+    assert pooled_connection.connection.pings == 0
+    pool.release(pooled_connection=pooled_connection)
+
+    pooled_connection.last_used_at -= 31
+    assert pool.acquire() is pooled_connection
+    assert pooled_connection.connection.pings == 1
+
+
+def test_dropped_connection_replaced_on_checkout(connector):
+    pool = make_pool(connector=connector, health_check_interval=30)
+    pooled_connection = pool.acquire()
+    pool.release(pooled_connection=pooled_connection)
+    pooled_connection.last_used_at -= 31
+    pooled_connection.connection.dropped = True
+
+    replacement = pool.acquire()
+    assert replacement.connection is connector.connections[1]
+    assert connector.connections[0].closed
+    assert pool.get_stats()["pool"]["size"] == 1
+
+
+def test_connection_error_discards_connection_and_pings_idle_ones(connector):
+    pool = make_pool(connector=connector, health_check_interval=30)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(pooled_connection=second)
+    # Dropped by the same outage, although used too recently to be pinged otherwise
+    second.connection.dropped = True
+
+    with pytest.raises(OperationalError):
+        with pool.connection() as connection:
+            connection.dropped = True
+            raise OperationalError(2013, "Lost connection to MySQL server during query")
+    assert second.connection.closed
+    assert second.connection.rollbacks == 0
+    assert pool.get_stats()["pool"]["connection_errors"] == 1
+
+    pool.release(pooled_connection=first)
+    # Used after the error, not pinged again
+    assert pool.acquire() is first
+    assert first.connection.pings == 0
+    assert pool.acquire().connection is connector.connections[2]
+
+
+def test_query_error_keeps_connection(connector):
+    pool = make_pool(connector=connector)
+    with pytest.raises(ProgrammingError):
+        with pool.connection() as connection:
+            raise ProgrammingError(1064, "You have an error in your SQL syntax")
+
+    assert connection.rollbacks == 1
+    assert not connection.closed
+    assert pool.get_stats()["pool"]["idle"] == 1
+
+
+def test_failed_connect_frees_its_slot(connector):
+    def connect():
+        raise OperationalError(2003, "Can't connect to MySQL server")
+
+    pool = make_pool(connector=connect, max_size=1)
+    with pytest.raises(OperationalError):
+        pool.acquire()
+    assert pool.get_stats()["pool"]["size"] == 0
+    assert pool.get_stats()["pool"]["in_use"] == 0
+
+
+def test_reset_retires_connections(connector):
+    pool = make_pool(connector=connector)
+    idle, in_use = pool.acquire(), pool.acquire()
+    pool.release(pooled_connection=idle)
+    pool.reset()
+    assert idle.connection.closed
+
+    pool.release(pooled_connection=in_use)
+    assert in_use.connection.closed
+    assert pool.get_stats()["pool"]["size"] == 0
+
+
+class FakeManager():
+    def __init__(self, pool: MySQLConnectionPool):
+        self.pool = pool
+        self.calls = 0
+
+    @retried
+    def read(self, error: Exception = None):
+        self.calls += 1
+        with self.pool.connection() as connection:
+            if error is not None and self.calls == 1:
+                raise error
+            return connection.number
+
+
+def test_read_retried_once_on_live_connection(connector):
+    pool = make_pool(connector=connector, health_check_interval=30)
+    first, second = pool.acquire(), pool.acquire()
+    pool.release(pooled_connection=first)
+    pool.release(pooled_connection=second)
+    # Both dropped by a server restart, the read fails on the second and the retry pings the first
+    first.connection.dropped = second.connection.dropped = True
+    manager = FakeManager(pool=pool)
+
+    assert manager.read(error=OperationalError(2013, "Lost connection to MySQL server during query")) == 2
+    assert manager.calls == 2
+    assert first.connection.closed and second.connection.closed
+
+
+def test_query_error_not_retried(connector):
+    manager = FakeManager(pool=make_pool(connector=connector))
+    with pytest.raises(OperationalError):
+        manager.read(error=OperationalError(1205, "Lock wait timeout exceeded"))
+    assert manager.calls == 1
@@ -0,0 +1,178 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import time
+import asyncio
+import threading
+import pytest
+from operations import OperationTracker, OperationQueueFullError, succeeded, failed
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+class Recorder():
+    """
+    Operation function recording the order operations ran in and the most running at once per release.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+        self.running = {}
+        self.max_running = {}
+
+    def __call__(self, release_name: str, name: str, gate: threading.Event = None) -> dict:
+        with self.lock:
+            self.running[release_name] = self.running.get(release_name, 0) + 1
+            self.max_running[release_name] = max(self.max_running.get(release_name, 0), self.running[release_name])
+        if gate is not None:
+            gate.wait(timeout=5)
+        time.sleep(0.001)
+        with self.lock:
+            self.calls.append(name)
+            self.running[release_name] -= 1
+        return {"name": name}
+
+
+def submit(tracker: OperationTracker, recorder: Recorder, release_name: str, name: str, gate: threading.Event = None) -> dict:
+    return tracker.submit(kind="install", release_name=release_name, function=recorder,
+                          arguments={"release_name": release_name, "name": name, "gate": gate})
+
+
+def is_finished(tracker: OperationTracker, operation_dict: dict) -> bool:
+    return tracker.get_operation(operation_id=operation_dict["operation"]["id"])["operation"]["status"] in (succeeded, failed)
+
+
+def test_operations_on_a_release_run_in_order_one_at_a_time():
+    tracker = OperationTracker(max_workers=4)
+    recorder = Recorder()
+    gate = threading.Event()
+    operation_dicts = [submit(tracker=tracker, recorder=recorder, release_name="plugin", name="0", gate=gate)]
+    operation_dicts += [submit(tracker=tracker, recorder=recorder, release_name="plugin", name=str(index)) for index in range(1, 10)]
+    assert tracker.is_pending(release_name="plugin")
+
+    gate.set()
+    wait_for(lambda: all(is_finished(tracker=tracker, operation_dict=operation_dict) for operation_dict in operation_dicts))
+    assert recorder.calls == [str(index) for index in range(10)]
+    assert recorder.max_running["plugin"] == 1
+    wait_for(lambda: not tracker.is_pending(release_name="plugin"))
+
+
+def test_releases_run_concurrently():
+    tracker = OperationTracker(max_workers=4)
+    recorder = Recorder()
+    gate = threading.Event()
+    held = submit(tracker=tracker, recorder=recorder, release_name="plugin", name="held", gate=gate)
+    other = submit(tracker=tracker, recorder=recorder, release_name="other", name="other")
+
+    # Runs while the first release is held
+    wait_for(lambda: is_finished(tracker=tracker, operation_dict=other))
+    assert not is_finished(tracker=tracker, operation_dict=held)
+    gate.set()
+    wait_for(lambda: is_finished(tracker=tracker, operation_dict=held))
+
+
+def test_failure_recorded():
+    tracker = OperationTracker(max_workers=1)
+
+    def function():
+        raise ValueError("galea failed")
+
+    operation_dict = tracker.submit(kind="delete", release_name="plugin", function=function, arguments={})
+    wait_for(lambda: is_finished(tracker=tracker, operation_dict=operation_dict))
+    operation = tracker.get_operation(operation_id=operation_dict["operation"]["id"])["operation"]
+    assert operation["status"] == failed
+    assert operation["error"] == "galea failed"
+
+
+def test_oldest_finished_operations_forgotten_first():
+    tracker = OperationTracker(max_workers=2, max_operations=3)
+    recorder = Recorder()
+    gate = threading.Event()
+    held = submit(tracker=tracker, recorder=recorder, release_name="held", name="held", gate=gate)
+    finished = [submit(tracker=tracker, recorder=recorder, release_name="plugin", name=str(index)) for index in range(2)]
+    wait_for(lambda: all(is_finished(tracker=tracker, operation_dict=operation_dict) for operation_dict in finished))
+
+    latest = submit(tracker=tracker, recorder=recorder, release_name="plugin", name="latest")
+    ids = [operation_dict["operation"]["id"] for operation_dict in tracker.get_operations()["operations"]]
+    # The unfinished one is kept although older
+    assert ids == [held["operation"]["id"], finished[1]["operation"]["id"], latest["operation"]["id"]]
+    gate.set()
+
+
+def test_submissions_rejected_while_all_operations_unfinished():
+    tracker = OperationTracker(max_workers=2, max_operations=2)
+    recorder = Recorder()
+    gate = threading.Event()
+    held = [submit(tracker=tracker, recorder=recorder, release_name="plugin", name=str(index), gate=gate) for index in range(2)]
+
+    with pytest.raises(OperationQueueFullError):
+        tracker.check_capacity()
+    with pytest.raises(OperationQueueFullError):
+        submit(tracker=tracker, recorder=recorder, release_name="other", name="rejected")
+    assert len(tracker.get_operations()["operations"]) == 2
+
+    gate.set()
+    wait_for(lambda: all(is_finished(tracker=tracker, operation_dict=operation_dict) for operation_dict in held))
+    tracker.check_capacity()
+    accepted = submit(tracker=tracker, recorder=recorder, release_name="other", name="accepted")
+    wait_for(lambda: is_finished(tracker=tracker, operation_dict=accepted))
+    assert "rejected" not in recorder.calls
+
+
+def test_operations_run_on_loop():
+    tracker = OperationTracker(max_workers=1)
+    calls = []
+    running = {}
+    most_running = {"all": 0}
+
+    async def function(release_name: str, name: str) -> dict:
+        running[release_name] = running.get(release_name, 0) + 1
+        most_running[release_name] = max(most_running.get(release_name, 0), running[release_name])
+        most_running["all"] = max(most_running["all"], sum(running.values()))
+        await asyncio.sleep(0.01)
+        running[release_name] -= 1
+        calls.append(name)
+        return {"name": name}
+
+    def submit_all() -> list:
+        return [tracker.submit(kind="install", release_name=release_name, function=function,
+                               arguments={"release_name": release_name, "name": f"{release_name}-{index}"})
+                for index in range(3) for release_name in ("plugin", "other")]
+
+    async def main() -> list:
+        tracker.run_on_loop(loop=asyncio.get_running_loop())
+        # Submitted from another thread, as the blocking Tabularium calls of asgiserver.py are
+        operation_dicts = await asyncio.get_running_loop().run_in_executor(None, submit_all)
+        deadline = time.monotonic() + 5
+        while not all(is_finished(tracker=tracker, operation_dict=operation_dict) for operation_dict in operation_dicts):
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.005)
+        return operation_dicts
+
+    operation_dicts = asyncio.run(main())
+
+    assert [name for name in calls if name.startswith("plugin")] == ["plugin-0", "plugin-1", "plugin-2"]
+    assert [name for name in calls if name.startswith("other")] == ["other-0", "other-1", "other-2"]
+    # One at a time per release, both releases at once although the tracker has a single worker
+    assert most_running == {"plugin": 1, "other": 1, "all": 2}
+    assert tracker.get_operation(operation_id=operation_dicts[0]["operation"]["id"])["operation"]["result"] == {"name": "plugin-0"}
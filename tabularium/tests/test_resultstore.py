@@ -0,0 +1,107 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import json
+import pytest
+import resultstore
+from resultstore import ResultStore, estimate_size
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_result_dict(plugin: str, output: str = "output") -> dict:
+    return {"result": {"plugin": plugin, "prompt": "hi", "parameters": {"temperature": 0.5, "stream": False}, "output": output}}
+
+
+def stored_bytes(store: ResultStore) -> int:
+    return sum(estimate_size(value=result_dict) for result_dict, _, _ in store.results_by_id.values())
+
+
+@pytest.mark.parametrize("value", ["plain", "naïve – ünïcode ✓", {"a": [1, 2.5, None, True]}, [], {},
+                                   make_result_dict(plugin="plugin", output="x" * 100)])
+def test_estimate_size_close_to_json(value):
+    # Separators are counted once per item, escapes are ignored
+    size = len(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    assert size <= estimate_size(value=value) <= size * 1.05 + 2
+
+
+def test_oldest_results_evicted_first():
+    store = ResultStore(max_results=3)
+    run_ids = [store.add(result_dict=make_result_dict(plugin=f"plugin-{index % 2}")) for index in range(5)]
+
+    assert list(store.results_by_id) == run_ids[2:]
+    assert store.get(run_id=run_ids[1]) is None
+    assert [result_dict["result"]["id"] for result_dict in store.get_history(plugin="plugin-0")] == [run_ids[2], run_ids[4]]
+    assert [result_dict["result"]["id"] for result_dict in store.get_history(plugin="plugin-1")] == [run_ids[3]]
+    assert store.get_stats()["results"]["evictions"] == 2
+
+
+def test_results_evicted_by_size_with_bytes_accounted():
+    size = estimate_size(value=dict(make_result_dict(plugin="plugin"), result=dict(make_result_dict(plugin="plugin")["result"], id="0" * 32)))
+    store = ResultStore(max_bytes=size * 2)
+    run_ids = [store.add(result_dict=make_result_dict(plugin="plugin")) for _ in range(3)]
+
+    assert list(store.results_by_id) == run_ids[1:]
+    assert store.total_bytes == stored_bytes(store=store) == size * 2
+
+    store.add(result_dict=make_result_dict(plugin="others"))
+    store.remove_plugin(plugin="plugin")
+    assert list(store.run_ids_by_plugin) == ["others"]
+    assert store.total_bytes == stored_bytes(store=store) == size
+
+
+def test_latest_result_replaces_previous_one_of_plugin():
+    store = ResultStore()
+    store.add(result_dict=make_result_dict(plugin="plugin", output="first"))
+    store.add(result_dict=make_result_dict(plugin="plugin", output="second, and longer"))
+
+    assert store.get_latest(plugin="plugin")["result"]["output"] == "second, and longer"
+    assert [result_dict["result"]["output"] for result_dict in store.get_latest_per_plugin()] == ["second, and longer"]
+    assert store.total_bytes == stored_bytes(store=store)
+
+
+def test_result_larger_than_budget_not_stored():
+    store = ResultStore(max_bytes=1000)
+    kept = store.add(result_dict=make_result_dict(plugin="plugin"))
+    oversized = store.add(result_dict=make_result_dict(plugin="plugin", output="x" * 1000))
+
+    assert store.get(run_id=oversized) is None
+    assert store.get(run_id=kept) is not None
+    assert store.total_bytes == stored_bytes(store=store)
+    assert store.get_stats()["results"]["oversized"] == 1
+    assert store.get_stats()["results"]["evictions"] == 0
+
+
+def test_results_expire_after_max_age(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resultstore, "time", clock)
+    store = ResultStore(max_age=60)
+    old = store.add(result_dict=make_result_dict(plugin="plugin"))
+    clock.now += 30
+    recent = store.add(result_dict=make_result_dict(plugin="plugin"))
+
+    clock.now += 31
+    assert store.get(run_id=old) is None
+    assert store.get_latest(plugin="plugin")["result"]["id"] == recent
+    assert store.total_bytes == stored_bytes(store=store)
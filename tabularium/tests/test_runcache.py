@@ -0,0 +1,133 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import pytest
+import runcache
+from runcache import RunCache
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(runcache, "time", clock)
+    return clock
+
+
+def put(cache: RunCache, plugin: str, prompt: str, generation: tuple = None) -> str:
+    """
+    Caches a run of plugin on prompt, with the generation read when the run started, and returns its key.
+    """
+    key = cache.make_key(plugin=plugin, version="1.0.0", prompt=prompt, parameters={})
+    if generation is None:
+        generation = cache.get_generation(plugin=plugin)
+    cache.put(key=key, plugin=plugin, result_dict={"result": {"plugin": plugin, "output": prompt}}, generation=generation)
+    return key
+
+
+def test_key_covers_version_and_parameters(clock):
+    cache = RunCache(max_entries=10, ttl=60)
+    key = cache.make_key(plugin="plugin", version="1.0.0", prompt="hi", parameters={"a": 1, "b": 2})
+
+    assert key == cache.make_key(plugin="plugin", version="1.0.0", prompt="hi", parameters={"b": 2, "a": 1})
+    assert key != cache.make_key(plugin="plugin", version="1.0.1", prompt="hi", parameters={"a": 1, "b": 2})
+    assert key != cache.make_key(plugin="plugin", version="1.0.0", prompt="hi", parameters={"a": 1})
+
+
+def test_invalidation_during_run_drops_its_result(clock):
+    cache = RunCache(max_entries=10, ttl=60)
+    generation = cache.get_generation(plugin="plugin")
+    other_generation = cache.get_generation(plugin="other")
+    # The plugin changes while its run is in flight
+    cache.invalidate(plugin="plugin")
+
+    key = put(cache=cache, plugin="plugin", prompt="hi", generation=generation)
+    other_key = put(cache=cache, plugin="other", prompt="hi", generation=other_generation)
+    assert cache.get(key=key) is None
+    assert cache.get(key=other_key) is not None
+
+    # Runs started after the invalidation are cached again
+    key = put(cache=cache, plugin="plugin", prompt="hi")
+    assert cache.get(key=key) is not None
+
+
+def test_clear_during_run_drops_its_result(clock):
+    cache = RunCache(max_entries=10, ttl=60)
+    generation = cache.get_generation(plugin="plugin")
+    cache.clear()
+
+    assert cache.get(key=put(cache=cache, plugin="plugin", prompt="hi", generation=generation)) is None
+    assert cache.get(key=put(cache=cache, plugin="plugin", prompt="hi")) is not None
+
+
+def test_invalidate_drops_cached_results_of_plugin_only(clock):
+    cache = RunCache(max_entries=10, ttl=60)
+    keys = [put(cache=cache, plugin="plugin", prompt=prompt) for prompt in ("a", "b")]
+    other_key = put(cache=cache, plugin="other", prompt="a")
+
+    cache.invalidate(plugin="plugin")
+    assert [cache.get(key=key) for key in keys] == [None, None]
+    assert cache.get(key=other_key) is not None
+    assert list(cache.keys_by_plugin) == ["other"]
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = RunCache(max_entries=10, ttl=60)
+    key = put(cache=cache, plugin="plugin", prompt="hi")
+
+    clock.now += 59
+    assert cache.get(key=key) is not None
+    clock.now += 1
+    assert cache.get(key=key) is None
+    assert cache.entries == {} and cache.keys_by_plugin == {}
+    assert cache.get_stats()["run_cache"]["hits"] == 1
+    assert cache.get_stats()["run_cache"]["misses"] == 1
+
+
+def test_least_recently_used_evicted(clock):
+    cache = RunCache(max_entries=2, ttl=60)
+    first = put(cache=cache, plugin="plugin", prompt="first")
+    second = put(cache=cache, plugin="plugin", prompt="second")
+    # Reading the first one makes the second the least recently used
+    assert cache.get(key=first) is not None
+
+    third = put(cache=cache, plugin="other", prompt="third")
+    assert cache.get(key=second) is None
+    assert cache.get(key=first) is not None
+    assert cache.get(key=third) is not None
+    assert len(cache.entries) == 2
+    assert cache.keys_by_plugin == {"plugin": {first}, "other": {third}}
+    assert cache.get_stats()["run_cache"]["evictions"] == 1
+
+
+def test_put_replaces_entry_and_renews_ttl(clock):
+    cache = RunCache(max_entries=2, ttl=60)
+    key = put(cache=cache, plugin="plugin", prompt="hi")
+    clock.now += 50
+    put(cache=cache, plugin="plugin", prompt="hi")
+
+    clock.now += 50
+    assert cache.get(key=key) is not None
+    assert len(cache.entries) == 1
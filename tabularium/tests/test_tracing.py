@@ -0,0 +1,32 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+
+import pytest
+from tracing import is_traced_route
+
+
+@pytest.mark.parametrize("route", ["/ready", "/metrics", "/traces", "/traces/<string:trace_id>", "/stats/tracing"])
+def test_probes_and_trace_reads_not_traced(route):
+    assert not is_traced_route(route=route)
+
+
+# Rules as registered by tabularium/apiserver.py and galea/apiserver.py
+@pytest.mark.parametrize("route", ["/plugins", "/plugins/<int:plugin_id>", "/run", "/stats/galea",
+                                   "/releases", "/releases/<string:release>", "/releases:batch", "<unmatched>"])
+def test_requests_traced(route):
+    assert is_traced_route(route=route)
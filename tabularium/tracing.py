@@ -0,0 +1,438 @@
+# Copyright 2024 Cisco Systems, Inc. and its affiliates
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: Apache-2.0
+
+
+# Shared by Tabularium and Galea, galea/Dockerfile copies this module into the Galea image
+
+import os
+import re
+import time
+import queue
+import random
+import cProfile
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict
+from typing import Iterator, Union
+
+import requests
+
+
+internal = "internal"
+server = "server"
+client = "client"
+
+# OTLP SpanKind values
+otlp_kinds = {internal: 1, server: 2, client: 3}
+traceparent_pattern = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Probes, scrapes and trace reads, which would otherwise push the traces of actual requests out of the buffer
+untraced_route_prefixes = ("/ready", "/metrics", "/traces", "/stats/tracing")
+
+
+def new_id(bits: int) -> str:
+    return "%0*x" % (bits // 4, random.getrandbits(bits))
+
+
+def is_traced_route(route: str) -> bool:
+    return not route.startswith(untraced_route_prefixes)
+
+
+def parse_traceparent(traceparent: Union[str, None]) -> Union[tuple, None]:
+    """
+    Returns the (trace id, parent span id, sampled) of a W3C traceparent header, or None if it is missing or invalid.
+    """
+    if not traceparent:
+        return None
+    match = traceparent_pattern.match(traceparent.strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Trace():
+    """
+    Spans of a trace recorded by this service, appended as they finish.
+    """
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+
+
+class Span():
+    """
+    Timed operation of a trace. Unsampled spans are not recorded but still propagate their ids.
+    """
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes", "sampled", "start_time", "started_at",
+                 "duration", "error", "token")
+
+    def __init__(self, trace: Trace, parent_id: Union[str, None], name: str, kind: str, attributes: dict, sampled: bool):
+        self.trace = trace
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes if attributes is not None else {}
+        self.sampled = sampled
+        self.start_time = time.time_ns()
+        self.started_at = time.perf_counter()
+        self.duration = None
+        self.error = None
+        self.token = None
+
+    def get_traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return  {
+                    "span_id": self.span_id,
+                    "parent_id": self.parent_id,
+                    "name": self.name,
+                    "kind": self.kind,
+                    "start_time": self.start_time / 1e9,
+                    "duration": self.duration,
+                    "attributes": self.attributes,
+                    "error": self.error
+                }
+
+
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def get_traceparent() -> Union[str, None]:
+    """
+    Returns the traceparent header propagating the current span, or None outside of a trace.
+    """
+    span = current_span.get()
+    return span.get_traceparent() if span is not None else None
+
+
+def make_otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer():
+    """
+    Records span trees of the requests this service handles.
+
+    A request continues the trace of its W3C traceparent header, or starts a new one sampled with
+    probability sample_rate. Spans are only opened within a request, so background work is not
+    traced. The max_traces most recent sampled traces are kept in memory, and finished spans are
+    pushed to an OTLP/HTTP collector in batches when otlp_endpoint is set.
+
+    Parameters:
+        service (str): Service name of the exported spans
+        max_traces (int): Number of recent traces kept in memory
+        sample_rate (float): Probability of recording a trace started here
+        otlp_endpoint (str): Base url of an OTLP/HTTP collector, e.g. http://localhost:4318, empty to disable export
+        export_interval (float): Seconds between exports to the collector
+    """
+    def __init__(self, service: str, max_traces: int = 1000, sample_rate: float = 0.1, otlp_endpoint: str = "",
+                 export_interval: float = 1.0):
+        self.service = service
+        self.max_traces = max_traces
+        self.sample_rate = sample_rate
+        self.otlp_endpoint = otlp_endpoint.rstrip("/")
+        self.export_interval = export_interval
+        self.lock = threading.Lock()
+        # trace id -> Trace, oldest first
+        self.traces = OrderedDict()
+        self.exported = 0
+        self.dropped = 0
+
+        self.export_queue = None
+        if self.otlp_endpoint:
+            self.export_queue = queue.Queue(maxsize=int(os.getenv("OTEL_EXPORT_QUEUE_SIZE", "10000")))
+            threading.Thread(target=self.export, name="otlp-exporter", daemon=True).start()
+
+
+    def start_request(self, name: str, traceparent: str = None, attributes: dict = None) -> Span:
+        """
+        Opens the server span of a request, continuing the caller's trace if traceparent is valid.
+        """
+        parsed = parse_traceparent(traceparent)
+        if parsed is not None:
+            trace_id, parent_id, sampled = parsed
+        else:
+            trace_id, parent_id, sampled = new_id(128), None, random.random() < self.sample_rate
+
+        trace = None
+        if sampled and self.max_traces > 0:
+            with self.lock:
+                # The same trace may come back, e.g. through a retried call
+                trace = self.traces.pop(trace_id, None) or Trace(trace_id=trace_id)
+                self.traces[trace_id] = trace
+                while len(self.traces) > self.max_traces:
+                    self.traces.popitem(last=False)
+        if trace is None:
+            trace, sampled = Trace(trace_id=trace_id), False
+
+        span = Span(trace=trace, parent_id=parent_id, name=name, kind=server, attributes=attributes, sampled=sampled)
+        current_span.set(span)
+        return span
+
+
+    def finish_request(self, span: Span, status: int):
+        span.attributes["http.status_code"] = status
+        self.record(span=span, error=f"HTTP {status}" if status >= 500 else None)
+        current_span.set(None)
+
+
+    def start_span(self, name: str, kind: str = internal, attributes: dict = None) -> Union[Span, None]:
+        """
+        Opens a child of the current span, or returns None outside of a trace.
+        """
+        parent = current_span.get()
+        if parent is None:
+            return None
+        span = Span(trace=parent.trace, parent_id=parent.span_id, name=name, kind=kind, attributes=attributes,
+                    sampled=parent.sampled)
+        span.token = current_span.set(span)
+        return span
+
+
+    def finish_span(self, span: Span, error: str = None):
+        current_span.reset(span.token)
+        self.record(span=span, error=error)
+
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = internal, attributes: dict = None) -> Iterator[Union[Span, None]]:
+        """
+        Context manager around start_span and finish_span, recording the exception raised if any.
+        """
+        span = self.start_span(name=name, kind=kind, attributes=attributes)
+        if span is None:
+            yield None
+            return
+        try:
+            yield span
+        except BaseException as e:
+            self.finish_span(span=span, error=str(e) or type(e).__name__)
+            raise
+        self.finish_span(span=span)
+
+
+    def record(self, span: Span, error: str = None):
+        span.duration = time.perf_counter() - span.started_at
+        span.error = error
+        if not span.sampled:
+            return
+        span.trace.spans.append(span)
+        if self.export_queue is not None:
+            try:
+                self.export_queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+
+    def get_trace(self, trace_id: str) -> Union[dict, None]:
+        """
+        Returns a recent trace as span trees, children ordered by start time, or None if it is unknown.
+        """
+        with self.lock:
+            trace = self.traces.get(trace_id)
+        if trace is None:
+            return None
+
+        spans = list(trace.spans)
+        span_dicts = {span.span_id: dict(span.to_dict(), children=[]) for span in sorted(spans, key=lambda span: span.start_time)}
+        roots = []
+        for span_dict in span_dicts.values():
+            parent_dict = span_dicts.get(span_dict["parent_id"])
+            (parent_dict["children"] if parent_dict is not None else roots).append(span_dict)
+
+        return  {
+                    "trace":
+                        {
+                            "id": trace_id,
+                            "service": self.service,
+                            "spans": roots
+                        }
+                }
+
+
+    def get_traces(self, limit: int = 100, min_duration: float = 0) -> dict:
+        """
+        Returns summaries of the most recent traces whose request took at least min_duration seconds, newest first.
+        """
+        with self.lock:
+            traces = list(reversed(self.traces.values()))
+
+        traces_list = []
+        for trace in traces:
+            requests_list = [span for span in list(trace.spans) if span.kind == server]
+            if not requests_list or max(span.duration for span in requests_list) < min_duration:
+                continue
+            traces_list.append({"id": trace.trace_id,
+                                "name": requests_list[0].name,
+                                "start_time": requests_list[0].start_time / 1e9,
+                                "duration": max(span.duration for span in requests_list),
+                                "spans": len(trace.spans)})
+            if len(traces_list) >= limit:
+                break
+
+        return  {
+                    "traces": traces_list
+                }
+
+
+    def make_otlp(self, spans: list) -> dict:
+        """
+        Returns spans as an OTLP/JSON ExportTraceServiceRequest.
+        """
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {"traceId": span.trace.trace_id,
+                         "spanId": span.span_id,
+                         "name": span.name,
+                         "kind": otlp_kinds[span.kind],
+                         "startTimeUnixNano": str(span.start_time),
+                         "endTimeUnixNano": str(span.start_time + int(span.duration * 1e9)),
+                         "attributes": [{"key": key, "value": make_otlp_value(value)} for key, value in span.attributes.items()],
+                         "status": {"code": 2, "message": span.error} if span.error is not None else {"code": 0}}
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+
+        return  {
+                    "resourceSpans":
+                        [
+                            {
+                                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+                                "scopeSpans": [{"scope": {"name": self.service}, "spans": otlp_spans}]
+                            }
+                        ]
+                }
+
+
+    def get_otlp_trace(self, trace_id: str) -> Union[dict, None]:
+        with self.lock:
+            trace = self.traces.get(trace_id)
+        return self.make_otlp(spans=list(trace.spans)) if trace is not None else None
+
+
+    def export(self):
+        """
+        Pushes finished spans to the collector every export_interval seconds.
+        """
+        session = requests.Session()
+        while True:
+            spans = [self.export_queue.get()]
+            time.sleep(self.export_interval)
+            while True:
+                try:
+                    spans.append(self.export_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                session.post(f"{self.otlp_endpoint}/v1/traces", json=self.make_otlp(spans=spans), timeout=10).raise_for_status()
+                self.exported += len(spans)
+            except requests.RequestException as e:
+                print("Exception:", e, str(e))
+                self.dropped += len(spans)
+
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return  {
+                        "tracing":
+                            {
+                                "traces": len(self.traces),
+                                "max_traces": self.max_traces,
+                                "sample_rate": self.sample_rate,
+                                "otlp_endpoint": self.otlp_endpoint,
+                                "exported": self.exported,
+                                "dropped": self.dropped
+                            }
+                    }
+
+
+class SlowRequestProfiler():
+    """
+    Opt-in cProfile of a sample of requests, dumped to a .prof file (pstats format, viewable as a
+    flamegraph with e.g. snakeviz or flameprof) when the request took at least threshold seconds.
+    The oldest dumps beyond max_files are removed.
+
+    Parameters:
+        threshold (float): Seconds from which a profiled request is dumped
+        sample_rate (float): Probability of profiling a request
+        directory (str): Directory profiles are dumped in
+        max_files (int): Number of profiles kept
+    """
+    def __init__(self, threshold: float, sample_rate: float, directory: str, max_files: int = 100):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.dumps = 0
+        os.makedirs(directory, exist_ok=True)
+
+
+    def start(self) -> Union[cProfile.Profile, None]:
+        if random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows a single active profiler, another request is being profiled
+            return None
+        return profile
+
+
+    def finish(self, profile: cProfile.Profile, seconds: float, name: str, trace_id: str) -> Union[str, None]:
+        """
+        Stops profiling and returns the path of the dumped profile, or None if the request was fast enough.
+        """
+        profile.disable()
+        if seconds < self.threshold:
+            return None
+
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{trace_id}-{slug}.prof")
+        profile.dump_stats(path)
+        with self.lock:
+            self.dumps += 1
+            paths = sorted(os.path.join(self.directory, file_name) for file_name in os.listdir(self.directory)
+                           if file_name.endswith(".prof"))
+            for old_path in paths[:-self.max_files]:
+                os.remove(old_path)
+
+        return path
+
+
+# Named by each service's image, OpenTelemetry's default name otherwise
+tracer = Tracer(service=os.getenv("OTEL_SERVICE_NAME", "unknown_service"),
+                max_traces=int(os.getenv("TRACE_BUFFER_SIZE", "1000")),
+                sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.1")),
+                otlp_endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", ""),
+                export_interval=float(os.getenv("OTEL_EXPORT_INTERVAL", "1")))
+
+profiler = None
+if float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0")) > 0:
+    profiler = SlowRequestProfiler(threshold=float(os.getenv("PROFILE_SLOW_REQUEST_MS")) / 1000,
+                                   sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.1")),
+                                   directory=os.getenv("PROFILE_DIR", "/tmp/tabularium/profiles"),
+                                   max_files=int(os.getenv("PROFILE_MAX_FILES", "100")))